@@ -1,9 +1,38 @@
-from .agency import Agency
-from .agents import Agent
-from .tools import BaseTool
-from .util import set_openai_key
-from .util import set_openai_client
-from .util import get_openai_client
-from .util import setup_logging
-from .util import set_openai_base_url
-from .util.streaming import AgencyEventHandler
+import importlib
+from typing import TYPE_CHECKING
+
+# PEP 562: the public API is imported on its first use, so `import agency_swarm` (the CLI, the tool worker
+# processes) does not pay for openai, instructor, rich...
+_exports = {
+    "Agency": ".agency",
+    "Agent": ".agents",
+    "BaseTool": ".tools",
+    "set_openai_key": ".util",
+    "set_openai_client": ".util",
+    "get_openai_client": ".util",
+    "setup_logging": ".util",
+    "set_openai_base_url": ".util",
+    "AgencyEventHandler": ".util.streaming",
+    "LeanEventHandler": ".util.streaming",
+}
+
+__all__ = list(_exports)
+
+if TYPE_CHECKING:
+    from .agency import Agency
+    from .agents import Agent
+    from .tools import BaseTool
+    from .util import set_openai_key, set_openai_client, get_openai_client, setup_logging, set_openai_base_url
+    from .util.streaming import AgencyEventHandler, LeanEventHandler
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1 +1,3 @@
-from .agency import Agency
\ No newline at end of file
+from .agency import Agency
+from .batch import BatchResult, BatchCheckpoint
+from .offline_batch import OfflineBatchRunner
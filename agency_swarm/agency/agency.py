@@ -1,33 +1,36 @@
 import inspect
 import json
 import os
-import queue
 import threading
 import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from enum import Enum
-from typing import List, Type, TypedDict, Callable, Any, Dict, Literal, Union
+from typing import Iterable, Iterator, List, Type, TypedDict, Callable, Any, ClassVar, Dict, Literal, Optional, Union
 
 from openai.types.beta.threads.runs import RunStep
 from pydantic import Field, field_validator, model_validator
-from rich.console import Console
 from typing_extensions import override
 from openai.types.beta.threads import Message
 
+from agency_swarm.agency.batch import BatchCheckpoint, BatchResult
+from agency_swarm.agency.offline_batch import OfflineBatchRunner
 from agency_swarm.agents import Agent
-from agency_swarm.sessions import Session
+from agency_swarm.sessions import Session, ChatCompletionSession
 from agency_swarm.messages import MessageOutput
-from agency_swarm.messages.message_output import MessageOutput
+from agency_swarm.messages.message_output import MessageOutput, get_console
 from agency_swarm.threads import Thread
 from agency_swarm.tools import BaseTool
 from agency_swarm.user import User
 
-from agency_swarm.util.streaming import AgencyEventHandler
+from agency_swarm.util.streaming import AgencyEventHandler, LeanEventHandler
+from agency_swarm.util.cancellation import CancellationToken, RequestCancelled
+from agency_swarm.util.coalescing import DeltaCoalescer
+from agency_swarm.util.deadline import Deadline
+from agency_swarm.util.response_cache import ResponseCache
 from agency_swarm.util.log_config import setup_logging 
 
 logger = setup_logging()
 
-console = Console()
-
 
 class SettingsCallbacks(TypedDict):
     load: Callable[[], List[Dict]]
@@ -44,7 +47,8 @@ class Agency:
     def __init__(self, 
                  agency_chart, 
                  shared_instructions="", 
-                 shared_files=None
+                 shared_files=None,
+                 engine: Literal["assistants", "chat_completions"] = "assistants"
                  ):
         """
         Initializes the Agency object, setting up agents, sessions, and core functionalities.
@@ -52,9 +56,15 @@ class Agency:
         Parameters:
         agency_chart: The structure defining the hierarchy and interaction of agents within the agency.
         shared_instructions (str, optional): A path to a file containing shared instructions for all agents. Defaults to an empty string.
+        engine (Literal["assistants", "chat_completions"], optional): How agents are driven. "assistants" uses Assistants API threads and runs. "chat_completions" keeps threads locally and drives agents with streaming chat completions (see ChatCompletionSession); no assistants are created and file search / code interpreter are not available. Defaults to "assistants".
 
         This constructor initializes various components of the Agency, including CEO, agents, sessions, and user interactions. It parses the agency chart to set up the organizational structure and initializes the messaging tools, agents, and sessions necessary for the operation of the agency. Additionally, it prepares a user entrance session for user interactions.
         """
+        if engine == "chat_completions":
+            self.SessionType = ChatCompletionSession
+        elif engine != "assistants":
+            raise Exception(f"Invalid engine: {engine}. Must be 'assistants' or 'chat_completions'.")
+
         self.ceo = None
         self.agents:list[Agent] = []
         self.agents_and_sessions = {}
@@ -73,12 +83,28 @@ class Agency:
         #self._init_sessions() // No need to init sessions, cuz it is created dynamically in tasks. 
 
         self.user = User()
-        self.entrance_session = Session(self.user, self.ceo)
+        self.entrance_session = self.create_entrance_session(self.user)
+
+    def create_entrance_session(self, user: User = None) -> Session:
+        """
+        Creates an entrance session from a user to the CEO. Threads are routed per user, so the conversations of
+        different users never share a thread.
+
+        Parameters:
+        user (User, optional): The user of the session. Defaults to a new User.
+
+        Returns:
+        Session: A session of the agency's engine.
+        """
+        return self.SessionType(user or User(), self.ceo)
 
     def get_completion(self, message: str, 
                        message_files=None, 
                        attachments: List[dict] = None,
-                       yield_messages=True):
+                       yield_messages=True,
+                       timeout: float = None,
+                       cancel_token: CancellationToken = None,
+                       session: Session = None):
         """
         Retrieves the completion for a given message from the user entrance session.
 
@@ -86,15 +112,22 @@ class Agency:
         message (str): The message for which completion is to be retrieved.
         message_files (list, optional): A list of file ids to be sent as attachments with the message. Defaults to None.
         yield_messages (bool, optional): Flag to determine if intermediate messages should be yielded. Defaults to True.
+        timeout (float, optional): Time budget of the request in seconds. It is propagated down every SendMessage hop, runs that exceed it are cancelled and their partial results are returned to the caller. Defaults to None (no budget).
+        cancel_token (CancellationToken, optional): Token to cancel the request from another thread. Cancelling it cancels every active run of the request tree, releases the threads and raises RequestCancelled. Defaults to a new token per request, which is cancelled when the returned generator is closed before it finishes.
+        session (Session, optional): Entrance session of another user, see create_entrance_session. Defaults to the agency's entrance session.
 
         Returns:
         Generator or final response: Depending on the 'yield_messages' flag, this method returns either a generator yielding intermediate messages or the final response from the entrance session.
         """
-        gen = self.entrance_session.get_completion(message=message, 
-                                                   message_files=message_files, 
-                                                   attachments=attachments, 
-                                                   is_persist=True, 
-                                                   yield_messages=yield_messages)
+        cancel_token = cancel_token or CancellationToken()
+        session = session or self.entrance_session
+        gen = session.get_completion(message=message, 
+                                     message_files=message_files, 
+                                     attachments=attachments, 
+                                     is_persist=True, 
+                                     yield_messages=yield_messages,
+                                     deadline=Deadline(timeout) if timeout else None,
+                                     cancel_token=cancel_token)
         if not yield_messages:
             while True:
                 try:
@@ -102,34 +135,63 @@ class Agency:
                 except StopIteration as e:
                     return e.value
 
-        return gen
+        return self._cancel_on_close(gen, cancel_token)
+
+    @staticmethod
+    def _cancel_on_close(gen, cancel_token: CancellationToken):
+        """
+        Yields from gen. If the caller abandons the generator (closes it before it is exhausted), the request is
+        cancelled before gen is closed, so the runs of the request tree are cancelled while their sessions still own them.
+        """
+        while True:
+            try:
+                item = next(gen)
+            except StopIteration as e:
+                return e.value
+            try:
+                yield item
+            except GeneratorExit:
+                cancel_token.cancel()
+                gen.close()
+                raise
 
     def get_completion_stream(self, 
                               message: str, 
                              event_handler: type(AgencyEventHandler),
                              message_files: List[str],
                              recipient_agent: Agent=None,
-                             attachments: List[dict] = None):
+                             attachments: List[dict] = None,
+                             timeout: float = None,
+                             cancel_token: CancellationToken = None,
+                             session: Session = None):
         """
         Generates a stream of completions for a given message from the main thread.
 
         Parameters:
             message (str): The message for which completion is to be retrieved.
-            event_handler (type(AgencyEventHandler)): The event handler class to handle the completion stream. https://github.com/openai/openai-python/blob/main/helpers.md
+            event_handler (type(AgencyEventHandler)): The event handler class to handle the completion stream. https://github.com/openai/openai-python/blob/main/helpers.md The class is not modified, the request works with `event_handler.for_request()` unless the class already has a StreamContext (i.e. it was created with for_request by the caller, to read the request's context afterwards).
             message_files (list, optional): A list of file ids to be sent as attachments with the message. When using this parameter, files will be assigned both to file_search and code_interpreter tools if available. It is recommended to assign files to the most sutiable tool manually, using the attachments parameter.  Defaults to None.
+            timeout (float, optional): Time budget of the request in seconds, see get_completion. Defaults to None.
+            cancel_token (CancellationToken, optional): Token to cancel the request from another thread, see get_completion. Defaults to None.
+            session (Session, optional): Entrance session of another user, see create_entrance_session. Defaults to the agency's entrance session.
         Returns:
             Final response: Final response from the main thread.
         """
         if not inspect.isclass(event_handler):
             raise Exception("Event handler must not be an instance.")
-        
-        res = self.entrance_session.get_completion_stream(
+        if event_handler.context is None:
+            event_handler = event_handler.for_request()
+
+        session = session or self.entrance_session
+        res = session.get_completion_stream(
             message=message,
             event_handler=event_handler,
             message_files=message_files,
             recipient_agent = recipient_agent,
             attachments=attachments,
-            is_persist=True
+            is_persist=True,
+            deadline=Deadline(timeout) if timeout else None,
+            cancel_token=cancel_token or CancellationToken()
         )
 
         while True:
@@ -140,6 +202,133 @@ class Agency:
                 return e.value
          
 
+    def run_batch(self,
+                  messages: Iterable[str],
+                  concurrency: int = 8,
+                  checkpoint_path: str = None,
+                  timeout: float = None,
+                  is_persist: bool = False) -> Iterator[BatchResult]:
+        """
+        Runs many independent user conversations through the agency in parallel and yields their results as they finish.
+
+        Every message gets its own User and entrance session, so the conversations do not share the CEO thread of
+        the interactive entrance session. At most `concurrency` conversations run at the same time; the API calls
+        of all of them still go through the global concurrency limiter.
+
+        Parameters:
+        messages (Iterable[str]): The user messages, one conversation each.
+        concurrency (int, optional): Maximum number of conversations in flight. Defaults to 8.
+        checkpoint_path (str, optional): JSONL file recording every finished conversation. When the batch is run again with the same file (e.g. after a crash), the messages that already succeeded are not run again; their results are yielded first with resumed=True. Defaults to None (no checkpoint).
+        timeout (float, optional): Time budget of each conversation in seconds, see get_completion. Defaults to None.
+        is_persist (bool, optional): Keep the entrance threads in the CEO's threads. If True, later messages of the batch may be routed to the thread of an earlier one. Defaults to False (every conversation starts and ends on its own CEO thread, and the threads of the agents it talked to are dropped when it finishes).
+
+        Returns:
+        Iterator[BatchResult]: One result per message, in completion order. A failed conversation yields a result with `error` set instead of raising. Closing the iterator early cancels the conversations in flight.
+        """
+        if concurrency < 1:
+            raise Exception("concurrency must be at least 1.")
+        # 参数在调用时检查，结果由内部生成器产生
+        return self._run_batch(list(messages), concurrency, checkpoint_path, timeout, is_persist)
+
+    def _run_batch(self, messages: List[str], concurrency: int, checkpoint_path: Optional[str],
+                   timeout: Optional[float], is_persist: bool) -> Iterator[BatchResult]:
+        checkpoint = BatchCheckpoint(checkpoint_path) if checkpoint_path else None
+        done = checkpoint.load() if checkpoint else {}
+        for index, result in sorted(done.items()):
+            if index < len(messages) and result.message == messages[index]:
+                yield result
+        todo = iter([(index, message) for index, message in enumerate(messages)
+                     if index not in done or done[index].message != message])
+
+        tokens = {}
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="agency_batch") as executor:
+            def submit():
+                item = next(todo, None)
+                if item is None:
+                    return None
+                tokens[item[0]] = CancellationToken()
+                return executor.submit(self._run_batch_item, item[0], item[1], tokens[item[0]], timeout, is_persist)
+
+            running = {future for future in (submit() for _ in range(concurrency)) if future}
+            try:
+                while running:
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        result = future.result()
+                        tokens.pop(result.index, None)
+                        if checkpoint:
+                            checkpoint.append(result)
+                        future = submit() # 先补充空出的名额，再把结果交给调用者
+                        if future:
+                            running.add(future)
+                        yield result
+            finally:
+                # 调用者提前关闭了迭代器（或出现异常）：取消仍在运行的会话
+                for token in tokens.values():
+                    token.cancel()
+
+    def run_offline_batch(self,
+                          messages: Iterable[str],
+                          work_dir: str = None,
+                          poll_interval: float = 60.0,
+                          max_waves: int = 50) -> List[BatchResult]:
+        """
+        Runs independent user conversations through the OpenAI Batch API, for large workloads that do not need an
+        answer right away. See OfflineBatchRunner: every model turn of every conversation is one line of a batch
+        request file, tools and SendMessage hops are executed locally between the batches.
+
+        Parameters:
+        messages (Iterable[str]): The user messages, one conversation each.
+        work_dir (str, optional): Directory keeping the request and result files of every wave. Defaults to a new temporary directory.
+        poll_interval (float, optional): Seconds between two status checks of a running batch. Defaults to 60.
+        max_waves (int, optional): Batches after which unfinished conversations fail. Defaults to 50.
+
+        Returns:
+        List[BatchResult]: One result per message, in the order of the messages.
+        """
+        runner = OfflineBatchRunner(self, work_dir=work_dir, poll_interval=poll_interval, max_waves=max_waves)
+        return runner.run(list(messages))
+
+    def _run_batch_item(self, index: int, message: str, cancel_token: CancellationToken, timeout: float,
+                        is_persist: bool) -> BatchResult:
+        user = User()
+        session = self.create_entrance_session(user)
+        gen = session.get_completion(message=message,
+                                     is_persist=is_persist,
+                                     yield_messages=False,
+                                     deadline=Deadline(timeout) if timeout else None,
+                                     cancel_token=cancel_token)
+        try:
+            while True:
+                next(gen)
+        except StopIteration as e:
+            return BatchResult(index, message, e.value)
+        except Exception as e:
+            logger.info(f"Batch message {index} failed: {e}")
+            return BatchResult(index, message, error=str(e) or type(e).__name__)
+        finally:
+            if not is_persist:
+                # 每条消息的子会话thread(如Worker的thread)不再使用，避免大批量时内存无限增长
+                self.drop_user_threads(user)
+
+    def drop_user_threads(self, user: User) -> int:
+        """
+        Removes the threads owned by a user from every agent of the agency, e.g. once the user's conversation is over.
+
+        Parameters:
+        user (User): The user whose threads are removed.
+
+        Returns:
+        int: The number of threads removed.
+        """
+        dropped = 0
+        for agent in self.agents:
+            for thread in list(agent.threads):
+                if thread.owner == user.uuid:
+                    agent.remove_thread(thread)
+                    dropped += 1
+        return dropped
+
     def demo_gradio(self, height=450, dark_mode=True):
         """
         Launches a Gradio-based demo interface for the agency chatbot.
@@ -172,7 +361,6 @@ class Agency:
         recipient_agent = self.ceo
 
         with gr.Blocks(js=js) as demo:
-            chatbot_queue = queue.Queue()
             chatbot = gr.Chatbot(height=height)
             with gr.Row():
                 with gr.Column(scale=9):
@@ -223,9 +411,13 @@ class Agency:
 
                 return original_user_message, history + [[user_message, None]]
 
-            class GradioEventHandler(AgencyEventHandler):
+            class GradioEventHandler(LeanEventHandler):
                 message_output = None
 
+                @property
+                def frames(self) -> DeltaCoalescer:
+                    return self.context.state["frames"]
+
                 @override
                 def on_message_created(self, message: Message) -> None:
                     if message.role == "user":
@@ -236,21 +428,20 @@ class Agency:
                         self.message_output = MessageOutput("text", self.recipient_agent_name, self.agent_name,
                                                             "")
 
-                    chatbot_queue.put("[new_message]")
-                    chatbot_queue.put("mc:"+self.message_output.get_formatted_content())
+                    self.frames.push({"op": "message", "text": "mc:"+self.message_output.get_formatted_content()})
 
                 @override
                 def on_text_delta(self, delta, snapshot):
-                    chatbot_queue.put(delta.value)
+                    self.frames.append(delta.value)
 
                 @override
                 def on_tool_call_created(self, tool_call):
                     # TODO: add support for code interpreter and retirieval tools
                     if tool_call.type == "function":
-                        chatbot_queue.put("[new_message]")
                         self.message_output = MessageOutput("function", self.recipient_agent_name, self.agent_name,
                                                             str(tool_call.function))
-                        chatbot_queue.put("tcc:"+self.message_output.get_formatted_header() + "\n")
+                        self.frames.push({"op": "message",
+                                          "text": "tcc:"+self.message_output.get_formatted_header() + "\n"})
 
                 @override
                 def on_tool_call_done(self, snapshot):
@@ -260,7 +451,7 @@ class Agency:
                     if snapshot.type != "function":
                         return
 
-                    chatbot_queue.put(str(snapshot.function))
+                    self.frames.append(str(snapshot.function))
 
                     if snapshot.function.name == "SendMessage":
                         try:
@@ -269,8 +460,7 @@ class Agency:
                             self.message_output = MessageOutput("text", self.recipient_agent_name, recipient,
                                                                 args["message"])
 
-                            chatbot_queue.put("[new_message]")
-                            chatbot_queue.put("tcd:"+self.message_output.get_formatted_content())
+                            self.frames.push({"op": "message", "text": "tcd:"+self.message_output.get_formatted_content()})
                         except Exception as e:
                             pass
 
@@ -286,21 +476,17 @@ class Agency:
                             if tool_call.function.name == "SendMessage":
                                 continue
 
-                            self.message_output = None
-                            chatbot_queue.put("[new_message]")
-
                             self.message_output = MessageOutput("function_output", tool_call.function.name,
                                                                 self.recipient_agent_name,
                                                                 +tool_call.function.output)
 
-                            chatbot_queue.put(self.message_output.get_formatted_header() + "\n")
-                            chatbot_queue.put("rsd:"+tool_call.function.output)
+                            self.frames.push({"op": "message", "text": self.message_output.get_formatted_header() + "\n"})
+                            self.frames.append("rsd:"+tool_call.function.output)
 
                 @override
                 @classmethod
                 def on_all_streams_end(cls):
                     cls.message_output = None
-                    chatbot_queue.put("[end]")
 
             def bot(original_message, history):
                 nonlocal message_file_ids
@@ -309,36 +495,44 @@ class Agency:
                 if message_file_ids:
                     print("Message files: ", message_file_ids)
                 # Replace this with your actual chatbot logic
-          
-                completion_thread = threading.Thread(target=self.get_completion_stream, args=(
-                    original_message, GradioEventHandler, message_file_ids,recipient_agent))
+                cancel_token = CancellationToken() # 每个用户请求一个token
+                frames = DeltaCoalescer()           # 合并token delta，每个frame只刷新一次界面
+                handler = GradioEventHandler.for_request()
+                handler.context.state["frames"] = frames
+
+                def complete(message, files, agent):
+                    try:
+                        self.get_completion_stream(message, handler, files, agent,
+                                                   cancel_token=cancel_token)
+                    except RequestCancelled:
+                        pass
+                    finally:
+                        frames.close()
+
+                completion_thread = threading.Thread(target=complete, args=(
+                    original_message, message_file_ids, recipient_agent))
                 completion_thread.start()                
                 
                 message_file_ids = []
                 message_file_names = []
 
                 new_message = True
-                while True:
-                    try:
-                        bot_message = chatbot_queue.get(block=True)
-
-                        if bot_message == "[end]":
-                            completion_thread.join()
-                            break
-
-                        if bot_message == "[new_message]":
-                            new_message = True
-                            continue
-
-                        if new_message:
-                            history.append([None, bot_message])
-                            new_message = False
-                        else:
-                            history[-1][1] += bot_message
-
-                        yield "", history                    
-                    except queue.Empty:
-                        break
+                try:
+                    for frame in frames:
+                        for patch in frame:
+                            if patch["op"] == "message" or new_message:
+                                history.append([None, patch["text"]])
+                                new_message = False
+                            else:
+                                history[-1][1] += patch["text"]
+                        yield "", history
+                    completion_thread.join()
+                finally:
+                    # 用户关闭页面或中断请求：取消整个请求树上的run，残留的输出由frames丢弃
+                    frames.abandon()
+                    if completion_thread.is_alive():
+                        cancel_token.cancel()
+                        completion_thread.join(timeout=30)
 
             button.click(
                 user,
@@ -360,19 +554,27 @@ class Agency:
         demo.launch()
         return demo
 
-    def run_demo(self):
+    def run_demo(self, stream: bool = False):
         """
         Runs a demonstration of the agency's capabilities in an interactive command line interface.
 
         This function continuously prompts the user for input and displays responses from the agency's entrance session. It leverages the generator pattern for asynchronous message processing.
 
+        Parameters:
+        stream (bool, optional): Print the answers while they are generated instead of message by message. Defaults to False.
+
         Output:
         Outputs the responses from the agency's entrance session to the command line.
         """
+        console = get_console()
         while True:
             console.rule()
             text = input("USER: ")
 
+            if stream:
+                self._stream_to_terminal(text)
+                continue
+
             try:
                 gen = self.entrance_session.get_completion(message=text)
                 while True:
@@ -381,6 +583,53 @@ class Agency:
             except StopIteration as e:
                 pass
 
+    def _stream_to_terminal(self, message: str):
+        class TermEventHandler(LeanEventHandler):
+            def _new_message(self, message_output: MessageOutput):
+                self.context.state["frames"].push({"op": "message",
+                                                   "header": message_output.get_formatted_header(),
+                                                   "style": message_output.hash_names_to_color()})
+
+            @override
+            def on_message_created(self, message: Message) -> None:
+                if message.role == "assistant":
+                    self._new_message(MessageOutput("text", self.recipient_agent_name, self.agent_name, ""))
+
+            @override
+            def on_text_delta(self, delta, snapshot):
+                self.context.state["frames"].append(delta.value)
+
+            @override
+            def on_tool_call_done(self, tool_call):
+                if tool_call.type == "function":
+                    self._new_message(MessageOutput("function", self.recipient_agent_name, self.agent_name, ""))
+                    self.context.state["frames"].append(str(tool_call.function))
+
+        frames = DeltaCoalescer()
+        handler = TermEventHandler.for_request()
+        handler.context.state["frames"] = frames
+
+        def complete():
+            try:
+                self.get_completion_stream(message, handler, message_files=None)
+            finally:
+                frames.close()
+
+        completion_thread = threading.Thread(target=complete)
+        completion_thread.start()
+        console = get_console()
+        style = None
+        for frame in frames:
+            for patch in frame:
+                if patch["op"] == "message":
+                    style = patch["style"]
+                    console.rule()
+                    console.print(patch["header"], style=style)
+                else:
+                    console.print(patch["text"], style=style, end="")
+        console.print()
+        completion_thread.join()
+
     def _parse_agency_chart(self, agency_chart):
         """
         Parses the provided agency chart to initialize and organize agents within the agency.
@@ -521,6 +770,7 @@ class Agency:
               communication here is synchronous; the recipient agent won't perform any tasks post-response. 
               You are responsible for relaying the recipient agent's responses back to the user, as they do not have direct access to these replies.
               Keep engaging with the tool for continuous interaction until the task is fully resolved."""
+            early_dispatch: ClassVar[bool] = False  # 接收方的stream不能与本次run的stream交错
             chain_of_thought: str = Field(...,
                                           description="Think step by step to determine the correct recipient and "
                                                       "message. For multi-step tasks, first break it down into smaller"
@@ -550,39 +800,74 @@ class Agency:
                 return value
 
             def run(self, caller_thread):
+                if self.cancel_token:
+                    self.cancel_token.raise_if_cancelled()
+
+                recipient_agent = outer_self.get_agent_by_name(self.recipient.value)
+                cache = recipient_agent.response_cache
+                if self.message_files:
+                    cache = None # 带附件的请求不缓存
+                scope = None if cache is None or cache.shared else caller_thread.in_message_chain # 按用户隔离
+                if cache is not None:
+                    response = cache.lookup(self.message, scope=scope)
+                    if response is not None:
+                        logger.info(f"Cached response of {self.recipient.value} to {self.caller_agent.name}")
+                        return response
+
+                flight = recipient_agent.single_flight
+                if flight is not None: # 相同的请求正在执行时，等待它的结果而不是再发起一次
+                    key = flight.key(self.message, self.message_files, caller_thread.in_message_chain)
+                    leader, response = flight.attach(key, deadline=self.deadline, cancel_token=self.cancel_token)
+                    if not leader:
+                        logger.info(f"Coalesced request of {self.caller_agent.name} to {self.recipient.value}")
+                        return response
+
                 if self.recipient.value in caller_thread.sessions.keys(): #如果已经有session，直接使用session
                     session = caller_thread.sessions[self.recipient.value]
                     info = f"Retrived Session: caller_agent={session.caller_agent.name}, recipient_agent={session.recipient_agent.name}"
                     logger.info(info)           
                 else:
-                    session = Session(caller_agent=self.caller_agent, # TODO: check this parameter if error.
-                                      recipient_agent=outer_self.get_agent_by_name(self.recipient.value),
+                    session = outer_self.SessionType(caller_agent=self.caller_agent, # TODO: check this parameter if error.
+                                      recipient_agent=recipient_agent,
                                       caller_thread=caller_thread)
                     info = f"New Session Created! caller_agent={self.caller_agent.name}, recipient_agent={self.recipient.value}"
                     logger.info(info)
                     caller_thread.sessions[self.recipient.value] = session
 
                 if not isinstance(session, Session):
+                    if flight is not None:
+                        flight.abandon(key)
                     raise Exception("error")                    
                 
                 #===================# python.thread.create()====================================
                 # TODO: 创建新的Python线程执行session
                 caller_thread.session_as_sender = session
-                try:
-                    message = session.get_completion(message=self.message, 
-                                             message_files=self.message_files,
-                                             event_handler=self.event_handler)
-                except Exception as e:
-                    logger.info(f"Exception{inspect.currentframe().f_code.co_name}：{str(e)}",exc_info=True)
-                    raise e
+                # 只创建生成器，请求在迭代时才执行；失败由flight.lead处理
+                message = session.get_completion(message=self.message, 
+                                         message_files=self.message_files,
+                                         event_handler=self.event_handler,
+                                         deadline=self.deadline,
+                                         cancel_token=self.cancel_token)
                 #======================# python.thread.wait_to_join()=================================
-                
+                if cache is not None:
+                    message = outer_self._cache_response(message, cache, self.message, scope)
+                if flight is not None:
+                    message = flight.lead(key, message)
+
                 return message or ""
 
         # TODO: 每个Agent有自己的SendMessage对象。但是当前这个版本认为一个Agent在某一时刻只能有一个SendMessage函数被调用。
         # 实际上，在Session模型中，一个Agent有多个Thread，因此可能会有多个SendMessage并行。所以需要注意全局变量的使用。
         return SendMessage 
 
+    @staticmethod
+    def _cache_response(completion, cache: ResponseCache, request: str, scope):
+        """Passes the completion generator of a SendMessage through and stores its final answer in the cache."""
+        response = yield from completion
+        if response:
+            cache.store(request, response, scope=scope)
+        return response
+
     def get_agent_by_name(self, agent_name)->Agent:
         """
         Retrieves an agent from the agency based on the agent's name.
@@ -643,6 +928,20 @@ class Agency:
         """
         return [agent.name for agent in self.agents]
 
+    def get_context_report(self) -> Dict[str, List[dict]]:
+        """
+        Reports the estimated context size of every agent's persisted threads.
+
+        Returns:
+        Dict[str, List[dict]]: For each agent name, one entry per thread with its thread_id, the current token estimate,
+        the estimate after every conversation (growth) and the number of compactions.
+        """
+        return {agent.name: [{"thread_id": thread.thread_id,
+                              "tokens": thread.token_estimate,
+                              "growth": list(thread.token_growth),
+                              "compactions": thread.compactions} for thread in agent.threads]
+                for agent in self.agents}
+
     def _init_agents(self):
         """
         Initializes all agents in the agency with unique IDs, shared instructions, and OpenAI models.
@@ -665,7 +964,8 @@ class Agency:
                 elif isinstance(agent.files_folder, list):
                     agent.files_folder += self.shared_files
 
-            agent.init_oai()
+            if not issubclass(self.SessionType, ChatCompletionSession): # chat completions不需要assistant
+                agent.init_oai()
 
     # def _init_sessions(self):
     #     """
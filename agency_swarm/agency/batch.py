@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+
+class BatchResult:
+    """Outcome of one message of Agency.run_batch."""
+
+    def __init__(self, index: int, message: str, response: Optional[str] = None, error: Optional[str] = None,
+                 resumed: bool = False):
+        self.index = index          # position of the message in the batch
+        self.message = message
+        self.response = response
+        self.error = error          # str(exception) if the conversation failed
+        self.resumed = resumed      # True if the result was read from the checkpoint instead of being computed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_dict(self) -> dict:
+        return {"index": self.index, "message": self.message, "response": self.response, "error": self.error}
+
+    def __repr__(self):
+        return f"BatchResult(index={self.index}, ok={self.ok})"
+
+
+class BatchCheckpoint:
+    """
+    Append-only JSONL file with one line per finished batch message. A batch started again with the same file skips
+    the messages that already succeeded; failed messages are run again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[int, BatchResult]:
+        """Returns the successful results of the checkpoint by index. A torn last line (crash while writing) is ignored."""
+        done = {}
+        if not os.path.isfile(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("error") is None:
+                    done[record["index"]] = BatchResult(record["index"], record["message"], record["response"],
+                                                        resumed=True)
+        return done
+
+    def append(self, result: BatchResult):
+        line = json.dumps(result.to_dict(), ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
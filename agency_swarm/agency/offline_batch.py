@@ -0,0 +1,240 @@
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from agency_swarm.agency.batch import BatchResult
+from agency_swarm.agents import Agent
+from agency_swarm.sessions import ChatCompletionSession
+from agency_swarm.threads import LocalThread
+from agency_swarm.util.concurrency import get_concurrency_limiter
+from agency_swarm.util.log_config import setup_logging
+from agency_swarm.util.oai import get_openai_client
+
+logger = setup_logging()
+
+FINISHED_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class _Frame:
+    """One agent of a conversation's SendMessage chain, with the local history of its hop."""
+
+    def __init__(self, agent: Agent, message: str, tool_call_id: str = None):
+        self.agent = agent
+        self.thread = LocalThread(messages=[{"role": "user", "content": message}])
+        self.tool_call_id = tool_call_id    # the caller's SendMessage call answered by this hop
+        self.pending: Optional[List[dict]] = None  # tool calls left to run, None while waiting for a model turn
+
+
+class _Conversation:
+    def __init__(self, index: int, message: str, agent: Agent):
+        self.index = index
+        self.message = message
+        self.stack: List[_Frame] = [_Frame(agent, message)]
+        self.turns = 0
+        self.retries = 0
+        self.response: Optional[str] = None
+        self.error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return not self.stack or self.error is not None
+
+
+class OfflineBatchRunner:
+    """
+    Runs independent user conversations through the Batch API instead of one request per model turn.
+
+    The conversations advance in waves. Every wave compiles the pending model turn of every unfinished conversation
+    into one JSONL request file (chat completions, the only conversation endpoint of the Batch API), submits it and
+    ingests the result file. Between waves the tool calls of the answers are executed locally; a SendMessage call
+    pushes a hop to its recipient, which is answered in the next wave, and the recipient's final answer becomes the
+    output of the call. The request and result files of every wave are kept in `work_dir`.
+
+    Conversations do not touch the agents' threads. Only function tools are available, as with ChatCompletionSession.
+    """
+
+    def __init__(self,
+                 agency,
+                 work_dir: str = None,
+                 completion_window: str = "24h",
+                 poll_interval: float = 60.0,
+                 max_waves: int = 50,
+                 max_retries: int = 2):
+        """
+        Parameters:
+        agency (Agency): The agency whose CEO receives the messages.
+        work_dir (str, optional): Directory of the request and result files. Defaults to a new temporary directory.
+        completion_window (str, optional): Completion window of the batches. Defaults to "24h".
+        poll_interval (float, optional): Seconds between two status checks of a running batch. Defaults to 60.
+        max_waves (int, optional): Waves after which unfinished conversations fail. Defaults to 50.
+        max_retries (int, optional): How many times a failed request of a conversation is submitted again in the next wave. Defaults to 2.
+        """
+        self.agency = agency
+        self.client = get_openai_client()
+        self.limiter = get_concurrency_limiter()
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="agency_batch_")
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+        self.max_waves = max_waves
+        self.max_retries = max_retries
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def run(self, messages: List[str]) -> List[BatchResult]:
+        conversations = [_Conversation(index, message, self.agency.ceo) for index, message in enumerate(messages)]
+
+        for wave in range(1, self.max_waves + 1):
+            active = [conversation for conversation in conversations if not conversation.finished]
+            if not active:
+                break
+            requests = {}
+            for conversation in active:
+                conversation.turns += 1
+                requests[f"{conversation.index}-{conversation.turns}"] = conversation
+            requests_path = os.path.join(self.work_dir, f"wave_{wave}_requests.jsonl")
+            self._write_requests(requests_path, requests)
+            logger.info(f"Batch wave {wave}: {len(requests)} requests, {len(conversations) - len(active)} "
+                        f"conversations finished")
+
+            results = self._submit(requests_path, os.path.join(self.work_dir, f"wave_{wave}_results.jsonl"))
+            for custom_id, conversation in requests.items():
+                self._ingest(conversation, results.get(custom_id))
+        else:
+            for conversation in conversations:
+                if not conversation.finished:
+                    conversation.error = f"Not finished after {self.max_waves} waves."
+
+        return [BatchResult(conversation.index, conversation.message, conversation.response, conversation.error)
+                for conversation in conversations]
+
+    # --- compile & submit ---
+
+    def _write_requests(self, path: str, requests: Dict[str, _Conversation]):
+        with open(path, "w", encoding="utf-8") as f:
+            for custom_id, conversation in requests.items():
+                request = {"custom_id": custom_id,
+                           "method": "POST",
+                           "url": "/v1/chat/completions",
+                           "body": self._request_body(conversation.stack[-1])}
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _request_body(frame: _Frame) -> dict:
+        agent = frame.agent
+        messages = frame.thread.messages
+        if agent.context_policy:
+            messages = agent.context_policy.trim(messages)
+        body = {"model": agent.model,
+                "messages": [{"role": "system", "content": agent.instructions}] + messages}
+        tools = ChatCompletionSession._chat_tools(agent)
+        if tools:
+            body["tools"] = tools
+        return body
+
+    def _submit(self, requests_path: str, results_path: str) -> Dict[str, dict]:
+        """Runs one request file as a batch, writes the result file and returns the results by custom_id."""
+        with open(requests_path, "rb") as f:
+            input_file = self.limiter.call(None, self.client.files.create, file=f, purpose="batch")
+        batch = self.limiter.call(None, self.client.batches.create,
+                                  input_file_id=input_file.id,
+                                  endpoint="/v1/chat/completions",
+                                  completion_window=self.completion_window)
+        while batch.status not in FINISHED_BATCH_STATUSES:
+            time.sleep(self.poll_interval)
+            batch = self.limiter.call(None, self.client.batches.retrieve, batch.id)
+        logger.info(f"Batch {batch.id} {batch.status}: {batch.request_counts}")
+        if batch.status == "failed":
+            raise Exception(f"Batch {batch.id} failed: {batch.errors}")
+
+        content = ""
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content += self.limiter.call(None, self.client.files.content, file_id).text
+        with open(results_path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+        results = {}
+        for line in content.splitlines():
+            if line.strip():
+                result = json.loads(line)
+                results[result["custom_id"]] = result
+        return results
+
+    # --- state machine ---
+
+    def _ingest(self, conversation: _Conversation, result: Optional[dict]):
+        response = (result or {}).get("response") or {}
+        if response.get("status_code") != 200:
+            # 请求失败或批处理过期：下一轮重新提交同一个请求
+            conversation.retries += 1
+            if conversation.retries > self.max_retries:
+                error = (result or {}).get("error") or response.get("body") or "no result"
+                conversation.error = f"Request failed: {error}"
+            return
+
+        conversation.retries = 0
+        reply = response["body"]["choices"][0]["message"]
+        message = {"role": "assistant", "content": reply.get("content")}
+        if reply.get("tool_calls"):
+            message["tool_calls"] = [{"id": call["id"], "type": "function", "function": call["function"]}
+                                     for call in reply["tool_calls"]]
+        frame = conversation.stack[-1]
+        frame.thread.add_message(message)
+
+        if message.get("tool_calls"):
+            frame.pending = list(message["tool_calls"])
+        else:
+            self._finish_frame(conversation, message["content"] or "")
+        self._advance(conversation)
+
+    def _finish_frame(self, conversation: _Conversation, content: str):
+        frame = conversation.stack.pop()
+        if conversation.stack:
+            conversation.stack[-1].thread.add_message({"role": "tool", "tool_call_id": frame.tool_call_id,
+                                                       "content": content})
+        else:
+            conversation.response = content
+
+    def _advance(self, conversation: _Conversation):
+        """Runs the local tool calls of the conversation until it waits for a model turn or is finished."""
+        while conversation.stack:
+            frame = conversation.stack[-1]
+            if frame.pending is None:
+                return
+            if not frame.pending:
+                frame.pending = None    # every call answered: the agent takes its next turn
+                return
+            call = frame.pending.pop(0)
+            if call["function"]["name"] == "SendMessage":
+                hop = self._send_message(frame, call)
+                if hop:
+                    conversation.stack.append(hop)
+                    continue
+            else:
+                frame.thread.add_message({"role": "tool", "tool_call_id": call["id"],
+                                          "content": self._execute_tool(frame, call)})
+
+    def _send_message(self, frame: _Frame, call: dict) -> Optional[_Frame]:
+        """Returns the hop to the recipient of a SendMessage call, or answers the call with the validation error."""
+        func = next((func for func in frame.agent.functions if func.__name__ == "SendMessage"), None)
+        try:
+            tool = func(**json.loads(call["function"]["arguments"]))
+            recipient = self.agency.get_agent_by_name(tool.recipient.value)
+        except Exception as e:
+            frame.thread.add_message({"role": "tool", "tool_call_id": call["id"], "content": f"Error: {e}"})
+            return None
+        return _Frame(recipient, tool.message, tool_call_id=call["id"])
+
+    @staticmethod
+    def _execute_tool(frame: _Frame, call: dict) -> str:
+        funcs = frame.agent.functions
+        func = next((func for func in funcs if func.__name__ == call["function"]["name"]), None)
+        if not func:
+            return f"Error: Function {call['function']['name']} not found. Available functions: {[func.__name__ for func in funcs]}"
+        try:
+            func = func(**json.loads(call["function"]["arguments"]))
+            func.caller_agent = frame.agent
+            return str(func.run(frame.thread))
+        except Exception as e:
+            return f"Error: {e}"
@@ -5,14 +5,18 @@ import os
 from typing import Dict, Literal, Union, Any, Type
 from typing import List
 
-from deepdiff import DeepDiff
 
 from openai import NotFoundError
 from openai.types.beta.assistant import ToolResources
 from agency_swarm.tools import BaseTool, ToolFactory
-from agency_swarm.tools import Retrieval, CodeInterpreter, FileSearch
+from agency_swarm.tools import Retrieval, CodeInterpreter, FileSearch, ReadToolOutput
 from agency_swarm.util.oai import get_openai_client
+from agency_swarm.util.context import ContextPolicy
+from agency_swarm.util.response_cache import ResponseCache
+from agency_swarm.util.single_flight import SingleFlight
+from agency_swarm.util.tool_output import ToolOutputPolicy
 from agency_swarm.util.openapi import validate_openapi_spec
+from agency_swarm.util.bundle import get_agency_bundle
 
 from agency_swarm.threads import Thread
 
@@ -20,7 +24,9 @@ class Agent():
     @property
     def assistant(self):
         if self._assistant is None:
-            raise Exception("Assistant is not initialized. Please run init_oai() first.")
+            if not self.id:
+                raise Exception("Assistant is not initialized. Please run init_oai() first.")
+            self._assistant = self.client.beta.assistants.retrieve(self.id)  # loaded from an agency bundle
         return self._assistant
 
     @assistant.setter
@@ -71,7 +77,13 @@ class Agent():
                  api_params: Dict[str, Dict[str, str]] = None,
                  file_ids: List[str] = None, 
                  metadata: Dict[str, str] = None, 
-                 model: str = "gpt-4-1106-preview"):
+                 model: str = "gpt-4-1106-preview",
+                 busy_thread_policy: Literal["fork", "wait", "reject"] = "fork",
+                 busy_thread_timeout: float = 30,
+                 context_policy: ContextPolicy = None,
+                 response_cache: ResponseCache = None,
+                 single_flight: SingleFlight = None,
+                 tool_output_policy: ToolOutputPolicy = None):
         """
         Initializes an Agent with specified attributes, tools, and OpenAI client.
 
@@ -89,6 +101,12 @@ class Agent():
         file_ids (List[str], optional): List of file IDs for files associated with the agent. Defaults to an empty list.
         metadata (Dict[str, str], optional): Metadata associated with the agent. Defaults to an empty dictionary.
         model (str, optional): The model identifier for the OpenAI API. Defaults to "gpt-4-1106-preview".
+        busy_thread_policy (Literal["fork", "wait", "reject"], optional): What to do when a message is routed to one of the agent's threads that is busy with another message. "fork" copies the thread, "wait" queues the message (FIFO) until the thread is free and forks after busy_thread_timeout, "reject" fails the message so the caller can retry later. Defaults to "fork".
+        busy_thread_timeout (float, optional): Seconds a message waits for a busy thread with the "wait" policy. Defaults to 30.
+        context_policy (ContextPolicy, optional): Context-window budget of the agent's threads: prompt token budget, last-N truncation and summarizing compaction. Defaults to None (threads grow without bound).
+        response_cache (ResponseCache, optional): Answers the agent gave to SendMessage requests, reused for identical or near-duplicate requests without a new run. Defaults to None (no caching).
+        single_flight (SingleFlight, optional): Coalesces identical SendMessage requests to the agent that are in flight at the same time into one run. Defaults to None (every request runs).
+        tool_output_policy (ToolOutputPolicy, optional): Size limit of the outputs of the agent's tools that declare no output_policy of their own. Outputs above it are truncated, or spilled to a local store and read back with the ReadToolOutput tool, which is then added to the agent. Defaults to None (outputs are submitted whole).
 
         This constructor sets up the agent with its unique properties, initializes the OpenAI client, reads instructions if provided, and uploads any associated files.
         """
@@ -107,6 +125,14 @@ class Agent():
         self.file_ids = file_ids if file_ids else []
         self.metadata = metadata if metadata else {}
         self.model = model
+        if busy_thread_policy not in ("fork", "wait", "reject"):
+            raise Exception(f"Invalid busy_thread_policy: {busy_thread_policy}. Must be one of 'fork', 'wait', 'reject'.")
+        self.busy_thread_policy = busy_thread_policy
+        self.busy_thread_timeout = busy_thread_timeout
+        self.context_policy = context_policy
+        self.response_cache = response_cache
+        self.single_flight = single_flight
+        self.tool_output_policy = tool_output_policy
 
         # private attributes
         self._assistant: Any = None
@@ -123,6 +149,8 @@ class Agent():
             print("Warning: 'file_ids' parameter is deprecated. Please use 'tool_resources' parameter instead.")
             self.add_file_ids(file_ids, "file_search")
         self._parse_schemas()
+        if any(policy and policy.spill for policy in [tool_output_policy] + [t.output_policy for t in self.functions]):
+            self.add_tool(ReadToolOutput)
 
     # --- OpenAI Assistant Methods ---
 
@@ -139,6 +167,16 @@ class Agent():
         # check if settings.json exists
         path = self.get_settings_path()
 
+        # load assistant from the agency bundle, if its parameters did not change since the build
+        bundle = get_agency_bundle()
+        if bundle and not self.id:
+            parameters = self._bundle_parameters()
+            assistant = bundle.assistant(self.name, parameters)
+            if assistant:
+                self.id = assistant["id"]
+                self.tool_resources = assistant["tool_resources"]
+                return self
+
         # load assistant from id
         if self.id:
             self.assistant = self.client.beta.assistants.retrieve(self.id)
@@ -171,6 +209,8 @@ class Agent():
                                 print("Updating assistant... " + self.name)
                                 self._update_assistant()
                             self._update_settings()
+                            if bundle:
+                                bundle.record_assistant(self.name, parameters, self.id, self.tool_resources)
                             return self
                         except NotFoundError:
                             print('not found assistant')
@@ -192,9 +232,17 @@ class Agent():
         self.id = self.assistant.id
 
         self._save_settings()
+        if bundle:
+            bundle.record_assistant(self.name, parameters, self.id, self.tool_resources)
 
         return self
 
+    def _bundle_parameters(self) -> dict:
+        """The parameters of the assistant an agency bundle entry is valid for."""
+        return {"name": self.name, "description": self.description, "instructions": self.instructions,
+                "tools": self.get_oai_tools(), "tool_resources": self.tool_resources, "metadata": self.metadata,
+                "model": self.model}
+
     def _update_assistant(self):
         """
         Updates the existing assistant's parameters on the OpenAI server.
@@ -261,6 +309,8 @@ class Agent():
                     f_path = os.path.normpath(f_path)
 
                 if os.path.isdir(f_path):
+                    folder = f_path
+                    manifest = []
                     f_paths = os.listdir(f_path)
 
                     f_paths = [f for f in f_paths if not f.startswith(".")]
@@ -295,11 +345,17 @@ class Agent():
                                     purpose="assistants").id
                                 self.file_ids.append(file_id)
                                 f.close()
-                            add_id_to_file(f_path, file_id)
+                            f_path = add_id_to_file(f_path, file_id)
                         if file_extend in code_interpreter_file_extensions:
                             code_interpreter_ids.append(file_id)
                         else:
                             file_search_ids.append(file_id)
+                        manifest.append({"name": os.path.basename(f_path), "size": os.path.getsize(f_path),
+                                         "file_id": file_id,
+                                         "tool": "code_interpreter" if file_extend in code_interpreter_file_extensions
+                                         else "file_search"})
+                    if get_agency_bundle():
+                        get_agency_bundle().record_files(folder, sorted(manifest, key=lambda m: m["name"]))
                 else:
                     raise Exception("Files folder path is not a directory.")
             else:
@@ -384,15 +440,19 @@ class Agent():
 
                     f_paths = [os.path.join(f_path, f) for f in f_paths]
 
+                    bundle = get_agency_bundle()
                     for f_path in f_paths:
                         with open(f_path, 'r') as f:
                             openapi_spec = f.read()
                             f.close()
-                        try:
-                            validate_openapi_spec(openapi_spec)
-                        except Exception as e:
-                            print("Invalid OpenAPI schema: " + os.path.basename(f_path))
-                            raise e
+                        # 未修改的schema直接使用bundle里编译好的operations
+                        operations = bundle.schema_operations(f_path, openapi_spec) if bundle else None
+                        if operations is None:
+                            try:
+                                validate_openapi_spec(openapi_spec)
+                            except Exception as e:
+                                print("Invalid OpenAPI schema: " + os.path.basename(f_path))
+                                raise e
                         try:
                             headers = None
                             params = None
@@ -400,7 +460,11 @@ class Agent():
                                 headers = self.api_headers[os.path.basename(f_path)]
                             if os.path.basename(f_path) in self.api_params:
                                 params = self.api_params[os.path.basename(f_path)]
-                            tools = ToolFactory.from_openapi_schema(openapi_spec, headers=headers, params=params)
+                            if operations is None:
+                                operations = ToolFactory.compile_openapi_schema(openapi_spec)
+                                if bundle:
+                                    bundle.record_schema(f_path, openapi_spec, operations)
+                            tools = ToolFactory.from_openapi_operations(operations, headers=headers, params=params)
                         except Exception as e:
                             print("Error parsing OpenAPI schema: " + os.path.basename(f_path))
                             raise e
@@ -426,6 +490,8 @@ class Agent():
         This method compares the current agent's parameters such as name, description, instructions, tools, file IDs, metadata, and model with the given assistant settings. It uses DeepDiff to compare complex structures like tools and metadata. If any parameter does not match, it returns False; otherwise, it returns True.
         """
 
+        from deepdiff import DeepDiff
+
         if self.name != assistant_settings['name']:
             return False
         
@@ -532,11 +598,19 @@ class Agent():
 
     def _read_instructions(self):
         if os.path.isfile(self.instructions):
-            with open(self.instructions, 'r') as f:
-                self.instructions = f.read()
+            path = self.instructions
         elif os.path.isfile(os.path.join(self.get_class_folder_path(), self.instructions)):
-            with open(os.path.join(self.get_class_folder_path(), self.instructions), 'r') as f:
-                self.instructions = f.read()
+            path = os.path.join(self.get_class_folder_path(), self.instructions)
+        else:
+            return
+        bundle = get_agency_bundle()
+        instructions = bundle.instructions(path) if bundle else None
+        if instructions is None:
+            with open(path, 'r') as f:
+                instructions = f.read()
+            if bundle:
+                bundle.record_instructions(path, instructions)
+        self.instructions = instructions
 
     def get_class_folder_path(self):
         return os.path.abspath(os.path.dirname(inspect.getfile(self.__class__)))
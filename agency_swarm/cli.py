@@ -1,6 +1,9 @@
 import argparse
+import importlib
+import os
+import sys
 
-from agency_swarm.util import create_agent_template
+from agency_swarm.util import AgencyBundle, create_agent_template, set_agency_bundle
 
 
 def main():
@@ -16,10 +19,67 @@ def main():
     create_parser.add_argument('--name', type=str, help='Name of agent.')
     create_parser.add_argument('--description', type=str, help='Description of agent.')
 
+    serve_parser = subparsers.add_parser('serve', help='Serve an agency to many users over HTTP (Server-Sent Events).')
+    serve_parser.add_argument('agency', type=str,
+                              help='Import path of the agency, "module:attribute". The attribute may be an Agency or a function returning one.')
+    serve_parser.add_argument('--host', type=str, default="127.0.0.1", help='Host to bind.')
+    serve_parser.add_argument('--port', type=int, default=8000, help='Port to bind.')
+    serve_parser.add_argument('--idle_timeout', type=float, default=1800.0,
+                              help='Seconds after which the session of an idle user is evicted.')
+    serve_parser.add_argument('--max_users', type=int, default=None, help='Maximum number of user sessions kept.')
+    serve_parser.add_argument('--max_workers', type=int, default=256,
+                              help='Maximum number of requests executed at the same time, later requests wait.')
+    serve_parser.add_argument('--bundle', type=str, default=None,
+                              help='Agency bundle built with `agency-swarm build` to start from.')
+
+    build_parser = subparsers.add_parser('build', help='Compile an agency into a bundle it starts from quickly.')
+    build_parser.add_argument('agency', type=str,
+                              help='Import path of the agency, "module:attribute". The attribute may be an Agency or a function returning one.')
+    build_parser.add_argument('--output', type=str, default="agency_bundle.json",
+                              help='Path of the bundle. An existing bundle is updated: only what changed is rebuilt.')
+
     args = parser.parse_args()
 
     if args.create_template == "create-agent-template":
         create_agent_template(args.name, args.description, args.path, args.use_txt)
+    elif args.create_template == "serve":
+        serve(args)
+    elif args.create_template == "build":
+        build(args)
+
+
+def load_agency(path: str):
+    if ":" not in path:
+        raise Exception(f"Invalid agency path: {path}. Must be 'module:attribute'.")
+    module_name, attribute = path.split(":", 1)
+    sys.path.insert(0, os.getcwd())
+    agency = getattr(importlib.import_module(module_name), attribute)
+    return agency() if callable(agency) else agency
+
+
+def serve(args):
+    try:
+        import uvicorn
+    except ImportError:
+        raise Exception("Please install uvicorn: pip install uvicorn")
+    from agency_swarm.server import AgencyServer
+
+    if args.bundle:
+        set_agency_bundle(AgencyBundle(args.bundle))
+    app = AgencyServer(load_agency(args.agency), idle_timeout=args.idle_timeout, max_users=args.max_users,
+                       max_workers=args.max_workers)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+def build(args):
+    bundle = AgencyBundle(args.output)
+    set_agency_bundle(bundle)
+    load_agency(args.agency)
+    bundle.save()
+    stats = bundle.stats()
+    print(f"Agency bundle written to {args.output}: {stats['reused']} entries reused, {stats['rebuilt']} rebuilt "
+          f"({stats['assistants']} assistants, {stats['schemas']} schemas, {stats['instructions']} instructions, "
+          f"{stats['files']} files folders).")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,18 @@
 from typing import Literal
 import hashlib
-from rich.console import Console
 
 from agency_swarm.util.oai import get_openai_client
 
-console = Console()
+console = None
+
+
+def get_console():
+    """The rich console of the terminal demos, created on first use so that rich is not imported with the package."""
+    global console
+    if console is None:
+        from rich.console import Console
+        console = Console()
+    return console
 
 class MessageOutput:
     def __init__(self, msg_type: Literal["function", "function_output", "text", "response_text", "system","process","thread"], sender_name: str, receiver_name: str, content):
@@ -38,6 +46,7 @@ class MessageOutput:
 
     # 打印消息
     def cprint(self):
+        console = get_console()
         console.rule()
 
         emoji = self.get_sender_emoji()
@@ -0,0 +1,2 @@
+from .app import AgencyServer, SSEEventHandler
+from .user_sessions import UserSession, UserSessionTable
@@ -0,0 +1,229 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from agency_swarm.server.user_sessions import UserSession, UserSessionTable
+from agency_swarm.util.cancellation import CancellationToken, RequestCancelled
+from agency_swarm.util.coalescing import DeltaCoalescer
+from agency_swarm.util.log_config import setup_logging
+from agency_swarm.util.streaming import LeanEventHandler
+from agency_swarm.util.tool_resources import get_tool_resources
+
+logger = setup_logging()
+
+DEFAULT_MAX_WORKERS = 256
+
+
+class SSEEventHandler(LeanEventHandler):
+    """Forwards the events of a stream to the DeltaCoalescer kept in the request's StreamContext."""
+
+    def emit(self, event: str, data: dict):
+        self.context.state["frames"].push(dict(data, op=event))
+
+    def on_message_created(self, message):
+        if message.role == "assistant":
+            self.emit("message_created", {"agent": self.recipient_agent_name, "recipient": self.agent_name})
+
+    def on_text_delta(self, delta, snapshot):
+        self.context.state["frames"].append(delta.value, agent=self.recipient_agent_name)
+
+    def on_message_done(self, message):
+        if message.role == "assistant":
+            text = "".join(block.text.value for block in message.content if block.type == "text")
+            self.emit("message_done", {"agent": self.recipient_agent_name, "text": text})
+
+    def on_tool_call_created(self, tool_call):
+        if tool_call.type == "function":
+            self.emit("tool_call_created", {"agent": self.recipient_agent_name, "tool": tool_call.function.name})
+
+    def on_tool_call_done(self, tool_call):
+        if tool_call.type == "function":
+            self.emit("tool_call_done", {"agent": self.recipient_agent_name, "tool": tool_call.function.name,
+                                         "arguments": tool_call.function.arguments})
+
+    def on_run_step_done(self, run_step):
+        if run_step.type != "tool_calls":
+            return
+        for tool_call in run_step.step_details.tool_calls:
+            if tool_call.type == "function":
+                self.emit("tool_output", {"agent": self.recipient_agent_name, "tool": tool_call.function.name,
+                                          "output": tool_call.function.output})
+
+
+class AgencyServer:
+    """
+    ASGI application serving an agency to many users from one process, e.g. `uvicorn module:app` with
+    `app = AgencyServer(agency)`, or `agency-swarm serve module:agency`.
+
+    Every user id gets its own User and entrance session (see UserSessionTable), so users never share a
+    conversation. Every request holds one thread of a pool of `max_workers` threads until it is done, a streamed
+    request for the whole stream. Further requests wait in line for a free thread (a warning is logged and /health
+    reports them as `queued`), so `max_workers` is the number of users served at the same time and should be sized
+    for the expected peak: the threads mostly wait on the OpenAI API and cost little besides their stack.
+    Text deltas are coalesced into one `text_delta` event per `frame_interval` (see DeltaCoalescer) and a slow
+    client slows down its own request instead of buffering it in memory: its worker waits, but the stream already
+    released its slot of the concurrency limiter, so the requests of other users are not held up.
+
+    Routes:
+        POST   /users/{user_id}/messages   {"message": str, "stream": bool = true, "timeout": float = null}
+               Streams the events of the request as Server-Sent Events, ending with a `done` event holding the
+               response (or `error`). With "stream": false, answers {"response": str} once the request is done.
+        DELETE /users/{user_id}            Ends the session of the user.
+        GET    /health                     {"status": "ok", "users": int, "requests": int, "queued": int, "max_workers": int}
+    """
+
+    def __init__(self, agency, idle_timeout: float = 1800.0, max_users: Optional[int] = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS, frame_interval: float = 0.05):
+        """
+        Parameters:
+        agency (Agency): The agency to serve.
+        idle_timeout (float, optional): Seconds after which the session of an idle user is evicted. Defaults to 1800.
+        max_users (int, optional): Maximum number of user sessions kept. Defaults to None (no limit).
+        max_workers (int, optional): Maximum number of requests executed at the same time, streamed or not; later requests wait for one of them to finish. Defaults to 256.
+        frame_interval (float, optional): Seconds between two frames of events sent to a client. Defaults to 0.05.
+        """
+        if max_workers < 1:
+            raise Exception("max_workers must be at least 1.")
+        self.agency = agency
+        self.sessions = UserSessionTable(agency, idle_timeout=idle_timeout, max_users=max_users)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agency_server")
+        self.frame_interval = frame_interval
+        self.requests = 0   # requests running or waiting for a worker, only changed on the event loop
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        parts = [part for part in scope["path"].split("/") if part]
+        method = scope["method"]
+        if parts == ["health"] and method == "GET":
+            return await self._json(send, 200, {"status": "ok", "users": len(self.sessions), "requests": self.requests,
+                                                "queued": max(0, self.requests - self.max_workers),
+                                                "max_workers": self.max_workers})
+        if len(parts) == 2 and parts[0] == "users" and method == "DELETE":
+            if self.sessions.remove(parts[1]):
+                return await self._json(send, 200, {"deleted": True})
+            return await self._json(send, 409 if parts[1] in self.sessions else 404, {"deleted": False})
+        if len(parts) == 3 and parts[0] == "users" and parts[2] == "messages":
+            if method != "POST":
+                return await self._json(send, 405, {"error": "Method not allowed."})
+            try:
+                body = json.loads(await self._read_body(receive) or b"{}")
+                message = body["message"]
+            except (ValueError, KeyError, TypeError):
+                return await self._json(send, 400, {"error": "The body must be a JSON object with a 'message'."})
+
+            user_session = self.sessions.acquire(parts[1])
+            if body.get("stream", True):
+                return await self._stream(user_session, message, body.get("timeout"), receive, send)
+            return await self._complete(user_session, message, body.get("timeout"), send)
+        return await self._json(send, 404, {"error": "Not found."})
+
+    async def _complete(self, user_session: UserSession, message: str, timeout: float, send):
+        try:
+            response = await self._submit(user_session, lambda: self.agency.get_completion(
+                message, yield_messages=False, timeout=timeout, session=user_session.session))
+        except Exception as e:
+            logger.info(f"Request of {user_session.user_id} failed: {e}")
+            return await self._json(send, 500, {"error": str(e)})
+        finally:
+            self.sessions.release(user_session)
+        return await self._json(send, 200, {"response": response})
+
+    async def _stream(self, user_session: UserSession, message: str, timeout: float, receive, send):
+        frames = DeltaCoalescer(interval=self.frame_interval)
+        cancel_token = CancellationToken()
+        handler = SSEEventHandler.for_request()
+        handler.context.state["frames"] = frames
+
+        def complete():
+            try:
+                response = self.agency.get_completion_stream(message, handler, message_files=None, timeout=timeout,
+                                                             cancel_token=cancel_token, session=user_session.session)
+                frames.push({"op": "done", "response": response})
+            except RequestCancelled:
+                frames.push({"op": "cancelled"})
+            except Exception as e:
+                logger.info(f"Request of {user_session.user_id} failed: {e}")
+                frames.push({"op": "error", "message": str(e)})
+            finally:
+                frames.close()
+                self.sessions.release(user_session)
+
+        async def watch_disconnect():
+            while True:
+                if (await receive())["type"] == "http.disconnect":
+                    cancel_token.cancel()
+                    return
+
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]})
+        worker = self._submit(user_session, complete)
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            while True:
+                frame, finished = frames.poll()
+                if frame is None:
+                    if finished:
+                        break
+                    await asyncio.sleep(self.frame_interval)
+                    continue
+                payload = "".join(self._event(patch) for patch in frame)
+                await send({"type": "http.response.body", "body": payload.encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            watcher.cancel()
+            frames.abandon()
+            if not worker.done():   # 客户端断开连接：取消整个请求
+                cancel_token.cancel()
+
+    def _submit(self, user_session: UserSession, fn) -> asyncio.Future:
+        """Runs a request on the worker pool, counting the requests that wait for a free worker."""
+        self.requests += 1
+        if self.requests > self.max_workers:
+            logger.warning(f"All {self.max_workers} workers are busy, the request of {user_session.user_id} waits "
+                           f"({self.requests - self.max_workers} queued). Consider raising max_workers.")
+        future = asyncio.get_running_loop().run_in_executor(self.executor, fn)
+        future.add_done_callback(self._request_done)
+        return future
+
+    def _request_done(self, future):
+        self.requests -= 1
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                tools = [tool for agent in self.agency.agents for tool in agent.functions]
+                await asyncio.get_running_loop().run_in_executor(self.executor, get_tool_resources().start, *tools)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                get_tool_resources().close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    def _event(patch: dict) -> str:
+        data = {k: v for k, v in patch.items() if k != "op"}
+        event = "text_delta" if patch["op"] == "text" else patch["op"]
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                return body
+
+    @staticmethod
+    async def _json(send, status: int, data: dict):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps(data, ensure_ascii=False).encode()})
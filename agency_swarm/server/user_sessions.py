@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from agency_swarm.sessions import Session
+from agency_swarm.user import User
+from agency_swarm.util.log_config import setup_logging
+
+logger = setup_logging()
+
+
+class UserSession:
+    def __init__(self, user_id: str, session: Session):
+        self.user_id = user_id
+        self.session = session
+        self.user: User = session.caller_agent
+        self.last_seen = time.monotonic()
+        self.active = 0     # requests of the user in flight
+
+
+class UserSessionTable:
+    """
+    Entrance sessions of the users of a served agency, by user id. A user idle for longer than `idle_timeout` is
+    evicted together with the threads of its conversations. With `max_users`, the least recently seen idle users are
+    evicted first when the table is full.
+    """
+
+    def __init__(self, agency, idle_timeout: float = 1800.0, max_users: Optional[int] = None):
+        self.agency = agency
+        self.idle_timeout = idle_timeout
+        self.max_users = max_users
+        self._users: "OrderedDict[str, UserSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id: str) -> UserSession:
+        """Returns the session of the user, creating it if needed, and marks a request of the user as in flight."""
+        with self._lock:
+            self._evict_idle()
+            user_session = self._users.get(user_id)
+            if user_session is None:
+                if self.max_users and len(self._users) >= self.max_users:
+                    self._evict_least_recent()
+                user_session = UserSession(user_id, self.agency.create_entrance_session(User()))
+                self._users[user_id] = user_session
+                logger.info(f"New user session: {user_id} ({len(self._users)} users)")
+            self._users.move_to_end(user_id)
+            user_session.active += 1
+            user_session.last_seen = time.monotonic()
+            return user_session
+
+    def release(self, user_session: UserSession):
+        with self._lock:
+            user_session.active -= 1
+            user_session.last_seen = time.monotonic()
+
+    def remove(self, user_id: str) -> bool:
+        """Ends the session of the user. Returns False if the user is unknown or has requests in flight."""
+        with self._lock:
+            user_session = self._users.get(user_id)
+            if user_session is None or user_session.active:
+                return False
+            self._drop(user_session)
+            return True
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            return self._evict_idle()
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, user_id: str):
+        return user_id in self._users
+
+    def _evict_idle(self) -> int:
+        now = time.monotonic()
+        idle = [s for s in self._users.values() if not s.active and now - s.last_seen > self.idle_timeout]
+        for user_session in idle:
+            self._drop(user_session)
+        return len(idle)
+
+    def _evict_least_recent(self):
+        for user_session in self._users.values():  # 从最久未访问的用户开始
+            if not user_session.active:
+                self._drop(user_session)
+                return
+
+    def _drop(self, user_session: UserSession):
+        del self._users[user_session.user_id]
+        self.agency.drop_user_threads(user_session.user)
+        logger.info(f"Evicted user session: {user_session.user_id} ({len(self._users)} users)")
@@ -1 +1,2 @@
-from .session import Session
\ No newline at end of file
+from .session import Session
+from .chat_completion_session import ChatCompletionSession
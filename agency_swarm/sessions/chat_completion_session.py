@@ -0,0 +1,247 @@
+import time
+import uuid
+from typing import List, Optional
+
+from openai.types.beta.threads import Message, Text, TextContentBlock, TextDelta
+from openai.types.beta.threads.runs import FunctionToolCall, RunStep, ToolCallsStepDetails
+from openai.types.beta.threads.runs.function_tool_call import Function as RunFunction
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from agency_swarm.agents import Agent
+from agency_swarm.messages import MessageOutput
+from agency_swarm.sessions.session import Session
+from agency_swarm.threads import LocalThread, Thread
+from agency_swarm.user import User
+from agency_swarm.util.cancellation import CancellationToken
+from agency_swarm.util.context import estimate_messages_tokens, estimate_tokens
+from agency_swarm.util.deadline import Deadline
+from agency_swarm.util.log_config import setup_logging
+from agency_swarm.util.streaming import AgencyEventHandler
+
+logger = setup_logging()
+
+
+class ChatCompletionSession(Session):
+    """
+    Session engine driving the recipient agent with streaming chat completions instead of Assistants runs.
+
+    The thread history is kept locally (LocalThread), so a hop costs one streaming request per model turn instead of
+    messages.create + runs.create + polls + messages.list. Tools, SendMessage and the MessageOutput/event handler
+    surface are the same as with Session; the event handler receives Assistants-shaped objects built from the chunks.
+    File search and code interpreter are not available with this engine.
+    """
+
+    def _new_thread(self, copy_from: Thread=None) -> Thread:
+        return LocalThread(copy_from=copy_from if isinstance(copy_from, LocalThread) else None)
+
+    def _cancel_stale_runs(self, recipient_thread: Thread):
+        pass  # 本地thread上没有服务端的run
+
+    def _estimate_thread_tokens(self, recipient_thread: LocalThread, message: str, response: str) -> int:
+        return estimate_messages_tokens(recipient_thread.messages)
+
+    def _thread_history(self, recipient_thread: LocalThread) -> List[dict]:
+        return list(recipient_thread.messages)
+
+    def _new_compacted_thread(self, messages: List[dict]) -> Thread:
+        return LocalThread(messages=messages)
+
+    def _get_completion_from_thread(self,
+                                    recipient_thread: LocalThread,
+                                    message: str,
+                                    recipient_agent: Agent=None,
+                                    attachments: Optional[List[dict]]=None,
+                                    event_handler: type(AgencyEventHandler) = None,
+                                    yield_messages=True,
+                                    deadline: Deadline = None,
+                                    cancel_token: CancellationToken = None):
+        sender_name = "user" if isinstance(self.caller_agent, User) else self.caller_agent.name
+        logger.info(f'THREAD:[ {sender_name} -> {recipient_agent.name} ]: LOCAL {recipient_thread.thread_id}')
+
+        if yield_messages:
+            yield MessageOutput("text", self.caller_agent.name, recipient_agent.name, message)
+
+        if event_handler:
+            event_handler = event_handler.for_hop(self.caller_agent.name, recipient_agent.name)
+
+        if attachments:
+            logger.info(f"Attachments are not supported by the chat completions engine, ignored: {attachments}")
+
+        recipient_thread.answer_dangling_tool_calls("Error: not executed, the previous request was stopped.")
+        recipient_thread.add_message({"role": "user", "content": message})
+        while True:
+            if recipient_thread.lease:
+                recipient_thread.lease.heartbeat()
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+
+            reply = self._stream_completion(recipient_thread, recipient_agent, event_handler, deadline, cancel_token)
+            if reply is None: # out of time before the model produced anything
+                return self._format_partial_result(recipient_agent, "incomplete", "")
+            incomplete = reply.pop("incomplete", False)
+            recipient_thread.add_message(reply)
+
+            if not reply.get("tool_calls"):
+                if incomplete:
+                    return self._format_partial_result(recipient_agent, "incomplete", reply["content"])
+                if yield_messages:
+                    yield MessageOutput("response_text", recipient_agent.name, self.caller_agent.name, reply["content"])
+                return reply["content"] or ""
+
+            tool_outputs = []
+            for call in reply["tool_calls"]:
+                if deadline and deadline.expired():
+                    break
+                tool_call = ChatCompletionMessageToolCall(id=call["id"], type="function",
+                                                          function=Function(**call["function"]))
+                output = yield from self._run_tool_call(tool_call=tool_call,
+                                                        recipient_thread=recipient_thread,
+                                                        recipient_agent=recipient_agent,
+                                                        event_handler=event_handler,
+                                                        yield_messages=yield_messages,
+                                                        deadline=deadline,
+                                                        cancel_token=cancel_token)
+                tool_outputs.append({"tool_call_id": call["id"], "output": str(output)})
+                recipient_thread.add_message({"role": "tool", "tool_call_id": call["id"], "content": str(output)})
+
+            if event_handler:
+                event_handler().on_run_step_done(self._tool_calls_step(recipient_thread, recipient_agent, reply,
+                                                                       tool_outputs))
+
+            # out of time: hand the partial outputs upward
+            if deadline and deadline.expired():
+                recipient_thread.answer_dangling_tool_calls("Error: not executed, out of time.")
+                return self._format_partial_result(recipient_agent, "incomplete", str(tool_outputs))
+
+    def _stream_completion(self,
+                           recipient_thread: LocalThread,
+                           recipient_agent: Agent,
+                           event_handler: type(AgencyEventHandler) = None,
+                           deadline: Deadline = None,
+                           cancel_token: CancellationToken = None) -> Optional[dict]:
+        """Streams one model turn and returns it as an assistant message dict."""
+        messages = recipient_thread.messages
+        if recipient_agent.context_policy:
+            messages = recipient_agent.context_policy.trim(messages, estimate_tokens(recipient_agent.instructions))
+        params = dict(model=recipient_agent.model,
+                      messages=[{"role": "system", "content": recipient_agent.instructions}] + messages,
+                      stream=True)
+        tools = self._chat_tools(recipient_agent)
+        if tools:
+            params["tools"] = tools
+
+        # 限流槽位只覆盖开启stream的请求，消费chunk时已释放
+        stream = self.limiter.call(recipient_agent.model, self.client.chat.completions.create, **params)
+        handle = cancel_token.register(stream.close) if cancel_token else None
+        try:
+            reply = self._consume_chat_stream(stream, recipient_thread, recipient_agent, event_handler, deadline)
+        except Exception:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            if cancel_token:
+                cancel_token.unregister(handle)
+            stream.close()
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        return reply
+
+    def _consume_chat_stream(self, stream, recipient_thread: LocalThread, recipient_agent: Agent,
+                             event_handler: type(AgencyEventHandler), deadline: Deadline) -> Optional[dict]:
+        handler = event_handler() if event_handler else None
+        content = None
+        tool_calls = {}     # index -> {"id", "type", "function": {"name", "arguments"}}
+        message = None
+        incomplete = False
+
+        for chunk in stream:
+            if deadline and deadline.expired():
+                incomplete = True
+                break
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            if delta.content:
+                if content is None:
+                    content = ""
+                    if handler:
+                        message = self._message(recipient_thread, recipient_agent, "")
+                        handler.on_message_created(message)
+                        handler.on_text_created(Text(value="", annotations=[]))
+                content += delta.content
+                if handler:
+                    handler.on_text_delta(TextDelta(value=delta.content), Text(value=content, annotations=[]))
+
+            for call_delta in delta.tool_calls or []:
+                call = tool_calls.get(call_delta.index)
+                if call is None:
+                    call = tool_calls[call_delta.index] = {"id": call_delta.id, "type": "function",
+                                                           "function": {"name": call_delta.function.name,
+                                                                        "arguments": ""}}
+                    if handler:
+                        handler.on_tool_call_created(self._function_tool_call(call))
+                if call_delta.function and call_delta.function.arguments:
+                    call["function"]["arguments"] += call_delta.function.arguments
+
+        if handler:
+            if content is not None:
+                handler.on_text_done(Text(value=content, annotations=[]))
+                handler.on_message_done(self._message(recipient_thread, recipient_agent, content, message))
+            if not incomplete:
+                for call in tool_calls.values():
+                    handler.on_tool_call_done(self._function_tool_call(call))
+            handler.on_end()
+
+        if incomplete:
+            if content is None:
+                return None
+            return {"role": "assistant", "content": content, "incomplete": True}
+
+        reply = {"role": "assistant", "content": content}
+        if tool_calls:
+            reply["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+        return reply
+
+    @staticmethod
+    def _chat_tools(recipient_agent: Agent) -> List[dict]:
+        return [tool for tool in recipient_agent.get_oai_tools() if tool["type"] == "function"]
+
+    @staticmethod
+    def _function_tool_call(call: dict, output: str = None) -> FunctionToolCall:
+        return FunctionToolCall(id=call["id"], type="function",
+                                function=RunFunction(name=call["function"]["name"],
+                                                     arguments=call["function"]["arguments"],
+                                                     output=output))
+
+    @staticmethod
+    def _message(recipient_thread: LocalThread, recipient_agent: Agent, content: str,
+                 message: Message = None) -> Message:
+        return Message.model_construct(id=message.id if message else f"msg_{uuid.uuid4().hex[:24]}",
+                                       object="thread.message",
+                                       created_at=int(time.time()),
+                                       thread_id=recipient_thread.thread_id,
+                                       role="assistant",
+                                       status="completed" if message else "in_progress",
+                                       assistant_id=recipient_agent.id,
+                                       attachments=[],
+                                       metadata={},
+                                       content=[TextContentBlock(type="text",
+                                                                 text=Text(value=content, annotations=[]))])
+
+    def _tool_calls_step(self, recipient_thread: LocalThread, recipient_agent: Agent, reply: dict,
+                         tool_outputs: List[dict]) -> RunStep:
+        outputs = {output["tool_call_id"]: output["output"] for output in tool_outputs}
+        return RunStep.model_construct(id=f"step_{uuid.uuid4().hex[:24]}",
+                                       object="thread.run.step",
+                                       created_at=int(time.time()),
+                                       assistant_id=recipient_agent.id,
+                                       thread_id=recipient_thread.thread_id,
+                                       status="completed",
+                                       type="tool_calls",
+                                       step_details=ToolCallsStepDetails(
+                                           type="tool_calls",
+                                           tool_calls=[self._function_tool_call(call, outputs.get(call["id"]))
+                                                       for call in reply["tool_calls"] if call["id"] in outputs]))
@@ -5,16 +5,25 @@ from typing import List, Literal, Optional
 from openai.types.beta.threads.run import Run
 
 from agency_swarm.threads import Thread
-from agency_swarm.threads import ThreadStatus
 from agency_swarm.threads import ThreadProperty
+from agency_swarm.threads import ThreadLease, get_thread_lock_manager
 from agency_swarm.tools import FileSearch, CodeInterpreter
 from agency_swarm.agents import Agent
 from agency_swarm.messages import MessageOutput
+from agency_swarm.sessions.tool_dispatch import EarlyToolDispatcher
 from openai.types.beta.threads.message import Attachment
 from agency_swarm.user import User
 from agency_swarm.util.oai import get_openai_client
+from agency_swarm.util.audit import audit_hop
+from agency_swarm.util.cancellation import CancellationToken, RequestCancelled
+from agency_swarm.util.context import estimate_messages_tokens
+from agency_swarm.util.concurrency import get_concurrency_limiter
+from agency_swarm.util.deadline import Deadline
 from agency_swarm.util.log_config import setup_logging
 from agency_swarm.util.streaming import AgencyEventHandler
+from agency_swarm.util.tool_cache import get_tool_cache
+from agency_swarm.util.tool_executor import get_tool_executor
+from agency_swarm.util.tool_output import get_tool_output_store
 
 logger = setup_logging()
 
@@ -26,10 +35,14 @@ class Session:
         self.caller_agent = caller_agent
         self.recipient_agent = recipient_agent
         self.client = get_openai_client()
+        self.limiter = get_concurrency_limiter()
+        self.lock_manager = get_thread_lock_manager()
         self.caller_thread = caller_thread
         self.cached_recipient_threads = []
         self.description = {}
         self.allowed_fails = 5
+        self.poll_interval = 1 # 与runs.create_and_poll的默认轮询间隔一致
+        self.early_tool_dispatch = False # 流式run中参数已完整的tool call立即执行，不等待requires_action（需显式开启）
 
         if isinstance(self.caller_agent, Agent) and self.caller_thread is None:
            raise Exception("Error: initialize Session with Agent as caller must specifiy the parameter caller_thread.")
@@ -40,7 +53,9 @@ class Session:
                               recipient_agent: Agent=None,
                               attachments: Optional[List[Attachment]]=None, 
                               is_persist: bool=True,
-                              message_files=None):
+                              message_files=None,
+                              deadline: Deadline=None,
+                              cancel_token: CancellationToken=None):
         
         return self.get_completion(message, 
                                    message_files=message_files,
@@ -48,7 +63,9 @@ class Session:
                                    event_handler=event_handler,
                                    attachments=attachments, 
                                    is_persist=is_persist, 
-                                   yield_messages=False)
+                                   yield_messages=False,
+                                   deadline=deadline,
+                                   cancel_token=cancel_token)
 
        
     def get_completion(self, 
@@ -58,78 +75,230 @@ class Session:
                        attachments: Optional[List[dict]]=None,
                        message_files: List[str]=None, 
                        is_persist: bool=True,
-                       yield_messages=False):
+                       yield_messages=False,
+                       deadline: Deadline=None,
+                       cancel_token: CancellationToken=None):
 
         if not recipient_agent:
             recipient_agent = self.recipient_agent
 
-        recipient_thread = self._retrieve_thread_of_topic(message) # try to lock the recipient_thread
-        if not recipient_thread or recipient_thread.status is not ThreadStatus.Ready:
-            recipient_thread = Thread(copy_from=recipient_thread)
-            logger.info(f'New THREAD:{recipient_thread.thread_id}')
+        caller_name = "User" if isinstance(self.caller_agent, User) else self.caller_agent.name
+        with audit_hop(f"{caller_name} -> {recipient_agent.name}"): # 审计模式下记录本跳的API调用序列
+            recipient_thread = self._retrieve_thread_of_topic(message)
+            lease = self._lock_thread(recipient_thread, recipient_agent, deadline) if recipient_thread else None # try to lock the recipient_thread
+            if not lease:
+                if recipient_thread:
+                    self.lock_manager.record_fork()
+                recipient_thread = self._new_thread(copy_from=recipient_thread)
+                logger.info(f'New THREAD:{recipient_thread.thread_id or "(created with its first run)"}')
+                lease = self.lock_manager.acquire(recipient_thread, parent=self._caller_lease())
+
+            try:
+                if lease.stale:
+                    # 上一个持有者异常退出，它的run可能仍在thread上运行
+                    self._cancel_stale_runs(recipient_thread)
+
+                policy = recipient_agent.context_policy
+                if policy and is_persist and policy.should_compact(recipient_thread.token_estimate):
+                    recipient_thread, lease = self._compact_thread(recipient_thread, lease, recipient_agent)
+            except BaseException: # 例如摘要请求失败或被取消：释放lease，否则thread会一直被占用
+                self._release_thread(recipient_thread, lease, clean=not lease.stale)
+                raise
+
+            recipient_thread.session_as_recipient = self
+            recipient_thread.properties = ThreadProperty.OneOff if not is_persist else recipient_thread.properties
+
+            recipient_thread.in_message_chain = self._message_chain()
+            if recipient_thread.owner is None:
+                recipient_thread.owner = recipient_thread.in_message_chain
+
+            if not attachments:
+                attachments = []
+        
+            if message_files:
+                recipient_tools = []
+                if FileSearch in recipient_agent.tools:
+                    recipient_tools.append({"type": "file_search"})
+                if CodeInterpreter in recipient_agent.tools:
+                    recipient_tools.append({"type": "code_interpreter"})
+
+                for file_id in message_files:
+                    attachments.append({"file_id": file_id,
+                                        "tools": recipient_tools or [{"type": "file_search"}]})
+
+
+            # 向recipient thread发送消息并获取回复
+            gen = self._get_completion_from_thread(recipient_thread=recipient_thread, 
+                                                   message=message, 
+                                                   recipient_agent = recipient_agent,
+                                                   attachments=attachments, 
+                                                   event_handler=event_handler, 
+                                                   yield_messages=yield_messages,
+                                                   deadline=deadline,
+                                                   cancel_token=cancel_token)
+            try:
+                while True:
+                    msg = next(gen)
+                    yield msg
+            except StopIteration as e:
+                response = e.value
+            except RequestCancelled:
+                # 请求被取消：下游的run已经被取消，释放recipient thread以便后续请求使用
+                logger.info(f"Request cancelled, release THREAD:{recipient_thread.thread_id}")
+                self._release_thread(recipient_thread, lease)
+                raise
+            except BaseException as e: # 包括GeneratorExit。thread上可能仍有run在运行，释放后由下一个持有者清理
+                logger.info(f"Exception{inspect.currentframe().f_code.co_name}：{str(e)}")
+                self._release_thread(recipient_thread, lease, clean=False)
+                raise e
+                # TODO:check是否recipient thread有更新消息
+        
+            try:
+                # 成功得到recipient回复后，根据recipient thread属性决定如何做后处理
+                if recipient_thread.properties is ThreadProperty.OneOff:
+                    return response
+                else: 
+                    # 保存recipient thread
+                    if not deadline or not deadline.expired(): # 超时后不再花时间更新描述
+                        new_history = f"# Message 1:\n {message}\n\n # Message 2:\n{response}\n"
+                        self._update_task_description(recipient_thread, new_history)
+                    self._track_tokens(recipient_thread, message, response)
+                    self.recipient_agent.add_thread(recipient_thread) 
+        
+                if recipient_thread.properties is ThreadProperty.CoW:
+                    # TODO: merge to original thread.
+                    pass
+            finally:
+                # Unlock the recipient_thread
+                self._release_thread(recipient_thread, lease)
+
+            return response
+
+    def _lock_thread(self, recipient_thread: Thread, recipient_agent: Agent, deadline: Deadline=None) -> Optional[ThreadLease]:
+        """按recipient agent的busy_thread_policy处理被占用的thread：排队等待、复制(返回None)或拒绝"""
+        timeout = 0
+        if recipient_agent.busy_thread_policy == "wait":
+            timeout = recipient_agent.busy_thread_timeout
+            if deadline:
+                timeout = min(timeout, deadline.remaining())
+
+        lease = self.lock_manager.acquire(recipient_thread, parent=self._caller_lease(), timeout=timeout)
+        if not lease and recipient_agent.busy_thread_policy == "reject":
+            self.lock_manager.record_reject()
+            raise Exception(f"{recipient_agent.name} is busy with this task, please try again later.")
+        return lease
+
+    def _new_thread(self, copy_from: Thread=None) -> Thread:
+        return Thread(copy_from=copy_from, lazy=True) # 由第一个run通过threads.create_and_run创建
+
+    def _track_tokens(self, recipient_thread: Thread, message: str, response: str):
+        previous = recipient_thread.token_estimate
+        recipient_thread.token_estimate = self._estimate_thread_tokens(recipient_thread, message, response)
+        recipient_thread.token_growth.append(recipient_thread.token_estimate)
+        logger.info(f"THREAD:{recipient_thread.thread_id} context ~{recipient_thread.token_estimate} tokens "
+                    f"(+{recipient_thread.token_estimate - previous})")
+
+    def _estimate_thread_tokens(self, recipient_thread: Thread, message: str, response: str) -> int:
+        # thread的消息保存在服务端，只能根据本次会话的收发消息累加估计（不含工具调用的中间消息）
+        return recipient_thread.token_estimate + estimate_messages_tokens([{"role": "user", "content": message},
+                                                                          {"role": "assistant", "content": response}])
+
+    def _compact_thread(self, recipient_thread: Thread, lease: ThreadLease, recipient_agent: Agent):
+        """
+        Forks the thread into a compacted thread: the old messages are replaced with a summary and the last
+        `keep_last_messages` messages are kept. The compacted thread takes the place of the old one in the agent's
+        threads. Returns the compacted thread and its lease.
+        """
+        policy = recipient_agent.context_policy
+        history = self._thread_history(recipient_thread)
+        split = max(0, len(history) - policy.keep_last_messages)
+        while split < len(history) and history[split]["role"] == "tool": # 不能从工具输出开始
+            split += 1
+        if split == 0:
+            return recipient_thread, lease
+
+        summary = self._summarize_history(history[:split], policy.summary_model)
+        messages = [{"role": "user", "content": f"[Summary of the earlier conversation]\n{summary}"}] + history[split:]
+        compacted = self._new_compacted_thread(messages)
+        compacted.instruction = recipient_thread.instruction
+        compacted.properties = recipient_thread.properties
+        compacted.owner = recipient_thread.owner
+        compacted.task_description = recipient_thread.task_description
+        compacted.compactions = recipient_thread.compactions + 1
+        compacted.token_estimate = estimate_messages_tokens(messages)
+        compacted.token_growth = recipient_thread.token_growth + [compacted.token_estimate]
+
+        threads = self.recipient_agent.threads
+        if recipient_thread in threads:
+            threads[threads.index(recipient_thread)] = compacted
+        new_lease = self.lock_manager.acquire(compacted, parent=self._caller_lease())
+        lease.release()
+
+        logger.info(f"Compacted THREAD:{recipient_thread.thread_id} (~{recipient_thread.token_estimate} tokens, "
+                    f"{len(history)} messages) into THREAD:{compacted.thread_id} (~{compacted.token_estimate} tokens, "
+                    f"{len(messages)} messages)")
+        return compacted, new_lease
+
+    def _thread_history(self, recipient_thread: Thread) -> List[dict]:
+        """Returns the messages of the thread, oldest first, as chat messages."""
+        if not recipient_thread.created:
+            return [{"role": message["role"], "content": message["content"]}
+                    for message in recipient_thread.pending_messages]
+        return [{"role": message.role,
+                 "content": "\n".join(block.text.value for block in message.content if block.type == "text")}
+                for message in recipient_thread.list_messages()]
+
+    def _new_compacted_thread(self, messages: List[dict]) -> Thread:
+        return Thread(messages=messages, lazy=True)
+
+    def _summarize_history(self, messages: List[dict], model: str) -> str:
+        instruction = """You are compressing the beginning of a long conversation so that it can be continued with less context. Write a concise summary of the conversation below that keeps every fact, decision, intermediate result, file id and open question needed to continue the task. Do not add anything that is not in the conversation. Output only the summary."""
+        transcript = ""
+        for message in messages:
+            content = message.get("content") or ""
+            for call in message.get("tool_calls") or []:
+                content += f"\n[calls {call['function']['name']}({call['function']['arguments']})]"
+            transcript += f"{message['role']}: {content}\n\n"
+
+        completion = self.limiter.call(model, self.client.chat.completions.create,
+            model=model,
+            messages=[
+                {"role": "system", "content": instruction},
+                {"role": "user", "content": transcript},
+            ]
+        )
+        return completion.choices[0].message.content
 
-        recipient_thread.status = ThreadStatus.Running
-        recipient_thread.session_as_recipient = self
-        recipient_thread.properties = ThreadProperty.OneOff if not is_persist else recipient_thread.properties
+    def _run_params(self, agent: Agent) -> dict:
+        return agent.context_policy.run_params() if agent.context_policy else {}
 
+    def _message_chain(self):
+        """The uuid of the user whose request this session serves."""
         if isinstance(self.caller_agent, User):
-            recipient_thread.in_message_chain = self.caller_agent.uuid
-        else:
-            recipient_thread.in_message_chain = self.caller_thread.in_message_chain
+            return self.caller_agent.uuid
+        return self.caller_thread.in_message_chain
 
-        if not attachments:
-            attachments = []
-        
-        if message_files:
-            recipient_tools = []
-            if FileSearch in recipient_agent.tools:
-                recipient_tools.append({"type": "file_search"})
-            if CodeInterpreter in recipient_agent.tools:
-                recipient_tools.append({"type": "code_interpreter"})
-
-            for file_id in message_files:
-                attachments.append({"file_id": file_id,
-                                    "tools": recipient_tools or [{"type": "file_search"}]})
-
-
-        # 向recipient thread发送消息并获取回复
-        gen = self._get_completion_from_thread(recipient_thread=recipient_thread, 
-                                               message=message, 
-                                               recipient_agent = recipient_agent,
-                                               attachments=attachments, 
-                                               event_handler=event_handler, 
-                                               yield_messages=yield_messages)
-        try:
-            while True:
-                msg = next(gen)
-                yield msg
-        except StopIteration as e:
-            response = e.value
-        except Exception as e: # 当会话超时，不能释放Thread对象
-            logger.info(f"Exception{inspect.currentframe().f_code.co_name}：{str(e)}")
-            raise e
-            # TODO:check是否recipient thread有更新消息
-        
-        # 成功得到recipient回复后，根据recipient thread属性决定如何做后处理
-        if recipient_thread.properties is ThreadProperty.OneOff:
-            recipient_thread = None
-            return response
-        else: 
-            # 保存recipient thread
-            new_history = f"# Message 1:\n {message}\n\n # Message 2:\n{response}\n"
-            self._update_task_description(recipient_thread, new_history)
-            self.recipient_agent.add_thread(recipient_thread) 
-        
-        if recipient_thread.properties is ThreadProperty.CoW:
-            # TODO: merge to original thread.
-            pass
+    def _candidate_threads(self) -> List[Thread]:
+        """Threads of the recipient agent a message may be routed to: only the threads of the same user."""
+        chain = self._message_chain()
+        return [thread for thread in self.recipient_agent.threads if thread.owner in (None, chain)]
+
+    def _caller_lease(self) -> Optional[ThreadLease]:
+        return self.caller_thread.lease if self.caller_thread else None
 
-        # Unlock the recipient_thread
+    def _release_thread(self, recipient_thread: Thread, lease: ThreadLease, clean: bool=True):
         recipient_thread.in_message_chain = None
-        recipient_thread.status = ThreadStatus.Ready
         recipient_thread.session_as_recipient = None
+        lease.release(clean)
 
-        return response
+    def _cancel_stale_runs(self, recipient_thread: Thread):
+        if not recipient_thread.created:
+            return
+        runs = self.limiter.call(None, self.client.beta.threads.runs.list,
+                                 thread_id=recipient_thread.thread_id,
+                                 limit=1)
+        if runs.data and runs.data[0].status in ("queued", "in_progress", "requires_action"):
+            self._cancel_run(runs.data[0], recipient_thread)
 
     # 向recipient thread发送消息并获取回复
     def _get_completion_from_thread(self, 
@@ -138,163 +307,344 @@ class Session:
                                     recipient_agent:Agent=None,
                                     attachments: Optional[List[dict]]=None, 
                                     event_handler: type(AgencyEventHandler) = None,  
-                                    yield_messages=True):
+                                    yield_messages=True,
+                                    deadline: Deadline = None,
+                                    cancel_token: CancellationToken = None):
 
         # Determine the sender's name based on the agent type
         sender_name = "user" if isinstance(self.caller_agent, User) else self.caller_agent.name
-        playground_url = f'https://platform.openai.com/playground?assistant={recipient_agent._assistant.id}&mode=assistant&thread={recipient_thread.thread_id}'
+        playground_url = f'https://platform.openai.com/playground?assistant={recipient_agent.id}&mode=assistant&thread={recipient_thread.thread_id}'
         logger.info(f'THREAD:[ {sender_name} -> {recipient_agent.name} ]: URL {playground_url}')
         
         if yield_messages:
             yield MessageOutput("text", self.caller_agent.name, recipient_agent.name, message)
 
-        if event_handler:
-            event_handler.agent_name = self.caller_agent.name
-            event_handler.recipient_agent_name = recipient_agent.name
-   
-        run = self._run_message(thread=recipient_thread, 
-                                message=message,
-                                attachments=attachments,
-                                event_handler=event_handler, 
-                                agent=recipient_agent)
-        
-        full_message = ""
-        # Check state of Assistant AI running in the State-Machine
-        while True: 
-            # wait until run completes
-            run = self._run_util_done(run,recipient_thread)
-            # function execution
-            if run.status == "requires_action":
-                tool_calls = run.required_action.submit_tool_outputs.tool_calls
-                tool_outputs = []
-                tool_outputs_for_resubmit = []
-                for tool_call in tool_calls:
-                    if yield_messages:
-                        yield MessageOutput("function", recipient_agent.name, self.caller_agent.name,
-                                            str(tool_call.function))
-                    
-                    # TODO:这里如果是SendMessage函数，后续会采用创建新Python线程来执行，需要修改处理逻辑。
-                    output = self._execute_tool(tool_call=tool_call, 
-                                                caller_thread=recipient_thread,
-                                                event_handler=event_handler,
-                                                recipient_agent=recipient_agent)
-                    if inspect.isgenerator(output):
-                        try:
-                            while True:
-                                item = next(output) 
-                                if isinstance(item, MessageOutput) and yield_messages:
-                                    yield item
-                        except StopIteration as e:
-                            output = e.value    
-                        except Exception as e:
-                            logger.info(f"Exception{inspect.currentframe().f_code.co_name}：{str(e)}")
-                            raise e
-                    else:
-                        if yield_messages:
-                            yield MessageOutput("function_output", tool_call.function.name, self.recipient_agent.name,
-                                                output)
-                    if event_handler:
-                        event_handler.agent_name = self.caller_agent.name
-                        event_handler.recipient_agent_name = recipient_agent.name
-
-                    tool_outputs.append({"tool_call_id": tool_call.id, "output": str(output)})
-                    tool_outputs_for_resubmit.append({"tools_calls": tool_call.model_dump_json(), "output":str(output)})
+        if event_handler: # 每一跳使用自己的handler类，嵌套的跳不会覆盖本跳的agent名
+            event_handler = event_handler.for_hop(self.caller_agent.name, recipient_agent.name)
+
+        # streamed runs start each tool call as soon as its arguments are complete, the tools get the hop's handler
+        dispatcher, stream_handler = None, event_handler
+        if event_handler and self.early_tool_dispatch:
+            dispatcher = EarlyToolDispatcher(lambda tool_call: self._run_tool_call(tool_call=tool_call,
+                                                                                   recipient_thread=recipient_thread,
+                                                                                   recipient_agent=recipient_agent,
+                                                                                   event_handler=event_handler,
+                                                                                   yield_messages=yield_messages,
+                                                                                   deadline=deadline,
+                                                                                   cancel_token=cancel_token))
+            stream_handler = event_handler.with_tool_call_listener(
+                lambda tool_call: self._dispatches_early(tool_call, recipient_agent) and dispatcher.dispatch(tool_call))
+
+        # the run currently owned by this hop, cancelled from the cancelling thread when the request is cancelled
+        active = {}
+        handle = cancel_token.register(lambda: self._cancel_active_run(active, recipient_thread)) if cancel_token else None
+        try:
+            run = self._run_message(thread=recipient_thread,
+                                    message=message,
+                                    attachments=attachments,
+                                    event_handler=stream_handler,
+                                    agent=recipient_agent,
+                                    deadline=deadline,
+                                    cancel_token=cancel_token)
+
+            full_message = ""
+            # Check state of Assistant AI running in the State-Machine
+            while True:
+                active["run"] = run
+                if recipient_thread.lease:
+                    recipient_thread.lease.heartbeat()
+                # wait until run completes
+                run = self._run_util_done(run,recipient_thread,deadline,cancel_token)
+                active["run"] = run
+                if cancel_token and cancel_token.cancelled:
+                    # the run may have been created after the cancellation callbacks fired
+                    self._cancel_active_run(active, recipient_thread)
+                    cancel_token.raise_if_cancelled()
+                # cancelled because the request ran out of time
+                if run.status in ("cancelling", "cancelled"):
+                    return self._partial_result(run, recipient_thread, recipient_agent)
+                # function execution
+                if run.status == "requires_action":
+                    tool_calls = run.required_action.submit_tool_outputs.tool_calls
+                    tool_outputs = []
+                    tool_outputs_for_resubmit = []
+                    for tool_call in tool_calls:
+                        if deadline and deadline.expired():
+                            break
+                        dispatched = dispatcher.pop(tool_call.id) if dispatcher else None
+                        if dispatched:
+                            items, output = dispatched.result()
+                            yield from items
+                        else:
+                            output = yield from self._run_tool_call(tool_call=tool_call,
+                                                                    recipient_thread=recipient_thread,
+                                                                    recipient_agent=recipient_agent,
+                                                                    event_handler=event_handler,
+                                                                    yield_messages=yield_messages,
+                                                                    deadline=deadline,
+                                                                    cancel_token=cancel_token)
+                        tool_outputs.append({"tool_call_id": tool_call.id, "output": str(output)})
+                        tool_outputs_for_resubmit.append({"tools_calls": tool_call.model_dump_json(), "output":str(output)})
                 
-                # submit tool outputs
-                try:
-                    run = self._submit_tool_outputs(run=run,recipient_thread=recipient_thread, 
-                                               tool_outputs=tool_outputs,
-                                               event_handler=event_handler)
-                except Exception as e:
-                    # ☑️[DONE]: 需要考虑提交tool结果是否会失败。例如因为tool执行时间过长，run被自动关闭。这时候需要重新执行run并提交上次结果。
-                    # 由于调用自定义Funtion超时，导致RUN进入expired状态后无法提交Funtion执行结果。但由于目前AssistantAPI不支持编辑RUN’step，这就无法做到断点续传。因此一个妥协的办法是将函数的执行结果包装成提示词消息追加到Thread中，然后再re-RUN。
-
-                    logger.info(f"Exception{inspect.currentframe().f_code.co_name}：{str(e)}")
-                    logger.info(f"Resubmit the expired tool's output with RUN's information. See: run_id: {run.id}, thread_id: {recipient_thread.thread_id} ...")
+                    # out of time: do not submit, hand the partial outputs upward
+                    if deadline and deadline.expired():
+                        run = self._cancel_run(run, recipient_thread)
+                        return self._partial_result(run, recipient_thread, recipient_agent, tool_outputs_for_resubmit)
+
+                    # submit tool outputs
+                    try:
+                        run = self._submit_tool_outputs(run=run,recipient_thread=recipient_thread, 
+                                                   tool_outputs=tool_outputs,
+                                                   event_handler=stream_handler,
+                                                   deadline=deadline,
+                                                   cancel_token=cancel_token)
+                    except RequestCancelled:
+                        raise
+                    except Exception as e:
+                        # ☑️[DONE]: 需要考虑提交tool结果是否会失败。例如因为tool执行时间过长，run被自动关闭。这时候需要重新执行run并提交上次结果。
+                        # 由于调用自定义Funtion超时，导致RUN进入expired状态后无法提交Funtion执行结果。但由于目前AssistantAPI不支持编辑RUN’step，这就无法做到断点续传。因此一个妥协的办法是将函数的执行结果包装成提示词消息追加到Thread中，然后再re-RUN。
+
+                        logger.info(f"Exception{inspect.currentframe().f_code.co_name}：{str(e)}")
+                        logger.info(f"Resubmit the expired tool's output with RUN's information. See: run_id: {run.id}, thread_id: {recipient_thread.thread_id} ...")
                     
-                    # Step 1. 将失败step的信息和tool的返回值打包成新的提示词
-                    wapper_output = self._wapper_expired_tool_output(str(tool_outputs_for_resubmit))
-                    logger.info(wapper_output)
+                        # Step 1. 将失败step的信息和tool的返回值打包成新的提示词
+                        wapper_output = self._wapper_expired_tool_output(str(tool_outputs_for_resubmit))
+                        logger.info(wapper_output)
                     
-                    # Step 2. 新的提示词追加到Thread中，并重新执行
-                    run = self._run_message(thread=recipient_thread, 
-                                                 message=wapper_output, 
-                                                 agent=recipient_agent, 
-                                                 attachments=attachments,
-                                                 event_handler=event_handler)
+                        # Step 2. 新的提示词追加到Thread中，并重新执行
+                        run = self._run_message(thread=recipient_thread, 
+                                                     message=wapper_output, 
+                                                     agent=recipient_agent, 
+                                                     attachments=attachments,
+                                                     event_handler=stream_handler,
+                                                     deadline=deadline,
+                                                     cancel_token=cancel_token)
                     
-            # error
-            elif run.status == "failed":
-                logger.info("Run Failed. Error: ", run.last_error)
+                # error
+                elif run.status == "failed":
+                    logger.info(f"Run Failed. Error: {run.last_error}")
+                    if dispatcher:
+                        dispatcher.close() # 失败run中提前启动的调用不会被提交
+                    if run.last_error and run.last_error.code == "rate_limit_exceeded":
+                        self.limiter.on_throttle(recipient_agent.model)
               
-                if self.allowed_fails > 0:
-                    time.sleep(5)
-                    logger.info(f"Retry run the thread:[{recipient_thread.thread_id}] on assistant:[{recipient_agent.id}] ... ")
-                    run = self._run(recipient_thread, recipient_agent) # try again.
-                    self.allowed_fails -= 1
-                else:
-                    raise Exception("Run Failed. Error: ", run.last_error)
-            elif run.status == "expired":
-                logger.info("Run expired. Error: ", run.last_error)
-                #yield MessageOutput("system","","",f"Run expired. Error: {run.last_error}")
-
-                if self.allowed_fails > 0:
-                    time.sleep(5)
-                    logger.info(f"Retry run the thread:[{recipient_thread.thread_id}] on assistant:[{recipient_agent.id}] ... ")
-                    run = self._run(recipient_thread, recipient_agent) # try again.
-                    self.allowed_fails -= 1
+                    if deadline and deadline.expired():
+                        return self._partial_result(run, recipient_thread, recipient_agent)
+                    if self.allowed_fails > 0:
+                        time.sleep(self.limiter.backoff(recipient_agent.model))
+                        logger.info(f"Retry run the thread:[{recipient_thread.thread_id}] on assistant:[{recipient_agent.id}] ... ")
+                        run = self._run(recipient_thread, recipient_agent) # try again.
+                        self.allowed_fails -= 1
+                    else:
+                        raise Exception("Run Failed. Error: ", run.last_error)
+                elif run.status == "expired":
+                    logger.info(f"Run expired. Error: {run.last_error}")
+                    if dispatcher:
+                        dispatcher.close()
+                    #yield MessageOutput("system","","",f"Run expired. Error: {run.last_error}")
+
+                    if deadline and deadline.expired():
+                        return self._partial_result(run, recipient_thread, recipient_agent)
+                    if self.allowed_fails > 0:
+                        time.sleep(self.limiter.backoff(recipient_agent.model))
+                        logger.info(f"Retry run the thread:[{recipient_thread.thread_id}] on assistant:[{recipient_agent.id}] ... ")
+                        run = self._run(recipient_thread, recipient_agent) # try again.
+                        self.allowed_fails -= 1
+                    else:
+                        raise Exception("Run Failed. Error: ", run.last_error)
+                # return assistant message
                 else:
-                    raise Exception("Run Failed. Error: ", run.last_error)
-            # return assistant message
-            else:
-                full_message += self._get_last_message_text(
-                                recipient_thread=recipient_thread)
+                    full_message += self._get_last_message_text(
+                                    recipient_thread=recipient_thread, run=run)
 
-                if yield_messages:
-                    yield MessageOutput("response_text", recipient_agent.name, self.caller_agent.name, message)
+                    if yield_messages:
+                        yield MessageOutput("response_text", recipient_agent.name, self.caller_agent.name, message)
+
+                    # 新版在这里对agent的回复加入了自动检查机制
 
-                # 新版在这里对agent的回复加入了自动检查机制
+                    return full_message
+        finally:
+            if dispatcher:
+                dispatcher.close()
+            if cancel_token:
+                cancel_token.unregister(handle)
 
-                return full_message
 
+    def _dispatches_early(self, tool_call, recipient_agent: Agent) -> bool:
+        """Tools that stream themselves (SendMessage) wait for requires_action, their events would interleave."""
+        func = next((func for func in recipient_agent.functions if func.__name__ == tool_call.function.name), None)
+        return func is not None and func.early_dispatch
 
-    def _run_util_done(self,run:Run,recipient_thread: Thread)->Run:
+    def _run_tool_call(self,
+                       tool_call,
+                       recipient_thread: Thread,
+                       recipient_agent: Agent,
+                       event_handler: type(AgencyEventHandler) = None,
+                       yield_messages=True,
+                       deadline: Deadline = None,
+                       cancel_token: CancellationToken = None):
+        """Executes one tool call of the recipient, yielding its MessageOutputs, and returns the tool output."""
+        if yield_messages:
+            yield MessageOutput("function", recipient_agent.name, self.caller_agent.name,
+                                str(tool_call.function))
+
+        # TODO:这里如果是SendMessage函数，后续会采用创建新Python线程来执行，需要修改处理逻辑。
+        output = self._execute_tool(tool_call=tool_call, 
+                                    caller_thread=recipient_thread,
+                                    event_handler=event_handler,
+                                    recipient_agent=recipient_agent,
+                                    deadline=deadline,
+                                    cancel_token=cancel_token)
+        if inspect.isgenerator(output):
+            try:
+                while True:
+                    item = next(output) 
+                    if isinstance(item, MessageOutput) and yield_messages:
+                        yield item
+            except StopIteration as e:
+                output = e.value    
+            except Exception as e:
+                logger.info(f"Exception{inspect.currentframe().f_code.co_name}：{str(e)}")
+                raise e
+        else:
+            if yield_messages:
+                yield MessageOutput("function_output", tool_call.function.name, self.recipient_agent.name,
+                                    output)
+        return self._limit_tool_output(tool_call.function.name, str(output), recipient_agent)
+
+    def _limit_tool_output(self, name: str, output: str, recipient_agent: Agent) -> str:
+        """Applies the ToolOutputPolicy of the tool (or of the agent) to an output and records its size."""
+        func = next((func for func in recipient_agent.functions if func.__name__ == name), None)
+        policy = func.output_policy if func is not None and func.output_policy is not None \
+            else recipient_agent.tool_output_policy
+        store = get_tool_output_store()
+        submitted = policy.apply(name, output, store) if policy else output
+        store.record(name, len(output), len(submitted))
+        return submitted
+
+    def _run_util_done(self,run:Run,recipient_thread: Thread,deadline: Deadline=None,
+                       cancel_token: CancellationToken=None)->Run:
         while run.status in ['queued', 'in_progress']:
-            time.sleep(5)
-            run = self.client.beta.threads.runs.retrieve(
-                thread_id=recipient_thread.thread_id,
-                run_id=run.id
-            )
+            if recipient_thread.lease:
+                recipient_thread.lease.heartbeat()
+            if deadline and deadline.expired():
+                return self._cancel_run(run, recipient_thread)
+            interval = min(self.poll_interval, deadline.remaining()) if deadline else self.poll_interval
+            if cancel_token:
+                if cancel_token.wait(interval): # 被取消时立即返回，由调用方处理
+                    return run
+            else:
+                time.sleep(interval)
+            run = self.limiter.call(run.model, self.client.beta.threads.runs.retrieve,
+                                    thread_id=recipient_thread.thread_id,
+                                    run_id=run.id)
             logger.info(f"Run [{run.id}] Status: {run.status}") 
         return run
+
+    def _cancel_run(self, run:Run, recipient_thread: Thread)->Run:
+        logger.info(f"Cancel run [{run.id}] on thread [{recipient_thread.thread_id}]")
+        try:
+            return self.limiter.call(run.model, self.client.beta.threads.runs.cancel,
+                                     thread_id=run.thread_id,
+                                     run_id=run.id)
+        except Exception as e: # 例如run已经结束，无法取消
+            logger.info(f"Exception{inspect.currentframe().f_code.co_name}：{str(e)}")
+            return run
+
+    def _cancel_active_run(self, active: dict, recipient_thread: Thread):
+        run = active.get("run")
+        if run and run.status in ("queued", "in_progress", "requires_action") and active.get("cancelled") != run.id:
+            active["cancelled"] = run.id
+            self._cancel_run(run, recipient_thread)
+
+    def _stop_stream(self, stream, recipient_thread: Thread):
+        if stream.current_run:
+            self._cancel_run(stream.current_run, recipient_thread)
+        stream.close() # 中断正在消费stream的线程
+
+    def _consume_stream(self, stream, recipient_thread: Thread, deadline: Deadline=None,
+                        cancel_token: CancellationToken=None)->Run:
+        handle = cancel_token.register(lambda: self._stop_stream(stream, recipient_thread)) if cancel_token else None
+        try:
+            for _ in stream:
+                if not recipient_thread.created and stream.current_run: # threads.create_and_run创建的thread
+                    recipient_thread.mark_created(stream.current_run.thread_id)
+                if deadline and deadline.expired() and stream.current_run:
+                    return self._cancel_run(stream.current_run, recipient_thread)
+        except Exception:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            if cancel_token:
+                cancel_token.unregister(handle)
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        run = stream.get_final_run()
+        self._keep_streamed_reply(stream, run, recipient_thread)
+        return run
+
+    @staticmethod
+    def _keep_streamed_reply(stream, run: Run, recipient_thread: Thread):
+        """Keeps the reply the stream already delivered, so that _get_last_message_text does not list it again."""
+        try:
+            messages = [message for message in stream.get_final_messages()
+                        if message.run_id == run.id and message.role == "assistant" and message.content]
+        except RuntimeError: # no message in this stream
+            messages = []
+        if messages and messages[-1].content[0].type == "text":
+            recipient_thread.streamed_reply = (run.id, messages[-1].content[0].text.value)
+
+    def _partial_result(self, run:Run, recipient_thread: Thread, recipient_agent: Agent, tool_outputs=None)->str:
+        """
+        Collects what the recipient produced before its run was stopped: the assistant message of the run, if any,
+        otherwise the outputs of the tools it already executed.
+        """
+        messages = self.limiter.call(None, self.client.beta.threads.messages.list,
+                                     thread_id=recipient_thread.thread_id,
+                                     limit=1)
+        partial = ""
+        if messages.data and messages.data[0].run_id == run.id and messages.data[0].content:
+            partial = messages.data[0].content[0].text.value
+        elif tool_outputs:
+            partial = str(tool_outputs)
+
+        return self._format_partial_result(recipient_agent, run.status, partial)
+
+    @staticmethod
+    def _format_partial_result(recipient_agent: Agent, status: str, partial: str) -> str:
+        return f"[{recipient_agent.name} ran out of time and was stopped (run status: {status}). " \
+               f"Partial result follows, it may be incomplete.]\n{partial}"
         
     def _submit_tool_outputs(self, 
                              run:Run,
                              recipient_thread: Thread, 
                              tool_outputs,
-                             event_handler: type(AgencyEventHandler))->Run:
+                             event_handler: type(AgencyEventHandler),
+                             deadline: Deadline=None,
+                             cancel_token: CancellationToken=None)->Run:
         if event_handler:
-            with self.client.beta.threads.runs.submit_tool_outputs_stream(
+            # 限流槽位只覆盖开启stream的请求，消费事件时已释放
+            with self.limiter.stream(run.model, self.client.beta.threads.runs.submit_tool_outputs_stream(
                     thread_id=recipient_thread.thread_id,
                     run_id=run.id,
                     tool_outputs=tool_outputs,
-                    event_handler=event_handler()
-            ) as stream:
-                stream.until_done()
-                run = stream.get_final_run()
-        else:
-            run = self.client.beta.threads.runs.submit_tool_outputs(
-                thread_id=recipient_thread.thread_id,
-                run_id=run.id,
-                tool_outputs=tool_outputs
-            )
-        return run
-
-    def _get_last_message_text(self,recipient_thread: Thread):
-        messages = self.client.beta.threads.messages.list(
-            thread_id=recipient_thread.thread_id,
-            limit=1
-        )
+                    event_handler=event_handler())) as stream:
+                return self._consume_stream(stream, recipient_thread, deadline, cancel_token)
+
+        return self.limiter.call(run.model, self.client.beta.threads.runs.submit_tool_outputs,
+                                 thread_id=recipient_thread.thread_id,
+                                 run_id=run.id,
+                                 tool_outputs=tool_outputs)
+
+    def _get_last_message_text(self,recipient_thread: Thread, run: Run=None):
+        streamed = recipient_thread.streamed_reply
+        if run and streamed and streamed[0] == run.id:
+            recipient_thread.streamed_reply = None
+            return streamed[1]
+        messages = self.limiter.call(None, self.client.beta.threads.messages.list,
+                                     thread_id=recipient_thread.thread_id,
+                                     limit=1)
 
         if len(messages.data) == 0 or len(messages.data[0].content) == 0:
             return ""
@@ -306,36 +656,45 @@ class Session:
                      message:str, 
                      agent:Agent,
                      attachments: Optional[List[dict]]=None,
-                     event_handler: type(AgencyEventHandler) = None)->Run:
-        # create message
-        self.client.beta.threads.messages.create(
-            thread_id=thread.thread_id,
-            role="user",
-            content=message,
-            attachments=attachments,
-        )
-        # create run
+                     event_handler: type(AgencyEventHandler) = None,
+                     deadline: Deadline = None,
+                     cancel_token: CancellationToken = None)->Run:
+        # 消息随run一起提交(additional_messages)，尚未创建的thread由threads.create_and_run一并创建
+        new_message = {"role": "user", "content": message, "attachments": attachments}
         if event_handler:
-            with self.client.beta.threads.runs.stream(
-                    thread_id=thread.thread_id,
-                    event_handler=event_handler(),
-                    assistant_id=agent.id
-            ) as stream:
-                stream.until_done()
-                run = stream.get_final_run()
+            create_stream = self.client.beta.threads.runs.stream if thread.created \
+                else self.client.beta.threads.create_and_run_stream
+            with self.limiter.stream(agent.model, create_stream(event_handler=event_handler(),
+                                                                **self._run_request(thread, agent, new_message))) as stream:
+                run = self._consume_stream(stream, thread, deadline, cancel_token)
+        elif deadline or cancel_token:
+            # polled by _run_util_done, which stops polling once the deadline is exceeded or the request is cancelled
+            run = self._run(thread, agent, new_message)
         else:
-            run = self.client.beta.threads.runs.create_and_poll(
-                thread_id=thread.thread_id,
-                assistant_id=agent.id,
-            )
+            create_and_poll = self.client.beta.threads.runs.create_and_poll if thread.created \
+                else self.client.beta.threads.create_and_run_poll
+            run = self.limiter.call(agent.model, create_and_poll, **self._run_request(thread, agent, new_message))
+        if not thread.created:
+            thread.mark_created(run.thread_id)
         return run
     
-    def _run(self, thread:Thread, agent:Agent):
-        run = self.client.beta.threads.runs.create(
-            thread_id=thread.thread_id,
-            assistant_id=agent.id,
-        )
+    def _run(self, thread:Thread, agent:Agent, new_message: dict=None):
+        create = self.client.beta.threads.runs.create if thread.created else self.client.beta.threads.create_and_run
+        run = self.limiter.call(agent.model, create, **self._run_request(thread, agent, new_message))
+        if not thread.created:
+            thread.mark_created(run.thread_id)
         return run
+
+    def _run_request(self, thread: Thread, agent: Agent, new_message: dict=None) -> dict:
+        """Arguments of the call creating a run on the thread, adding new_message to the thread first."""
+        request = dict(assistant_id=agent.id, **self._run_params(agent))
+        if not thread.created:
+            request["thread"] = {"messages": thread.pending_messages + ([new_message] if new_message else [])}
+        else:
+            request["thread_id"] = thread.thread_id
+            if new_message:
+                request["additional_messages"] = [new_message]
+        return request
     
     def _retrieve_thread_of_topic(self, message:str) -> Thread:
         classifier_instruction = """
@@ -349,14 +708,15 @@ class Session:
         Must not include any characters other than json in the output.
         """    
 
+        threads = self._candidate_threads()
         sessions_decription = ""
-        for index, thread in enumerate(self.recipient_agent.threads, start=1):
+        for index, thread in enumerate(threads, start=1):
             sessions_decription += f"### Description of Session {index}:\n{thread.task_description}\n\n"
             
         if not sessions_decription:
             return None
         
-        completion = self.client.chat.completions.create(
+        completion = self.limiter.call("gpt-3.5-turbo-16k", self.client.chat.completions.create,
             model="gpt-3.5-turbo-16k",  #这里要换模型吗？
             messages=[
                 {"role": "system", "content": classifier_instruction},
@@ -370,7 +730,7 @@ class Session:
             caller_name = "User"
         else:
             caller_name = self.caller_agent.name
-        log_header = f"retrieve one from {len(self.recipient_agent.threads)} sessions that {caller_name} → {self.recipient_agent.name}...\n"
+        log_header = f"retrieve one from {len(threads)} sessions that {caller_name} → {self.recipient_agent.name}...\n"
         logger.info(log_header + response)
         
         thread_json = json.loads(response)
@@ -378,7 +738,7 @@ class Session:
         if session_id <= 0:
             return None
         else:
-            return self.recipient_agent.threads[session_id - 1]
+            return threads[session_id - 1]
                 
     def _update_task_description(self, thread:Thread, new_history:str):
         # Generate the description of this session at this state. 
@@ -413,7 +773,7 @@ class Session:
         message += f"\n ### Recent Task Session History:\n{new_history}"
 
         
-        completion = self.client.chat.completions.create(
+        completion = self.limiter.call("gpt-4-1106-preview", self.client.chat.completions.create,
             model="gpt-4-1106-preview",
             messages=[
                 {"role": "system", "content": instruction},
@@ -434,7 +794,9 @@ class Session:
     def _execute_tool(self, tool_call, 
                       caller_thread:Thread,
                       event_handler,
-                      recipient_agent:Agent):
+                      recipient_agent:Agent,
+                      deadline: Deadline=None,
+                      cancel_token: CancellationToken=None):
         if not recipient_agent:
             recipient_agent= self.recipient_agent
 
@@ -444,15 +806,34 @@ class Session:
         if not func:
             return f"Error: Function {tool_call.function.name} not found. Available functions: {[func.__name__ for func in funcs]}"
 
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+
         try:
             # init tool
             func = func(**eval(tool_call.function.arguments))
             func.caller_agent = recipient_agent # 在这里设置caller_agent
             func.event_handler = event_handler
+            func.deadline = deadline.shrink() if deadline else None # 每一跳都缩短下游的时间预算
+            func.cancel_token = cancel_token
+
+            cache = get_tool_cache()
+            if func.cacheable:
+                hit, output = cache.get(func)
+                if hit:
+                    return output
             # get outputs from the tool
-            output = func.run(caller_thread) #如果这里的func是SendMessage，这个run就会对应这个类的run方法，见agency.py/_create_send_message_tool()/run()
+            try:
+                #如果这里的func是SendMessage，这个run就会对应这个类的run方法，见agency.py/_create_send_message_tool()/run()
+                output = get_tool_executor().run(func, caller_thread)
+            finally:
+                func.invalidate_cache(cache)
+            if func.cacheable and not inspect.isgenerator(output):
+                cache.put(func, output)
 
             return output
+        except RequestCancelled:
+            raise
         except Exception as e:
             error_message = f"Error: {e}"
             if "For further information visit" in error_message:
@@ -0,0 +1,63 @@
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Generator, Optional
+
+
+class EarlyToolDispatcher:
+    """
+    Starts the tool calls of a streamed run as soon as their arguments are complete (on_tool_call_done), while the
+    model is still generating the remaining calls of the step.
+
+    The calls run one after the other on a worker thread, in the order the model emitted them, as they would once
+    the run reaches `requires_action`. What `run_tool_call(tool_call)` yields (MessageOutputs) and returns is
+    buffered until the session collects it with `pop` and submits the outputs of the step together.
+
+    Sessions only use it when `Session.early_tool_dispatch` is turned on, and never for tools declaring
+    `early_dispatch = False` such as SendMessage, whose nested stream would interleave with the stream of the run.
+    """
+
+    def __init__(self, run_tool_call: Callable[[object], Generator]):
+        self.run_tool_call = run_tool_call
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def dispatch(self, tool_call):
+        with self._lock:
+            if tool_call.id in self._futures:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="early_tool_dispatch")
+            # the worker runs in the context of the hop, e.g. for the API call audit
+            self._futures[tool_call.id] = self._executor.submit(contextvars.copy_context().run, self._collect,
+                                                                tool_call)
+
+    def pop(self, tool_call_id: str) -> Optional[Future]:
+        """Returns the future of a dispatched call, resolving to (yielded items, output), or None."""
+        with self._lock:
+            return self._futures.pop(tool_call_id, None)
+
+    def close(self):
+        """
+        Drops the calls that have not started and waits for the running one, so that no call outlives the run that
+        requested it when the run fails or the stream is closed (the call has the hop's deadline and cancel token).
+        Later calls start a new worker.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for future in futures:
+            future.cancel()     # no-op for the running call
+        if executor:
+            executor.shutdown(wait=True)
+
+    def _collect(self, tool_call):
+        items = []
+        output = self.run_tool_call(tool_call)
+        try:
+            while True:
+                items.append(next(output))
+        except StopIteration as e:
+            return items, e.value
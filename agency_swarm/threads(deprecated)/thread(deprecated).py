@@ -27,7 +27,7 @@ class Thread_deprecated:
                 self.id = self.thread.id
             # Determine the sender's name based on the agent type
             sender_name = "user" if isinstance(self.agent, User) else self.agent.name
-            playground_url = f'https://platform.openai.com/playground?assistant={self.recipient_agent._assistant.id}&mode=assistant&thread={self.thread.id}'
+            playground_url = f'https://platform.openai.com/playground?assistant={self.recipient_agent.id}&mode=assistant&thread={self.thread.id}'
             print(f'THREAD:[ {sender_name} -> {self.recipient_agent.name} ]: URL {playground_url}')
 
         # send message
@@ -1,3 +1,5 @@
 from .thread import Thread
 from .thread import ThreadStatus
-from .thread import ThreadProperty
\ No newline at end of file
+from .thread import ThreadProperty
+from .thread_lock import ThreadLease, ThreadLockManager, get_thread_lock_manager, set_thread_lock_manager
+from .local_thread import LocalThread
@@ -0,0 +1,51 @@
+import copy
+import uuid
+from typing import List
+
+from agency_swarm.threads.thread import Thread, ThreadStatus
+
+
+class LocalThread(Thread):
+    """
+    A Thread whose history is kept in memory as chat completion messages instead of on the Assistants API. It is
+    used by ChatCompletionSession and creating or copying it costs no API call.
+    """
+    def __init__(self, thread_id: str=None, copy_from: 'LocalThread'=None, messages: List[dict]=None):
+        super().__init__(lazy=True)     # lazy: no OpenAI thread is created
+        self.thread_id: str = thread_id or f"local_thread_{uuid.uuid4().hex[:24]}"
+        self.pending_messages = None
+        self.messages: List[dict] = list(messages or [])    # chat completion messages, without the system message
+
+        if copy_from is not None:
+            self.copy_thread(src=copy_from)
+
+    def copy_thread(self, src: 'LocalThread'):
+        self.instruction = src.instruction
+        self.in_message_chain = src.in_message_chain
+        self.owner = src.owner
+        self.status = ThreadStatus.Ready
+        self.properties = src.properties
+        self.task_description = src.task_description
+        self.token_estimate = src.token_estimate
+        self.token_growth = list(src.token_growth)
+        self.compactions = src.compactions
+        self.messages = copy.deepcopy(src.messages)
+
+    def add_message(self, message: dict):
+        self.messages.append(message)
+
+    def answer_dangling_tool_calls(self, content: str):
+        """
+        Answers the tool calls of the last assistant message that got no output (the hop was stopped while executing
+        them), chat completions reject a history with unanswered tool calls.
+        """
+        answered = set()
+        for message in reversed(self.messages):
+            if message["role"] == "tool":
+                answered.add(message["tool_call_id"])
+                continue
+            if message["role"] == "assistant":
+                for call in message.get("tool_calls") or []:
+                    if call["id"] not in answered:
+                        self.add_message({"role": "tool", "tool_call_id": call["id"], "content": content})
+            return
@@ -1,8 +1,8 @@
-from litellm import SyncCursorPage
 from openai.resources.beta.threads.messages import Message
 from agency_swarm.util.oai import get_openai_client
+from agency_swarm.util.concurrency import get_concurrency_limiter
 from openai.types.beta.thread_create_params import Message as MessageParams
-from typing import Iterable
+from typing import Iterable, List
 from enum import Enum
 
 class ThreadStatus(Enum):
@@ -15,29 +15,60 @@ class ThreadProperty(Enum):
     CoW = "Copy on Write" # 语言模型正在调用函数
 
 class Thread:
-    def __init__(self, thread_id: str=None, copy_from:'Thread' =None):
+    def __init__(self, thread_id: str=None, copy_from:'Thread' =None, messages: Iterable[MessageParams]=None,
+                 lazy: bool=False):
+        """
+        Parameters:
+        thread_id (str, optional): Id of an existing OpenAI thread.
+        copy_from (Thread, optional): Thread whose messages are copied into the new thread.
+        messages (Iterable[MessageParams], optional): Initial messages of the new thread.
+        lazy (bool, optional): Do not create the OpenAI thread now. It is created together with its first run
+            (threads.create_and_run, see Session._run_message), with `pending_messages` as initial messages.
+        """
         self.client = get_openai_client()
+        self.limiter = get_concurrency_limiter()
         self.thread_id: str = thread_id
         self.openai_thread = None
         self.instruction: str = None
         self.in_message_chain: str = None
+        self.owner = None                 # 创建该thread的用户(User.uuid)，用于多用户之间的隔离
         self.status: ThreadStatus = ThreadStatus.Ready
         self.properties: ThreadProperty = ThreadProperty.Persist
-        # self.sessions = {}                # eg: {"recipient agent name", session}
+        self.sessions = {}                # eg: {"recipient agent name", session}
         self.session_as_sender = None     # 用于python线程异常挂掉后的处理
         self.session_as_recipient = None  # 用于python线程异常挂掉后的处理
+        self.lease = None                 # 当前持有该thread的ThreadLease，见thread_lock.py
         self.task_description = ""
+        self.token_estimate = 0           # 本地估计的thread上下文大小(tokens)
+        self.token_growth = []            # 每次会话后的token_estimate，用于评估上下文预算
+        self.compactions = 0
+        self.pending_messages = None      # 延迟创建的thread的初始消息，创建后为None
+        self.streamed_reply = None        # (run_id, text): stream中已收到的最终回复，省去一次messages.list
         
         if self.thread_id:
-            self.openai_thread = self.client.beta.threads.retrieve(self.thread_id)
+            self.openai_thread = self.limiter.call(None, self.client.beta.threads.retrieve, self.thread_id)
+        elif lazy:
+            self.pending_messages = list(messages or [])
+        elif messages:
+            self.openai_thread = self.limiter.call(None, self.client.beta.threads.create, messages=messages)
+            self.thread_id = self.openai_thread.id
         else:
-            self.openai_thread = self.client.beta.threads.create()
+            self.openai_thread = self.limiter.call(None, self.client.beta.threads.create)
             self.thread_id = self.openai_thread.id
 
         if copy_from is not None:
             # TODO: copy all message from a existed thread
             self.copy_thread(src=copy_from)
 
+    @property
+    def created(self) -> bool:
+        return self.thread_id is not None
+
+    def mark_created(self, thread_id: str):
+        """Records the id of a lazy thread once its first run created it."""
+        self.thread_id = thread_id
+        self.pending_messages = None
+
     def _dump_info(self):
         pass
 
@@ -45,21 +76,41 @@ class Thread:
         self.client = src.client
         self.instruction = src.instruction
         self.in_message_chain = src.in_message_chain
+        self.owner = src.owner
         self.status = ThreadStatus.Ready
         self.properties = src.properties
         self.task_description = src.task_description
+        self.token_estimate = src.token_estimate
+        self.token_growth = list(src.token_growth)
+        self.compactions = src.compactions
 
-        messages = self.client.beta.threads.messages.list(thread_id=src.thread_id, limit=100)
-        tool_resources = self.client.beta.threads.retrieve(self.thread_id).tool_resources
+        if src.created:
+            messages = list(self.convert_messages(src.list_messages()))
+        else:
+            messages = list(src.pending_messages or [])   # 源thread还未在服务端创建
+        if not self.created:
+            self.pending_messages = messages
+            return
+        tool_resources = self.limiter.call(None, self.client.beta.threads.retrieve, self.thread_id).tool_resources
 
-        self.openai_thread = self.client.beta.threads.create(
-            messages=self.convert_messages(messages.data),
-            tool_resources=tool_resources,
-        )
+        self.openai_thread = self.limiter.call(None, self.client.beta.threads.create,
+                                               messages=messages,
+                                               tool_resources=tool_resources)
         self.thread_id = self.openai_thread.id
 
+    def list_messages(self) -> List[Message]:
+        """Returns all the messages of the thread, oldest first, fetching them page by page."""
+        messages, after = [], {}
+        while True:
+            page = self.limiter.call(None, self.client.beta.threads.messages.list,
+                                     thread_id=self.thread_id, limit=100, order="asc", **after)
+            messages += page.data
+            if not page.data or not getattr(page, "has_more", True):
+                return messages
+            after = {"after": page.data[-1].id}
+
     def convert_messages(self, messages: list[Message]) -> Iterable[MessageParams]:
-        for message in messages[::-1]:
+        for message in messages:
             for content in message.content:
                 yield MessageParams(
                     content=content.text.value,
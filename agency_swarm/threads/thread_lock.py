@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from agency_swarm.threads.thread import ThreadStatus
+from agency_swarm.util.log_config import setup_logging
+
+logger = setup_logging()
+
+
+class ThreadLease:
+    """
+    Exclusive right of one session to use a Thread until `expires_at`. The owner renews it with `heartbeat` while it
+    works on the thread; a heartbeat also renews the lease of the caller's thread (`parent`), which is blocked on the
+    SendMessage call meanwhile.
+    """
+
+    def __init__(self, manager: 'ThreadLockManager', thread, ttl: float, parent: 'ThreadLease' = None):
+        self.manager = manager
+        self.thread = thread
+        self.ttl = ttl
+        self.parent = parent
+        self.owner = threading.current_thread()
+        self.expires_at = time.monotonic() + ttl
+        self.stale = False      # the previous owner died or failed, its runs may still be active on the thread
+        self.released = False
+
+    def heartbeat(self):
+        self.manager._renew(self)
+        if self.parent:
+            self.parent.heartbeat()
+
+    def release(self, clean: bool = True):
+        self.manager.release(self, clean)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def __repr__(self):
+        return f"ThreadLease(thread={self.thread.thread_id}, owner={self.owner.name}, " \
+               f"remaining={max(0.0, self.expires_at - time.monotonic()):.1f}s)"
+
+
+class _Waiter:
+    def __init__(self, parent: ThreadLease):
+        self.parent = parent
+        self.owner = threading.current_thread()
+        self.event = threading.Event()
+        self.lease: Optional[ThreadLease] = None
+
+
+class ThreadLockManager:
+    """
+    Hands out leases on Thread objects. A thread has at most one live lease; `acquire` on a thread with a live lease
+    fails (contention), either right away or after waiting in the thread's FIFO queue for up to `timeout` seconds.
+    A released lease is handed over to the first waiter. A lease whose owner stopped heartbeating (expired) or whose
+    owner Python thread died is reclaimed by the next `acquire`, so a thread is never leaked by a crashed request.
+    """
+
+    def __init__(self, lease_ttl: float = 600.0):
+        """
+        Parameters:
+        lease_ttl (float, optional): Seconds a lease lives without a heartbeat. Defaults to 600, the time after which
+            the Assistants API expires a run anyway.
+        """
+        self.lease_ttl = lease_ttl
+        self._lock = threading.Lock()
+        # keyed by id() of the Thread objects: a thread created lazily has no thread_id before its first run
+        self._leases: Dict[int, ThreadLease] = {}
+        self._dirty: Dict[int, object] = {}  # threads released after a failure, the next owner has to clean them up
+        self._waiters: Dict[int, Deque[_Waiter]] = {}
+
+        # metrics
+        self.acquired = 0
+        self.contended = 0
+        self.reclaimed = 0
+        self.released = 0
+        self.queued = 0
+        self.handed_over = 0
+        self.wait_timeouts = 0
+        self.wait_time = 0.0
+        self.forks = 0
+        self.rejected = 0
+
+    def acquire(self, thread, parent: ThreadLease = None, timeout: float = 0) -> Optional[ThreadLease]:
+        """
+        Returns a lease on the thread. If another owner holds a live lease on it, waits in the thread's FIFO queue
+        for up to timeout seconds and returns None if the lease was not handed over in time.
+        """
+        with self._lock:
+            current = self._leases.get(id(thread))
+            if current and self._is_dead(current):
+                self._reclaim(current)
+                self._hand_over(thread)
+                current = self._leases.get(id(thread))
+            if not current:
+                return self._grant(thread, parent, threading.current_thread())
+
+            self.contended += 1
+            # never wait for a thread held by our own SendMessage chain, it is only freed after we return
+            if timeout <= 0 or self._is_ancestor(current, parent):
+                return None
+            waiter = _Waiter(parent)
+            self._waiters.setdefault(id(thread), deque()).append(waiter)
+            self.queued += 1
+
+        started = time.monotonic()
+        while not waiter.event.wait(min(1.0, max(0.0, started + timeout - time.monotonic()))):
+            with self._lock:
+                if waiter.lease:
+                    break
+                current = self._leases.get(id(thread))
+                if current and self._is_dead(current):
+                    self._reclaim(current)
+                    self._hand_over(thread)
+                    continue
+                if time.monotonic() - started >= timeout:
+                    self._waiters[id(thread)].remove(waiter)
+                    self.wait_timeouts += 1
+                    self.wait_time += time.monotonic() - started
+                    return None
+
+        with self._lock:
+            self.wait_time += time.monotonic() - started
+        return waiter.lease
+
+    def release(self, lease: ThreadLease, clean: bool = True):
+        """
+        Releases the lease, handing the thread over to the first waiter if there is one. A release with clean=False
+        (the owner failed) marks the thread so that the next owner cancels runs the failed owner may have left active.
+        """
+        with self._lock:
+            if lease.released or self._leases.get(id(lease.thread)) is not lease:
+                return  # the lease was reclaimed in the meantime
+            lease.released = True
+            del self._leases[id(lease.thread)]
+            if not clean:
+                self._dirty[id(lease.thread)] = lease.thread
+            self.released += 1
+
+            lease.thread.lease = None
+            lease.thread.status = ThreadStatus.Ready
+            self._hand_over(lease.thread)
+
+    def record_fork(self):
+        with self._lock:
+            self.forks += 1
+
+    def record_reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def _grant(self, thread, parent: Optional[ThreadLease], owner: threading.Thread) -> ThreadLease:
+        lease = ThreadLease(self, thread, self.lease_ttl, parent)
+        lease.owner = owner
+        lease.stale = id(thread) in self._dirty
+        self._leases[id(thread)] = lease
+        self._dirty.pop(id(thread), None)
+        self.acquired += 1
+
+        thread.lease = lease
+        thread.status = ThreadStatus.Running
+        return lease
+
+    def _hand_over(self, thread):
+        waiters = self._waiters.get(id(thread))
+        if not waiters or id(thread) in self._leases:
+            return
+        waiter = waiters.popleft()
+        if not waiters:
+            del self._waiters[id(thread)]
+        waiter.lease = self._grant(thread, waiter.parent, waiter.owner)
+        self.handed_over += 1
+        waiter.event.set()
+
+    def _reclaim(self, lease: ThreadLease):
+        logger.info(f"Reclaim THREAD:{lease.thread.thread_id} from dead lease {lease}")
+        lease.released = True
+        del self._leases[id(lease.thread)]
+        self._dirty[id(lease.thread)] = lease.thread
+        self.reclaimed += 1
+
+    @staticmethod
+    def _is_ancestor(lease: Optional[ThreadLease], parent: Optional[ThreadLease]) -> bool:
+        while parent is not None:
+            if parent is lease:
+                return True
+            parent = parent.parent
+        return False
+
+    def reclaim_dead(self) -> int:
+        """Reclaims every dead lease at once, returns how many were reclaimed."""
+        with self._lock:
+            dead = [lease for lease in self._leases.values() if self._is_dead(lease)]
+            for lease in dead:
+                self._reclaim(lease)
+                lease.thread.lease = None
+                lease.thread.status = ThreadStatus.Ready
+                self._hand_over(lease.thread)
+        return len(dead)
+
+    def _renew(self, lease: ThreadLease):
+        with self._lock:
+            if not lease.released:
+                lease.expires_at = time.monotonic() + lease.ttl
+
+    @staticmethod
+    def _is_dead(lease: ThreadLease) -> bool:
+        return lease.expired() or not lease.owner.is_alive()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"active": len(self._leases),
+                    "acquired": self.acquired,
+                    "contended": self.contended,
+                    "reclaimed": self.reclaimed,
+                    "released": self.released,
+                    "queued": self.queued,
+                    "handed_over": self.handed_over,
+                    "wait_timeouts": self.wait_timeouts,
+                    "wait_time": round(self.wait_time, 3),
+                    "forks": self.forks,
+                    "rejected": self.rejected}
+
+
+lock_manager_lock = threading.Lock()
+lock_manager = None
+
+
+def get_thread_lock_manager() -> ThreadLockManager:
+    global lock_manager
+    with lock_manager_lock:
+        if lock_manager is None:
+            lock_manager = ThreadLockManager()
+    return lock_manager
+
+
+def set_thread_lock_manager(new_lock_manager: ThreadLockManager):
+    global lock_manager
+    with lock_manager_lock:
+        lock_manager = new_lock_manager
@@ -1,9 +1,12 @@
+import json
 from abc import ABC, abstractmethod
-from typing import Optional, Any
+from typing import Optional, Any, ClassVar, Dict, List
 
 from instructor import OpenAISchema
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
+
+from ..util.tool_resources import ToolResource
 
 
 class BaseTool(OpenAISchema, ABC):
@@ -11,6 +14,28 @@ class BaseTool(OpenAISchema, ABC):
         None, description="The agent that called this tool. Please ignore this field."
     )
     event_handler: Any = None
+    deadline: Any = None
+    cancel_token: Any = None
+    _resources: dict = PrivateAttr(default_factory=dict)  # ToolResource -> instance lent to this call
+
+    # 工具结果缓存的声明，见util/tool_cache.py
+    cacheable: ClassVar[bool] = False  # run() is idempotent: the same arguments give the same result
+    cache_ttl: ClassVar[Optional[float]] = None  # seconds a cached result stays valid, None: the cache default
+    cache_key_fields: ClassVar[Optional[List[str]]] = None  # arguments identifying a result, None: all of them
+    invalidates: ClassVar[List[str]] = []  # cacheable tools whose results are stale after this tool ran
+    cache_namespace: ClassVar[Optional[str]] = None  # tells apart tool classes of the same name, e.g. OpenAPI tools
+    output_policy: ClassVar[Any] = None  # ToolOutputPolicy of the outputs, None: the policy of the agent
+
+    # 工具的执行方式，见util/tool_executor.py
+    # tools with an `async def run` are run on the event loop shared by the async tools instead
+    execution: ClassVar[str] = "inline"  # "inline", "thread" or "process" (CPU-bound tools)
+    execution_timeout: ClassVar[Optional[float]] = None  # seconds, "thread", "process" and async tools only
+    early_dispatch: ClassVar[bool] = True  # may start before requires_action in a streamed run, False: it streams too
+
+    # 工具的并发限制，由ToolExecutor在所有会话之间执行
+    concurrency_group: ClassVar[Optional[str]] = None  # tools sharing max_concurrency, None: the tool class alone
+    max_concurrency: ClassVar[Optional[int]] = None  # calls of the group running at once, 1: exclusive, None: no limit
+    resource_key_fields: ClassVar[List[str]] = []  # arguments naming the resources a call uses exclusively, e.g. a path
 
     @classmethod
     @property
@@ -21,6 +46,8 @@ class BaseTool(OpenAISchema, ABC):
         properties = schema.get("parameters", {}).get("properties", {})
         properties.pop("caller_agent", None)
         properties.pop("event_handler", None)
+        properties.pop("deadline", None)
+        properties.pop("cancel_token", None)
         properties.pop("caller_agent_name", None)
 
         # If 'caller_agent' is in the required list, remove it
@@ -29,6 +56,10 @@ class BaseTool(OpenAISchema, ABC):
             required.remove("caller_agent")
         if "event_handler" in required:
             required.remove("event_handler")
+        if "deadline" in required:
+            required.remove("deadline")
+        if "cancel_token" in required:
+            required.remove("cancel_token")
         if "caller_agent_name" in required:
             required.remove("caller_agent_name")
 
@@ -42,3 +73,45 @@ class BaseTool(OpenAISchema, ABC):
     @abstractmethod
     def run(self, **kwargs):
         pass
+
+    @classmethod
+    def startup(cls):
+        """Lifespan hook called once per process before the first call of the tool (see util/tool_resources.py)."""
+        pass
+
+    @classmethod
+    def shutdown(cls):
+        """Lifespan hook called when the tool resources are closed, e.g. when the server or the process stops."""
+        pass
+
+    @classmethod
+    def tool_resources(cls) -> Dict[str, ToolResource]:
+        """The ToolResources declared on the tool class and its bases."""
+        return {name: value for klass in reversed(cls.__mro__) for name, value in vars(klass).items()
+                if isinstance(value, ToolResource)}
+
+    def resource_keys(self) -> List[str]:
+        """Resources this call uses exclusively: calls sharing a key run one at a time, whatever their tool."""
+        keys = []
+        for name in self.resource_key_fields:
+            value = getattr(self, name, None)
+            for item in (value if isinstance(value, (list, tuple, set)) else [value]):
+                if item is not None:
+                    keys.append(str(item))
+        return keys
+
+    def cache_arguments(self) -> dict:
+        """Arguments identifying the result of run() in the tool result cache."""
+        arguments = self.model_dump(mode="json",
+                                    exclude={"caller_agent", "event_handler", "deadline", "cancel_token"})
+        if self.cache_key_fields is not None:
+            arguments = {name: arguments.get(name) for name in self.cache_key_fields}
+        return arguments
+
+    def cache_key(self) -> str:
+        return json.dumps(self.cache_arguments(), sort_keys=True, ensure_ascii=False, default=str)
+
+    def invalidate_cache(self, cache):
+        """Called after run(). Override it to drop only the results this call made stale."""
+        for name in self.invalidates:
+            cache.invalidate(name)
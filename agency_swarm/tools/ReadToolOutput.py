@@ -0,0 +1,25 @@
+from pydantic import Field
+
+from .BaseTool import BaseTool
+from ..util.tool_output import ToolOutputPolicy, get_tool_output_store
+
+
+class ReadToolOutput(BaseTool):
+    """
+    Reads a part of a long tool output that was shortened. Use the handle given in the shortened output and read the
+    omitted part page by page.
+    """
+    output_policy = ToolOutputPolicy(max_chars=None)  # pages are bounded by `limit`
+
+    handle: str = Field(..., description="Handle of the output, starts with 'out_'.")
+    offset: int = Field(0, ge=0, description="Character position to start reading at.")
+    limit: int = Field(4000, ge=1, le=20000, description="Number of characters to read.")
+
+    def run(self, caller_thread=None):
+        store = get_tool_output_store()
+        page = store.read(self.handle, self.offset, self.limit)
+        end = self.offset + len(page)
+        size = store.size(self.handle)
+        if end < size:
+            return page + f"\n[characters {self.offset}-{end} of {size}, continue with offset={end}]"
+        return page + f"\n[characters {self.offset}-{end} of {size}, end of output]"
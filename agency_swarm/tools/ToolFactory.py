@@ -1,4 +1,6 @@
+import hashlib
 import inspect
+import json
 from typing import Any, Dict, List, Type, Union
 
 import jsonref
@@ -7,6 +9,7 @@ from pydantic import create_model, Field
 
 from .BaseTool import BaseTool
 from ..util.schema import reference_schema
+from ..util.tool_executor import get_async_http_client
 
 
 class ToolFactory:
@@ -163,50 +166,34 @@ class ToolFactory:
         return tool
 
     @staticmethod
-    def from_openapi_schema(schema: Union[str, dict], headers: Dict[str, str] = None, params: Dict[str, Any] = None):
+    def from_openapi_schema(schema: Union[str, dict], headers: Dict[str, str] = None, params: Dict[str, Any] = None,
+                            cache_ttl: float = None, use_async: bool = False):
+        """
+        Converts the operations of an OpenAPI schema into BaseTools.
+        :param cache_ttl: if given, GET operations are cacheable and their responses are reused for cache_ttl
+            seconds (see util/tool_cache.py); other operations invalidate them.
+        :param use_async: if True, the tools have an `async def run` sending their requests through the httpx
+            connection pool shared by the async tools (see util/tool_executor.py), instead of one blocking
+            request per tool call.
+        """
+        return ToolFactory.from_openapi_operations(ToolFactory.compile_openapi_schema(schema), headers=headers,
+                                                   params=params, cache_ttl=cache_ttl, use_async=use_async)
+
+    @staticmethod
+    def compile_openapi_schema(schema: Union[str, dict]) -> List[dict]:
+        """
+        Resolves the references of an OpenAPI schema and extracts its operations as plain JSON, so they can be
+        stored in an agency bundle (see util/bundle.py) and turned into tools without parsing the schema again.
+        :return: A list of {"server": str, "path": str, "method": str, "function": dict} operations.
+        """
         if isinstance(schema, dict):
             openapi_spec = schema
             openapi_spec = jsonref.JsonRef.replace_refs(openapi_spec)
         else:
             openapi_spec = jsonref.loads(schema)
-        tools = []
-        headers = headers or {}
-        for path, methods in openapi_spec["paths"].items():
-            for method, spec_with_ref in methods.items():
-                def callback(self):
-                    url = openapi_spec["servers"][0]["url"] + path
-                    parameters = self.model_dump().get('parameters', {})
-                    # replace all parameters in url
-                    for param, value in parameters.items():
-                        if "{" + str(param) + "}" in url:
-                            url = url.replace(f"{{{param}}}", str(value))
-                            parameters[param] = None
-                    url = url.rstrip("/")
-                    parameters = {k: v for k, v in parameters.items() if v is not None}
-                    parameters = {**parameters, **params} if params else parameters
-                    if method == "get":
-                        return requests.get(url, params=parameters, headers=headers,
-                                            json=self.model_dump().get('requestBody', None)
-                                            ).json()
-                    elif method == "post":
-                        return requests.post(url,
-                                             params=parameters,
-                                             json=self.model_dump().get('requestBody', None),
-                                             headers=headers
-                                             ).json()
-                    elif method == "put":
-                        return requests.put(url,
-                                            params=parameters,
-                                            json=self.model_dump().get('requestBody', None),
-                                            headers=headers
-                                            ).json()
-                    elif method == "delete":
-                        return requests.delete(url,
-                                               params=parameters,
-                                               json=self.model_dump().get('requestBody', None),
-                                               headers=headers
-                                               ).json()
-
+        compiled = []
+        for path, operations in openapi_spec["paths"].items():
+            for method, spec_with_ref in operations.items():
                 # 1. Resolve JSON references.
                 spec = jsonref.replace_refs(spec_with_ref)
 
@@ -251,6 +238,91 @@ class ToolFactory:
                     "parameters": schema,
                 }
 
-                tools.append(ToolFactory.from_openai_schema(function, callback))
+                compiled.append({"server": openapi_spec["servers"][0]["url"], "path": path, "method": method,
+                                 "function": _plain(function)})
+        return compiled
+
+    @staticmethod
+    def from_openapi_operations(operations: List[dict], headers: Dict[str, str] = None,
+                                params: Dict[str, Any] = None, cache_ttl: float = None, use_async: bool = False):
+        """
+        Converts operations compiled by compile_openapi_schema into BaseTools. See from_openapi_schema.
+        """
+        tools = []
+        methods = []
+        headers = headers or {}
+
+        def prepare(tool, server, path):
+            url = server + path
+            parameters = tool.model_dump().get('parameters', {})
+            # replace all parameters in url
+            for param, value in parameters.items():
+                if "{" + str(param) + "}" in url:
+                    url = url.replace(f"{{{param}}}", str(value))
+                    parameters[param] = None
+            url = url.rstrip("/")
+            parameters = {k: v for k, v in parameters.items() if v is not None}
+            return url, {**parameters, **params} if params else parameters
+
+        for operation in operations:
+            # 绑定当前operation的server, path和method
+            def callback(self, *args, server=operation["server"], path=operation["path"], method=operation["method"]):
+                url, parameters = prepare(self, server, path)
+                if method == "get":
+                    return requests.get(url, params=parameters, headers=headers,
+                                        json=self.model_dump().get('requestBody', None)
+                                        ).json()
+                elif method == "post":
+                    return requests.post(url,
+                                         params=parameters,
+                                         json=self.model_dump().get('requestBody', None),
+                                         headers=headers
+                                         ).json()
+                elif method == "put":
+                    return requests.put(url,
+                                        params=parameters,
+                                        json=self.model_dump().get('requestBody', None),
+                                        headers=headers
+                                        ).json()
+                elif method == "delete":
+                    return requests.delete(url,
+                                           params=parameters,
+                                           json=self.model_dump().get('requestBody', None),
+                                           headers=headers
+                                           ).json()
+
+            async def async_callback(self, *args, server=operation["server"], path=operation["path"],
+                                     method=operation["method"]):
+                url, parameters = prepare(self, server, path)
+                response = await get_async_http_client().request(method.upper(), url, params=parameters,
+                                                                 headers=headers,
+                                                                 json=self.model_dump().get('requestBody', None))
+                return response.json()
+
+            tool = ToolFactory.from_openai_schema(operation["function"], async_callback if use_async else callback)
+            # the same schema built with other headers or params (e.g. per tenant) must not share cached results
+            tool.cache_namespace = hashlib.sha256(json.dumps(
+                [operation["server"], operation["path"], operation["method"], headers, params],
+                sort_keys=True, default=str).encode("utf-8")).hexdigest()
+            tools.append(tool)
+            methods.append(operation["method"])
+
+        if cache_ttl is not None:
+            cached = [tool.__name__ for tool, method in zip(tools, methods) if method == "get"]
+            for tool, method in zip(tools, methods):
+                if method == "get":
+                    tool.cacheable = True
+                    tool.cache_ttl = cache_ttl
+                else:
+                    tool.invalidates = cached
 
         return tools
+
+
+def _plain(value):
+    """Copies a schema resolved by jsonref into plain dicts and lists."""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
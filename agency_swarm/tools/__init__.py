@@ -3,3 +3,4 @@ from .oai.Retrieval import Retrieval
 from .oai.CodeInterpreter import CodeInterpreter
 from .ToolFactory import ToolFactory
 from .oai.FileSearch import FileSearch
+from .ReadToolOutput import ReadToolOutput
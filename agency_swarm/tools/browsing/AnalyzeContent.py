@@ -13,6 +13,9 @@ class AnalyzeContent(BaseTool):
     the URL first with ReadURL tool or navigate to the right page with ClickElement tool. Do not use this tool to get 
     direct links to other pages. It is not intended to be used for navigation. To analyze the full web page, instead of just the current window, use ExportFile tool.
     """
+    concurrency_group = "browser"
+    max_concurrency = 1
+
     question: str = Field(
         ..., description="Question to ask about the contents of the current webpage."
     )
@@ -15,6 +15,9 @@ class ClickElement(BaseTool):
     """
     This tool clicks on an element on the current web page based on element or task description. Do not use this tool for input fields or dropdowns.
     """
+    concurrency_group = "browser"
+    max_concurrency = 1
+
     description: str = Field(
         ..., description="Description of the element to click on in natural language.",
         example="Click on the 'Sign Up' button."
@@ -7,6 +7,8 @@ from agency_swarm.tools.browsing.util import get_web_driver
 
 class ExportFile(BaseTool):
     """This tool converts the current full web page into a file and returns its file_id. You can then analyze this file using the myfiles_browser tool."""
+    concurrency_group = "browser"
+    max_concurrency = 1
 
     def run(self):
         wd = get_web_driver()
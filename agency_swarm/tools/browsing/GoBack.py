@@ -9,6 +9,8 @@ class GoBack(BaseTool):
     """
     This tool allows you to go back 1 page in the browser history. Use it in case of a mistake or if a page shows you unexpected content.
     """
+    concurrency_group = "browser"
+    max_concurrency = 1
 
     def run(self):
         wd = get_web_driver()
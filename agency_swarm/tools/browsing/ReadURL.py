@@ -18,6 +18,9 @@ that you think might contain the answer to the user's question or perform a goog
 to click on the link that you think might contain the desired information on the current web page.
 Remember, this tool only supports opening 1 URL at a time. Previous URL will be closed when you open a new one.
     """
+    concurrency_group = "browser"
+    max_concurrency = 1  # the browsing tools drive the one global WebDriver
+
     url: str = Field(
         ..., description="URL of the webpage.", examples=["https://google.com/search?q=search"]
     )
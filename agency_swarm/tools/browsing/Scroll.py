@@ -13,6 +13,9 @@ class Scroll(BaseTool):
     """
     This tool allows you to scroll the current web page up or down by 1 screen height.
     """
+    concurrency_group = "browser"
+    max_concurrency = 1
+
     direction: Literal["up", "down"] = Field(
         ..., description="Direction to scroll."
     )
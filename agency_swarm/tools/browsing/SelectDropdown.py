@@ -15,6 +15,8 @@ class SelectDropdown(BaseTool):
     """
     This tool selects an option in a dropdown on the current web page based on the description of that element and which option to select.
     """
+    concurrency_group = "browser"
+    max_concurrency = 1
 
     description: str = Field(
         ..., description="Description of which option to select and for which dropdown on the page, clearly stated in natural langauge.",
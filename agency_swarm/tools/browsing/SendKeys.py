@@ -18,6 +18,8 @@ class SendKeys(BaseTool):
     """
     This tool sends keys into input fields on the current webpage based on the description of that element and what needs to be typed. It then clicks "Enter" on the last element to submit the form. You do not need to tell it to press "Enter"; it will do that automatically.
     """
+    concurrency_group = "browser"
+    max_concurrency = 1
 
     description: str = Field(
         ..., description="Description of the inputs to send to the web page, clearly stated in natural language.",
@@ -16,6 +16,8 @@ class SolveCaptcha(BaseTool):
     """
     This tool asks a human to solve captcha on the current webpage. Make sure that captcha is visible before running it.
     """
+    concurrency_group = "browser"
+    max_concurrency = 1
 
     def run(self):
         wd = get_web_driver()
@@ -9,6 +9,10 @@ class ChangeDir(BaseTool):
     """
     This tool changes the current working directory to the specified path.
     """
+    invalidates = ["ReadFile", "ListDir"]
+    concurrency_group = "workspace"
+    max_concurrency = 1  # the cwd is shared by the whole process
+
     path: str = Field(
         ..., description="Path to the directory to change to.",
         examples=["./some_folder", "../../some_folder"]
@@ -5,6 +5,7 @@ from instructor import OpenAISchema
 from pydantic import Field, model_validator, field_validator
 
 from agency_swarm import BaseTool
+from agency_swarm.util.tool_output import ToolOutputPolicy
 
 
 class LineChange(OpenAISchema):
@@ -41,6 +42,9 @@ class ChangeLines(BaseTool):
     """
     This tool changes specified lines in a file. Returns the new file contents.
     """
+    invalidates = ["ReadFile", "ListDir"]
+    output_policy = ToolOutputPolicy()  # returns the whole file
+
     file_path: str = Field(
         ..., description="Path to the file with extension.",
         examples=["./file.txt", "./file.json", "../../file.py"]
@@ -50,6 +54,9 @@ class ChangeLines(BaseTool):
         examples=[LineChange(line_number=1, new_line="This is a new line").model_dump()]
     )
 
+    def resource_keys(self) -> List[str]:
+        return [os.path.abspath(self.file_path)]
+
     def run(self):
         # read file
         with open(self.file_path, "r") as f:
@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import Field
 
 from agency_swarm import BaseTool
@@ -9,11 +11,16 @@ class CreateFolder(BaseTool):
     """
     This tool creates a folder at the specified path.
     """
+    invalidates = ["ReadFile", "ListDir"]
+
     folder_path: str = Field(
         ..., description="Path to the folder to create.",
         examples=["./new_dir"]
     )
 
+    def resource_keys(self) -> List[str]:
+        return [os.path.abspath(self.folder_path)]
+
     def run(self):
         # create folder
         os.mkdir(self.folder_path)
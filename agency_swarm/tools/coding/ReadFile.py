@@ -1,3 +1,5 @@
+import os
+
 from pydantic import Field
 
 from agency_swarm import BaseTool
@@ -7,6 +9,9 @@ class ReadFile(BaseTool):
     """
     This tool reads a file and returns the contents along with line numbers on the left.
     """
+    cacheable = True
+    cache_ttl = 30.0
+
     file_path: str = Field(
         ..., description="Path to the file to read with extension.",
         examples=["./file.txt", "./file.json", "../../file.py"]
@@ -18,4 +23,14 @@ class ReadFile(BaseTool):
             file_contents = f.readlines()
 
         # return file contents
-        return "\n".join([f"{i + 1}. {line}" for i, line in enumerate(file_contents)])
\ No newline at end of file
+        return "\n".join([f"{i + 1}. {line}" for i, line in enumerate(file_contents)])
+
+    def cache_arguments(self) -> dict:
+        # 文件可能被其他工具、进程或用户修改，结果也取决于当前工作目录
+        arguments = super().cache_arguments()
+        try:
+            stat = os.stat(self.file_path)
+            arguments.update(cwd=os.getcwd(), mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        except OSError:
+            arguments.update(cwd=os.getcwd(), mtime_ns=None, size=None)
+        return arguments
\ No newline at end of file
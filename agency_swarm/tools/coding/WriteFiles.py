@@ -35,10 +35,16 @@ class WriteFiles(BaseTool):
     """
     Set of files that represent a complete and correct program.
     """
+    invalidates = ["ReadFile", "ListDir"]
+
     chain_of_thought: str = Field(...,
                                   description="Think step by step to determine the correct actions that are needed to implement the program.")
     files: List[File] = Field(..., description="List of files")
 
+    def resource_keys(self) -> List[str]:
+        # 只锁定写入的文件：写不同文件的调用并行执行
+        return [os.path.abspath(file.file_name) for file in self.files]
+
     def run(self):
         outputs = []
         for file in self.files:
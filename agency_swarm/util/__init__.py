@@ -1,3 +1,79 @@
+import importlib
+from typing import TYPE_CHECKING
+
+# create_agent_template has the name of its module, it is imported eagerly so the function is not shadowed by the
+# module once the module is imported. It only imports os.
 from .create_agent_template import create_agent_template
-from .oai import set_openai_key, get_openai_client, set_openai_client, set_openai_base_url
-from .log_config import setup_logging
\ No newline at end of file
+
+# PEP 562: the other utilities are imported on their first use (see agency_swarm/__init__.py)
+_exports = {
+    "set_openai_key": ".oai",
+    "get_openai_client": ".oai",
+    "set_openai_client": ".oai",
+    "set_openai_base_url": ".oai",
+    "setup_logging": ".log_config",
+    "AdaptiveLimiter": ".concurrency",
+    "get_concurrency_limiter": ".concurrency",
+    "set_concurrency_limiter": ".concurrency",
+    "Deadline": ".deadline",
+    "CancellationToken": ".cancellation",
+    "RequestCancelled": ".cancellation",
+    "ContextPolicy": ".context",
+    "estimate_tokens": ".context",
+    "DeltaCoalescer": ".coalescing",
+    "ApiCallAudit": ".audit",
+    "audit_hop": ".audit",
+    "get_api_audit": ".audit",
+    "set_api_audit": ".audit",
+    "ToolResultCache": ".tool_cache",
+    "get_tool_cache": ".tool_cache",
+    "set_tool_cache": ".tool_cache",
+    "ResponseCache": ".response_cache",
+    "SingleFlight": ".single_flight",
+    "ToolOutputPolicy": ".tool_output",
+    "ToolOutputStore": ".tool_output",
+    "get_tool_output_store": ".tool_output",
+    "set_tool_output_store": ".tool_output",
+    "AgencyBundle": ".bundle",
+    "get_agency_bundle": ".bundle",
+    "set_agency_bundle": ".bundle",
+    "ToolResource": ".tool_resources",
+    "ToolResources": ".tool_resources",
+    "get_tool_resources": ".tool_resources",
+    "set_tool_resources": ".tool_resources",
+    "ToolExecutor": ".tool_executor",
+    "get_async_http_client": ".tool_executor",
+    "get_tool_executor": ".tool_executor",
+    "set_tool_executor": ".tool_executor",
+}
+
+__all__ = ["create_agent_template"] + list(_exports)
+
+if TYPE_CHECKING:
+    from .oai import set_openai_key, get_openai_client, set_openai_client, set_openai_base_url
+    from .log_config import setup_logging
+    from .concurrency import AdaptiveLimiter, get_concurrency_limiter, set_concurrency_limiter
+    from .deadline import Deadline
+    from .cancellation import CancellationToken, RequestCancelled
+    from .context import ContextPolicy, estimate_tokens
+    from .coalescing import DeltaCoalescer
+    from .audit import ApiCallAudit, audit_hop, get_api_audit, set_api_audit
+    from .tool_cache import ToolResultCache, get_tool_cache, set_tool_cache
+    from .response_cache import ResponseCache
+    from .single_flight import SingleFlight
+    from .tool_output import ToolOutputPolicy, ToolOutputStore, get_tool_output_store, set_tool_output_store
+    from .bundle import AgencyBundle, get_agency_bundle, set_agency_bundle
+    from .tool_resources import ToolResource, ToolResources, get_tool_resources, set_tool_resources
+    from .tool_executor import ToolExecutor, get_async_http_client, get_tool_executor, set_tool_executor
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,134 @@
+import contextvars
+import re
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+_ID = re.compile(r"^(thread|run|msg|asst|step|call|batch|file|vs)[_-]")
+
+_current_hop = contextvars.ContextVar("agency_swarm_hop", default=None)
+
+
+class HopAudit:
+    """The API calls of one hop (one Session.get_completion), in the order they were sent."""
+
+    def __init__(self, name: str, parent: 'HopAudit' = None):
+        self.name = name
+        self.parent = parent
+        self.calls: List[str] = []
+
+    def __repr__(self):
+        return f"HopAudit({self.name}, {len(self.calls)} calls)"
+
+
+class ApiCallAudit:
+    """
+    Records every HTTP request the OpenAI client sends, attributed to the hop that sent it. Ids are replaced with
+    placeholders, e.g. "POST /threads/{id}/runs (stream)", so sequences of different requests compare equal.
+
+    Enable it with `set_api_audit(ApiCallAudit())`; `report()` prints the call sequence of every hop.
+    """
+
+    def __init__(self):
+        self.hops: List[HopAudit] = []
+        self.unattributed: List[str] = []     # calls sent outside of any hop
+        self._lock = threading.Lock()
+
+    def record(self, request):
+        call = self.describe(request)
+        hop = _current_hop.get()
+        with self._lock:
+            (hop.calls if hop else self.unattributed).append(call)
+
+    def start_hop(self, name: str, parent: HopAudit = None) -> HopAudit:
+        hop = HopAudit(name, parent)
+        with self._lock:
+            self.hops.append(hop)
+        return hop
+
+    def count(self, hop: str = None) -> int:
+        """Number of calls, of every hop named `hop` if given."""
+        with self._lock:
+            return sum(len(h.calls) for h in self.hops if hop is None or h.name == hop) + \
+                (len(self.unattributed) if hop is None else 0)
+
+    def sequences(self, hop: str = None) -> List[List[str]]:
+        """Call sequence of every hop (named `hop` if given), in the order the hops started."""
+        with self._lock:
+            return [list(h.calls) for h in self.hops if hop is None or h.name == hop]
+
+    def report(self) -> str:
+        lines = []
+        with self._lock:
+            for hop in self.hops:
+                lines.append(f"{hop.name}: {len(hop.calls)} calls")
+                lines += [f"    {call}" for call in hop.calls]
+            if self.unattributed:
+                lines.append(f"(no hop): {len(self.unattributed)} calls")
+                lines += [f"    {call}" for call in self.unattributed]
+        return "\n".join(lines)
+
+    @staticmethod
+    def describe(request) -> str:
+        parts = [part for part in request.url.path.split("/") if part]
+        if parts and parts[0] == "v1":
+            parts = parts[1:]
+        path = "/".join("{id}" if _ID.match(part) else part for part in parts)
+        try:
+            body = request.content
+        except Exception:  # streamed upload, e.g. files.create
+            body = b""
+        stream = b'"stream": true' in body or b'"stream":true' in body
+        return f"{request.method} /{path}" + (" (stream)" if stream else "")
+
+
+@contextmanager
+def audit_hop(name: str):
+    """Attributes the API calls sent inside the block to a new hop of the active audit, if there is one."""
+    audit = get_api_audit()
+    if audit is None:
+        yield None
+        return
+    hop = audit.start_hop(name, _current_hop.get())
+    token = _current_hop.set(hop)
+    try:
+        yield hop
+    finally:
+        try:
+            _current_hop.reset(token)
+        except ValueError:  # a generator holding the hop was closed from another context
+            _current_hop.set(hop.parent)
+
+
+def record_request(request):
+    """httpx request hook installed on the OpenAI client (see util/oai.py)."""
+    audit = get_api_audit()
+    if audit is not None:
+        audit.record(request)
+
+
+def install_audit_hook(client):
+    http_client = getattr(client, "_client", None)  # the httpx.Client of openai.OpenAI
+    if http_client is None or not hasattr(http_client, "event_hooks"):
+        return
+    hooks = http_client.event_hooks
+    if record_request not in hooks["request"]:
+        hooks["request"].append(record_request)
+        http_client.event_hooks = hooks
+
+
+audit_lock = threading.Lock()
+audit = None
+
+
+def get_api_audit() -> Optional[ApiCallAudit]:
+    return audit
+
+
+def set_api_audit(new_audit: Optional[ApiCallAudit]):
+    global audit
+    with audit_lock:
+        audit = new_audit
+    if new_audit is not None:
+        from agency_swarm.util.oai import get_openai_client
+        install_audit_hook(get_openai_client())
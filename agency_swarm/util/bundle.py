@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+BUNDLE_VERSION = 1
+
+
+class AgencyBundle:
+    """
+    Precompiled startup state of an agency, written by `agency-swarm build`: for each agent the instructions read
+    from disk, the operations compiled from its OpenAPI schemas, the manifest of its files folders and its assistant.
+
+    Set it with set_agency_bundle() before the agents are created. The agents then reuse every entry whose source did
+    not change and only rebuild the others:
+
+    - instructions are reused while the size and modification time of their file are the same;
+    - the operations of a schema are reused while the SHA-256 of its file is the same, without validating and
+      resolving the schema again;
+    - the assistant of an agent is used by id, without retrieving and comparing it, while the hash of its parameters
+      (instructions, tools, tool resources, model...) is the one it was built with.
+
+    Everything looked up or rebuilt while the agency starts is recorded, so `save()` writes a bundle of the current
+    agency and drops the stale entries.
+    """
+
+    def __init__(self, path: str = "agency_bundle.json"):
+        """
+        Parameters:
+        path (str, optional): Path of the bundle file. A missing file, or one of another version, is an empty bundle. Defaults to "agency_bundle.json".
+        """
+        self.path = path
+        self._loaded = self._empty()
+        self._entries = self._empty()
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.rebuilt = 0
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == BUNDLE_VERSION:
+                self._loaded.update({key: data.get(key, {}) for key in self._loaded})
+
+    @staticmethod
+    def _empty() -> Dict[str, dict]:
+        return {"instructions": {}, "schemas": {}, "files": {}, "assistants": {}}
+
+    def _lookup(self, section: str, key: str, valid) -> Optional[dict]:
+        entry = self._loaded[section].get(key)
+        if entry is None or not valid(entry):
+            return None
+        with self._lock:
+            self._entries[section][key] = entry
+            self.reused += 1
+        return entry
+
+    def _record(self, section: str, key: str, entry: dict):
+        with self._lock:
+            self._entries[section][key] = entry
+            self.rebuilt += 1
+
+    # --- instructions ---
+
+    def instructions(self, path: str) -> Optional[str]:
+        stat = os.stat(path)
+        entry = self._lookup("instructions", os.path.abspath(path),
+                             lambda e: e["size"] == stat.st_size and e["mtime_ns"] == stat.st_mtime_ns)
+        return entry["text"] if entry else None
+
+    def record_instructions(self, path: str, text: str):
+        stat = os.stat(path)
+        self._record("instructions", os.path.abspath(path),
+                     {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "text": text})
+
+    # --- OpenAPI schemas ---
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def schema_operations(self, path: str, text: str) -> Optional[List[dict]]:
+        digest = self.digest(text)
+        entry = self._lookup("schemas", os.path.abspath(path), lambda e: e["sha256"] == digest)
+        return entry["operations"] if entry else None
+
+    def record_schema(self, path: str, text: str, operations: List[dict]):
+        self._record("schemas", os.path.abspath(path), {"sha256": self.digest(text), "operations": operations})
+
+    # --- files ---
+
+    def record_files(self, folder: str, manifest: List[dict]):
+        """Manifest of the files of a files folder: their name, size, file id and tool."""
+        entry = {"files": manifest}
+        if self._loaded["files"].get(os.path.abspath(folder)) == entry:
+            self._lookup("files", os.path.abspath(folder), lambda e: True)
+        else:
+            self._record("files", os.path.abspath(folder), entry)
+
+    # --- assistants ---
+
+    @staticmethod
+    def parameters_hash(parameters: dict) -> str:
+        return AgencyBundle.digest(json.dumps(parameters, sort_keys=True, default=str))
+
+    def assistant(self, name: str, parameters: dict) -> Optional[dict]:
+        """The id and tool resources of the assistant of an agent, if it was built with the same parameters."""
+        digest = self.parameters_hash(parameters)
+        return self._lookup("assistants", name, lambda e: e["parameters_hash"] == digest)
+
+    def record_assistant(self, name: str, parameters: dict, assistant_id: str, tool_resources: Optional[dict]):
+        self._record("assistants", name, {"id": assistant_id, "parameters_hash": self.parameters_hash(parameters),
+                                          "tool_resources": tool_resources})
+
+    def save(self, path: str = None):
+        with self._lock:
+            data = {"version": BUNDLE_VERSION, **self._entries}
+        with open(path or self.path, "w") as f:
+            json.dump(data, f, indent=2, default=str)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"reused": self.reused, "rebuilt": self.rebuilt,
+                    **{section: len(entries) for section, entries in self._entries.items()}}
+
+
+bundle_lock = threading.Lock()
+bundle = None
+
+
+def get_agency_bundle() -> Optional[AgencyBundle]:
+    with bundle_lock:
+        return bundle
+
+
+def set_agency_bundle(new_bundle: Optional[AgencyBundle]):
+    global bundle
+    with bundle_lock:
+        bundle = new_bundle
@@ -0,0 +1,81 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from agency_swarm.util.log_config import setup_logging
+
+logger = setup_logging()
+
+
+class RequestCancelled(Exception):
+    """Raised inside a session when the user request it belongs to has been cancelled."""
+    pass
+
+
+class CancellationToken:
+    """
+    Cancellation state of one user request, shared by every session of the request tree.
+
+    Sessions register callbacks for the resources they hold (active runs, open streams) while they hold them.
+    `cancel` fires all registered callbacks once, from the cancelling thread, and every later check point
+    (`raise_if_cancelled`, `wait`) in the request tree raises or wakes up.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_handle = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+
+        logger.info(f"Request cancelled, tearing down {len(callbacks)} active resources...")
+        for callback in callbacks:
+            self._fire(callback)
+
+    def register(self, callback: Callable[[], None]) -> int:
+        """Registers a callback fired on cancellation. Fires it right away if the request is already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._next_handle += 1
+                self._callbacks[self._next_handle] = callback
+                return self._next_handle
+        self._fire(callback)
+        return -1
+
+    def unregister(self, handle: int):
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]):
+        handle = self.register(callback)
+        try:
+            yield
+        finally:
+            self.unregister(handle)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleeps up to timeout seconds, returns True early if the request gets cancelled."""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RequestCancelled("The request has been cancelled.")
+
+    @staticmethod
+    def _fire(callback):
+        try:
+            callback()
+        except Exception as e:
+            logger.info(f"Exception in cancellation callback：{str(e)}")
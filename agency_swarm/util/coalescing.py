@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+from typing import Iterator, List, Optional, Tuple
+
+
+class DeltaCoalescer:
+    """
+    Pipeline stage between a stream producer (the event handler, on the request's thread) and a slow consumer
+    (a UI, a terminal, an HTTP response).
+
+    The producer pushes patches: structural ones with `push` (e.g. {"op": "message", ...} when a new message starts)
+    and text with `append`, which merges consecutive text of the same message into one patch. The consumer receives
+    frames, lists of patches, at most every `interval` seconds, or as soon as `max_chars` of text are pending.
+    Only the new text is sent, never the whole transcript.
+
+    At most `max_frames` frames wait for the consumer; beyond that `push`/`append` block the producer (backpressure)
+    until the consumer catches up or stops consuming (`abandon`). The producer is the event handler of one request,
+    called while its stream is consumed, after the request released its concurrency slot (see
+    AdaptiveLimiter.stream), so a slow consumer only stalls its own request.
+    """
+
+    def __init__(self, interval: float = 0.05, max_chars: int = 2048, max_frames: int = 8):
+        """
+        Parameters:
+        interval (float, optional): Seconds between two frames of a steady stream. Defaults to 0.05.
+        max_chars (int, optional): Pending characters that seal a frame before the interval is over. Defaults to 2048.
+        max_frames (int, optional): Sealed frames waiting for the consumer before the producer blocks. Defaults to 8.
+        """
+        self.interval = interval
+        self.max_chars = max_chars
+        self.max_frames = max_frames
+        self._pending: List[dict] = []
+        self._pending_chars = 0
+        self._ready = deque()
+        self._closed = False
+        self._abandoned = False
+        self._last_frame = time.monotonic()
+        self._cond = threading.Condition()
+
+    # --- producer ---
+
+    def push(self, patch: dict):
+        self._add(patch, 0)
+
+    def append(self, text: str, **fields):
+        """Appends text to the pending text patch with the same fields, or starts a new one."""
+        if not text:
+            return
+        self._add(dict(fields, op="text", text=text), len(text))
+
+    def close(self):
+        """Marks the end of the stream, the consumer stops after the last frame."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _add(self, patch: dict, chars: int):
+        with self._cond:
+            if self._abandoned:
+                return
+            if not self._pending:
+                self._cond.notify_all()  # 唤醒空闲的消费者，开始计时
+            last = self._pending[-1] if self._pending else None
+            if (patch["op"] == "text" and last and last["op"] == "text"
+                    and all(last.get(k) == v for k, v in patch.items() if k != "text")
+                    and len(last) == len(patch)):
+                last["text"] += patch["text"]
+            else:
+                self._pending.append(patch)
+            self._pending_chars += chars
+            if self._pending_chars >= self.max_chars:
+                self._seal()
+                while len(self._ready) > self.max_frames and not self._abandoned: # 消费者跟不上：阻塞生产者
+                    self._cond.wait()
+
+    def _seal(self):
+        if self._pending:
+            self._ready.append(self._pending)
+            self._pending = []
+            self._pending_chars = 0
+            self._cond.notify_all()
+
+    # --- consumer ---
+
+    def poll(self) -> Tuple[Optional[List[dict]], bool]:
+        """
+        Non-blocking: returns (frame, finished). frame is None if no frame is due yet; finished is True once the
+        stream is closed and every frame was returned.
+        """
+        with self._cond:
+            if not self._ready and (self._closed or time.monotonic() - self._last_frame >= self.interval):
+                self._seal()
+            if self._ready:
+                self._last_frame = time.monotonic()
+                frame = self._ready.popleft()
+                self._cond.notify_all()
+                return frame, False
+            return None, self._closed
+
+    def __iter__(self) -> Iterator[List[dict]]:
+        """Blocking: yields the frames until the stream is closed. Stopping the iteration abandons the stream."""
+        try:
+            while True:
+                with self._cond:
+                    while not self._ready and not self._closed:
+                        if not self._pending:
+                            self._cond.wait()
+                            continue
+                        remaining = self.interval - (time.monotonic() - self._last_frame)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                frame, finished = self.poll()
+                if frame is not None:
+                    yield frame
+                elif finished:
+                    return
+        finally:
+            self.abandon()
+
+    def abandon(self):
+        """The consumer stops consuming: drops pending patches and never blocks the producer again."""
+        with self._cond:
+            self._abandoned = True
+            self._pending = []
+            self._ready.clear()
+            self._cond.notify_all()
@@ -0,0 +1,233 @@
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+import openai
+
+DEFAULT_MODEL_KEY = "default"  # key for API calls that are not bound to a model (threads, messages, polling)
+
+
+class _ModelLimit:
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.inflight = 0
+        self.baseline_latency = None
+        self.last_decrease = None
+        self.consecutive_throttles = 0
+        self.cond = threading.Condition()
+
+        # metrics
+        self.completed = 0
+        self.throttled = 0
+        self.latency_spikes = 0
+        self.queued = 0
+        self.wait_time = 0.0
+
+
+class AdaptiveLimiter:
+    """
+    Adaptive concurrency limiter placed in front of the OpenAI client.
+
+    Every model gets its own limit. The limit grows additively (by 1/limit per completed call) while the observed
+    latency stays close to the model's baseline, and it is cut multiplicatively on HTTP 429s (`backoff_ratio`) and on
+    latency spikes (`latency_ratio`). At most one cut is applied per baseline round trip, so a burst of 429s from the
+    same window only halves the limit once.
+    """
+
+    def __init__(self,
+                 initial_limit: int = 4,
+                 min_limit: int = 1,
+                 max_limit: int = 64,
+                 backoff_ratio: float = 0.5,
+                 latency_ratio: float = 0.9,
+                 spike_tolerance: float = 2.0,
+                 smoothing: float = 0.1,
+                 max_retries: int = 5,
+                 base_backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 model_limits: Dict[str, int] = None):
+        """
+        Parameters:
+        initial_limit (int, optional): Starting concurrency of each model. Defaults to 4.
+        min_limit (int, optional): The limit never drops below this value. Defaults to 1.
+        max_limit (int, optional): The limit never grows above this value. Defaults to 64.
+        backoff_ratio (float, optional): Multiplicative decrease applied on a 429. Defaults to 0.5.
+        latency_ratio (float, optional): Multiplicative decrease applied on a latency spike. Defaults to 0.9.
+        spike_tolerance (float, optional): A call slower than baseline * spike_tolerance is a spike. Defaults to 2.0.
+        smoothing (float, optional): EWMA factor of the baseline latency. Defaults to 0.1.
+        max_retries (int, optional): How many times `call` retries a rate limited request. Defaults to 5.
+        base_backoff (float, optional): First retry delay in seconds, doubled on every consecutive 429. Defaults to 0.5.
+        max_backoff (float, optional): Upper bound of the retry delay in seconds. Defaults to 30.
+        model_limits (Dict[str, int], optional): Per-model maximum limits overriding max_limit, e.g. {"gpt-4": 8}.
+        """
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_ratio = latency_ratio
+        self.spike_tolerance = spike_tolerance
+        self.smoothing = smoothing
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.model_limits = model_limits or {}
+
+        self._models: Dict[str, _ModelLimit] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> _ModelLimit:
+        model = model or DEFAULT_MODEL_KEY
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = _ModelLimit(min(self.initial_limit, self._max_limit(model)))
+            return self._models[model]
+
+    def _max_limit(self, model: str) -> int:
+        return self.model_limits.get(model, self.max_limit)
+
+    @contextmanager
+    def acquire(self, model: str):
+        """Holds one concurrency slot of the model for the duration of the block and learns from its outcome."""
+        state = self._get(model)
+        with state.cond:
+            if state.inflight >= int(state.limit):
+                state.queued += 1
+                started = time.monotonic()
+                while state.inflight >= int(state.limit):
+                    state.cond.wait()
+                state.wait_time += time.monotonic() - started
+            state.inflight += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        except openai.RateLimitError:
+            self._release(model, state, throttled=True)
+            raise
+        except BaseException:
+            self._release(model, state)
+            raise
+        else:
+            self._release(model, state, latency=time.monotonic() - started)
+
+    def _release(self, model: str, state: _ModelLimit, latency: float = None, throttled: bool = False):
+        with state.cond:
+            saturated = state.inflight >= int(state.limit)
+            state.inflight -= 1
+            if throttled:
+                self._decrease(state, self.backoff_ratio)
+                state.throttled += 1
+                state.consecutive_throttles += 1
+            elif latency is not None:
+                state.completed += 1
+                state.consecutive_throttles = 0
+                self._learn(model, state, latency, saturated)
+            state.cond.notify_all()
+
+    def _learn(self, model: str, state: _ModelLimit, latency: float, saturated: bool):
+        if state.baseline_latency is None:
+            state.baseline_latency = latency
+            return
+
+        if latency > state.baseline_latency * self.spike_tolerance:
+            state.latency_spikes += 1
+            self._decrease(state, self.latency_ratio)
+            # follow a lasting shift of the latency slowly
+            state.baseline_latency += self.smoothing * 0.1 * (latency - state.baseline_latency)
+            return
+
+        state.baseline_latency += self.smoothing * (latency - state.baseline_latency)
+        if saturated:
+            state.limit = min(self._max_limit(model), state.limit + 1 / state.limit)
+
+    def _decrease(self, state: _ModelLimit, ratio: float):
+        now = time.monotonic()
+        if state.last_decrease is not None and \
+                now - state.last_decrease < (state.baseline_latency or self.base_backoff):
+            return
+        state.last_decrease = now
+        state.limit = max(self.min_limit, state.limit * ratio)
+
+    def on_throttle(self, model: str):
+        """Reports a rate limit signal that did not surface as an exception, e.g. a run failed with rate_limit_exceeded."""
+        state = self._get(model)
+        with state.cond:
+            self._decrease(state, self.backoff_ratio)
+            state.throttled += 1
+            state.consecutive_throttles += 1
+
+    def backoff(self, model: str) -> float:
+        """Returns how long to wait before retrying a throttled call, growing with consecutive 429s."""
+        state = self._get(model)
+        delay = self.base_backoff * (2 ** max(0, state.consecutive_throttles - 1))
+        return min(self.max_backoff, delay) * random.uniform(0.5, 1.0)
+
+    def call(self, _model: str, fn: Callable, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) in a slot of the model, retrying rate limited calls with backoff. The model is named
+        `_model` so that it does not clash with the `model` keyword of the API methods it wraps.
+        """
+        retries = 0
+        while True:
+            try:
+                with self.acquire(_model):
+                    return fn(*args, **kwargs)
+            except openai.RateLimitError:
+                if retries >= self.max_retries:
+                    raise
+                retries += 1
+                time.sleep(self.backoff(_model))
+
+    @contextmanager
+    def stream(self, _model: str, manager):
+        """
+        Enters a stream manager (e.g. runs.stream) in a slot of the model. The slot is only held while the request
+        starts the stream, and the limiter learns from the time until the response started; it is released before
+        the events are consumed, so a long answer or a slow event handler neither holds a slot nor counts as a
+        latency spike.
+        """
+        stream = self.call(_model, manager.__enter__)
+        try:
+            yield stream
+        except BaseException:
+            manager.__exit__(*sys.exc_info())
+            raise
+        else:
+            manager.__exit__(None, None, None)
+
+    def get_limit(self, model: str) -> float:
+        return self._get(model).limit
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            models = dict(self._models)
+        return {model: {"limit": round(state.limit, 2),
+                        "inflight": state.inflight,
+                        "completed": state.completed,
+                        "throttled": state.throttled,
+                        "latency_spikes": state.latency_spikes,
+                        "queued": state.queued,
+                        "wait_time": round(state.wait_time, 3),
+                        "baseline_latency": state.baseline_latency}
+                for model, state in models.items()}
+
+
+limiter_lock = threading.Lock()
+limiter = None
+
+
+def get_concurrency_limiter() -> AdaptiveLimiter:
+    global limiter
+    with limiter_lock:
+        if limiter is None:
+            limiter = AdaptiveLimiter()
+    return limiter
+
+
+def set_concurrency_limiter(new_limiter: AdaptiveLimiter):
+    global limiter
+    with limiter_lock:
+        limiter = new_limiter
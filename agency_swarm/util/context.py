@@ -0,0 +1,90 @@
+from typing import List, Optional
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception: # tiktoken is optional, fall back to the character heuristic
+    _encoding = None
+
+MESSAGE_OVERHEAD = 4  # tokens the chat format adds around every message
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimates the tokens of a text locally: exact with tiktoken if it is installed, ~4 characters per token otherwise."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def estimate_messages_tokens(messages: List[dict]) -> int:
+    tokens = 0
+    for message in messages:
+        tokens += MESSAGE_OVERHEAD + estimate_tokens(message.get("content") or "")
+        for call in message.get("tool_calls") or []:
+            tokens += estimate_tokens(call["function"]["name"]) + estimate_tokens(call["function"]["arguments"])
+    return tokens
+
+
+class ContextPolicy:
+    """
+    Context-window budget of an agent's threads.
+
+    `max_prompt_tokens` and `last_messages` bound the prompt of every run (passed to the Assistants API as
+    max_prompt_tokens / truncation_strategy, applied locally by the chat completions engine). `compact_at_tokens`
+    turns on summarizing compaction: once the estimated size of a persisted thread reaches it, the thread is forked
+    into a compacted thread holding a summary of the old messages and the last `keep_last_messages` messages.
+    """
+
+    def __init__(self,
+                 max_prompt_tokens: int = None,
+                 last_messages: int = None,
+                 compact_at_tokens: int = None,
+                 keep_last_messages: int = 6,
+                 summary_model: str = "gpt-3.5-turbo"):
+        """
+        Parameters:
+        max_prompt_tokens (int, optional): Upper bound of the prompt tokens of a run. The Assistants API requires at least 256. Defaults to None (no bound).
+        last_messages (int, optional): Only the last N messages of the thread are sent with a run. Defaults to None (all messages).
+        compact_at_tokens (int, optional): Estimated thread size that triggers a compaction. Defaults to None (never compact).
+        keep_last_messages (int, optional): Messages kept verbatim by a compaction. Defaults to 6.
+        summary_model (str, optional): Model writing the summary of a compaction. Defaults to "gpt-3.5-turbo".
+        """
+        if max_prompt_tokens is not None and max_prompt_tokens < 256:
+            raise Exception("max_prompt_tokens must be at least 256.")
+        self.max_prompt_tokens = max_prompt_tokens
+        self.last_messages = last_messages
+        self.compact_at_tokens = compact_at_tokens
+        self.keep_last_messages = keep_last_messages
+        self.summary_model = summary_model
+
+    def run_params(self) -> dict:
+        """Parameters of runs.create / runs.stream enforcing the policy on the Assistants API."""
+        params = {}
+        if self.max_prompt_tokens:
+            params["max_prompt_tokens"] = self.max_prompt_tokens
+        if self.last_messages:
+            params["truncation_strategy"] = {"type": "last_messages", "last_messages": self.last_messages}
+        return params
+
+    def should_compact(self, token_estimate: int) -> bool:
+        return bool(self.compact_at_tokens) and token_estimate >= self.compact_at_tokens
+
+    def trim(self, messages: List[dict], reserved_tokens: int = 0) -> List[dict]:
+        """
+        Applies last_messages and max_prompt_tokens to a chat completions history (without the system message,
+        whose tokens are passed as reserved_tokens). The history never starts with a tool message, which would be
+        rejected without its tool call.
+        """
+        start = len(messages) - self.last_messages if self.last_messages else 0
+        start = max(0, start)
+        if self.max_prompt_tokens:
+            budget = self.max_prompt_tokens - reserved_tokens
+            tokens = estimate_messages_tokens(messages[start:])
+            while start < len(messages) - 1 and tokens > budget:
+                tokens -= estimate_messages_tokens([messages[start]])
+                start += 1
+        while start < len(messages) - 1 and messages[start]["role"] == "tool":
+            start += 1
+        return messages[start:]
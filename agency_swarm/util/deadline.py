@@ -0,0 +1,32 @@
+import time
+
+
+class Deadline:
+    """
+    Time budget of one user request. It is created at the entrance of the agency and handed down every
+    SendMessage hop. Each hop gives its recipient a smaller budget (see `shrink`), so a caller always has some
+    time left to turn a partial answer of a slow recipient into its own reply.
+    """
+
+    def __init__(self, timeout: float, reserve_ratio: float = 0.1):
+        """
+        Parameters:
+        timeout (float): Budget in seconds, counted from now.
+        reserve_ratio (float, optional): Share of the remaining budget a caller keeps for itself when it hands the
+            budget down to a recipient. Defaults to 0.1.
+        """
+        self.expires_at = time.monotonic() + timeout
+        self.reserve_ratio = reserve_ratio
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def shrink(self) -> 'Deadline':
+        """Returns the deadline of the next hop: the remaining budget minus the caller's reserve."""
+        return Deadline(self.remaining() * (1 - self.reserve_ratio), self.reserve_ratio)
+
+    def __repr__(self):
+        return f"Deadline(remaining={self.remaining():.2f}s)"
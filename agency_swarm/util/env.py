@@ -0,0 +1,14 @@
+import threading
+
+env_lock = threading.Lock()
+env_loaded = False
+
+
+def load_env():
+    """Loads the .env file once, when a setting it may hold is first needed instead of at import."""
+    global env_loaded
+    with env_lock:
+        if not env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            env_loaded = True
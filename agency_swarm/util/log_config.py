@@ -3,23 +3,51 @@ import logging
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
 
+from agency_swarm.util.env import load_env
+
+
+class DeferredFileHandler(logging.Handler):
+    """
+    Writes to a rotating log file in AS_LOG_DIR, or in the logs folder of AS_PROJECT_ROOT. The file and its folder are
+    created on the first record rather than when the logging is set up, which happens at import. When neither is set
+    (also in the .env file) nothing is written to disk.
+    """
+
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.file_handler = None
+        self.resolved = False
+
+    def emit(self, record):
+        if not self.resolved:   # handle() holds the lock of the handler
+            self.resolved = True
+            load_env()
+            project_root = os.getenv('AS_PROJECT_ROOT')
+            log_dir = os.getenv('AS_LOG_DIR') or (os.path.join(project_root, 'logs') if project_root else None)
+            if log_dir:
+                formatted_datetime = datetime.utcnow().strftime("%Y-%m-%d %H_%M_%S")
+                os.makedirs(log_dir, exist_ok=True)
+                self.file_handler = RotatingFileHandler(os.path.join(log_dir, f"{formatted_datetime}.log"),
+                                                        maxBytes=1048576, backupCount=5)
+                self.file_handler.setFormatter(self.formatter)
+        if self.file_handler is not None:
+            self.file_handler.emit(record)
+
+    def close(self):
+        if self.file_handler is not None:
+            self.file_handler.close()
+        super().close()
+
+
 def setup_logging():
     logger = logging.getLogger('agency_swarm')
     logger.setLevel(logging.DEBUG)
     if not logger.handlers:
-        project_root = os.getenv('AS_PROJECT_ROOT')
-        current_datetime = datetime.utcnow()
-        formatted_datetime = current_datetime.strftime("%Y-%m-%d %H_%M_%S")
-
-        log_file_name = f"{formatted_datetime}.log"
-        log_file_path = os.path.join(project_root, 'logs', log_file_name)
-        os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
-        
         # 创建一个handler，用于将日志输出到控制台
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         
-        file_handler = RotatingFileHandler(log_file_path, maxBytes=1048576, backupCount=5)
+        file_handler = DeferredFileHandler()
         file_handler.setLevel(logging.DEBUG)
         
         formatter = logging.Formatter('%(asctime)s - %(levelname)s \n%(message)s\n')
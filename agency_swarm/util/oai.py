@@ -1,11 +1,9 @@
 import openai
 import threading
 import os
-import instructor
 
-from dotenv import load_dotenv
-
-load_dotenv()
+from agency_swarm.util.audit import install_audit_hook
+from agency_swarm.util.env import load_env
 
 client_lock = threading.Lock()
 client = None
@@ -15,6 +13,9 @@ def get_openai_client():
     global client
     with client_lock:
         if client is None:
+            import instructor
+
+            load_env()
             # Check if the API key is set
             api_key = openai.api_key or os.getenv('OPENAI_API_KEY')
             url =  openai.base_url or os.getenv('OPENAI_BASE_URL')
@@ -22,6 +23,7 @@ def get_openai_client():
                 raise ValueError("OpenAI API key is not set. Please set it using set_openai_key.")
             client = instructor.patch(openai.OpenAI(api_key=api_key,
                                                     max_retries=5,base_url=url))
+            install_audit_hook(client)
     return client
 
 
@@ -29,6 +31,7 @@ def set_openai_client(new_client):
     global client
     with client_lock:
         client = new_client
+        install_audit_hook(client)
 
 
 def set_openai_key(key):
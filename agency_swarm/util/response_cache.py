@@ -0,0 +1,148 @@
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Hashable, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by the response cache
+    np = None
+
+_WORD = re.compile(r"\w+")
+
+
+class ResponseCache:
+    """
+    Semantic cache of an agent's answers to SendMessage requests, e.g.
+    `Agent(name="Analyst", response_cache=ResponseCache(threshold=0.9, ttl=600))`.
+
+    A request is normalized (case, punctuation, whitespace) and embedded locally as a hashed bag of words, word bigrams
+    and character trigrams. A fresh cached answer is returned without running the agent if its request is identical
+    after normalization, or if the cosine similarity of the two vectors reaches `threshold`.
+
+    Answers are scoped to the user owning the conversation, so users never get each other's answers, unless the
+    cache is `shared`.
+    """
+
+    def __init__(self,
+                 threshold: float = 0.9,
+                 ttl: float = 600.0,
+                 max_entries: int = 512,
+                 dimensions: int = 2048,
+                 shared: bool = False):
+        """
+        Parameters:
+        threshold (float, optional): Minimum cosine similarity of a near-duplicate request, 1.0 only matches requests that are equal after normalization. Defaults to 0.9.
+        ttl (float, optional): Seconds a cached answer stays fresh. Defaults to 600.
+        max_entries (int, optional): Least recently used answers are evicted above this size. Defaults to 512.
+        dimensions (int, optional): Size of the hashed vectors. Defaults to 2048.
+        shared (bool, optional): Answers are shared between all users. Defaults to False.
+        """
+        if np is None:
+            raise Exception("Please install numpy to use the response cache: pip install numpy")
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        self.shared = shared
+
+        self._vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._expires = np.zeros(max_entries)          # 0: free slot
+        self._last_used = np.zeros(max_entries)
+        self._scopes = np.full(max_entries, -1, dtype=np.int64)
+        self._responses = [None] * max_entries
+        self._exact: Dict[tuple, int] = {}             # (scope, normalized request) -> slot
+        self._keys = [None] * max_entries
+        self._scope_ids: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+        # metrics
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        return " ".join(_WORD.findall(message.lower()))
+
+    def embed(self, normalized: str) -> "np.ndarray":
+        words = normalized.split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        features += [f"#{word[i:i + 3]}" for word in words for i in range(max(1, len(word) - 2))]
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if not features:
+            return vector
+        hashes = np.array([zlib.crc32(feature.encode()) for feature in features], dtype=np.uint64)
+        signs = np.where(hashes & 1, 1.0, -1.0).astype(np.float32)   # 带符号的hashing trick，减少碰撞带来的偏差
+        np.add.at(vector, (hashes >> 1) % self.dimensions, signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, message: str, scope: Hashable = None) -> Optional[str]:
+        """Returns the fresh cached answer of the same or a near-duplicate request of the scope, if there is one."""
+        normalized = self.normalize(message)
+        now = time.monotonic()
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            slot = self._exact.get((scope, normalized))
+            if slot is not None and self._expires[slot] > now:
+                self.exact_hits += 1
+            elif scope_id is None or self.threshold > 1.0:
+                slot = None
+            else:
+                scores = self._vectors @ self.embed(normalized)
+                scores[(self._expires <= now) | (self._scopes != scope_id)] = -1.0
+                best = int(np.argmax(scores))
+                slot = best if scores[best] >= self.threshold else None
+                if slot is not None:
+                    self.near_hits += 1
+            if slot is None:
+                self.misses += 1
+                return None
+            self._last_used[slot] = now
+            return self._responses[slot]
+
+    def store(self, message: str, response: str, scope: Hashable = None):
+        normalized = self.normalize(message)
+        now = time.monotonic()
+        with self._lock:
+            slot = self._exact.get((scope, normalized))
+            if slot is None:
+                slot = int(np.argmin(np.where(self._expires > now, self._last_used, -1.0)))
+                if self._expires[slot] > now:
+                    self.evictions += 1
+                if self._keys[slot] is not None:
+                    self._exact.pop(self._keys[slot], None)
+            self._vectors[slot] = self.embed(normalized)
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+            self._scopes[slot] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self._responses[slot] = response
+            self._keys[slot] = (scope, normalized)
+            self._exact[(scope, normalized)] = slot
+            self.stores += 1
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._exact.clear()
+            self._keys = [None] * self.max_entries
+            self._responses = [None] * self.max_entries
+
+    def __len__(self):
+        return int(np.count_nonzero(self._expires > time.monotonic()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.near_hits + self.misses
+            return {"entries": int(np.count_nonzero(self._expires > time.monotonic())),
+                    "exact_hits": self.exact_hits,
+                    "near_hits": self.near_hits,
+                    "misses": self.misses,
+                    "hit_rate": round((self.exact_hits + self.near_hits) / lookups, 3) if lookups else 0.0,
+                    "stores": self.stores,
+                    "evictions": self.evictions,
+                    "threshold": self.threshold}
@@ -0,0 +1,120 @@
+import threading
+import weakref
+from typing import Any, Callable, Dict, Generator, Hashable, List, Optional, Tuple
+
+from agency_swarm.util.cancellation import CancellationToken
+from agency_swarm.util.deadline import Deadline
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """
+    Coalesces identical SendMessage requests to an agent that are in flight at the same time, e.g.
+    `Agent(name="Analyst", single_flight=SingleFlight())`.
+
+    The first request of a key (the leader) runs as usual; requests arriving with the same key before it finished
+    wait for it and get its answer without a run of their own. If the leader fails or is cancelled, the waiting
+    requests run again and one of them becomes the new leader.
+
+    The default key is the user of the message chain, the message with collapsed whitespace and the message files, so
+    only requests of the same user are coalesced. Batch workloads sending the same request on behalf of many users can
+    coalesce across users with e.g. `SingleFlight(key=lambda message, message_files, user: message)`.
+    """
+
+    def __init__(self,
+                 key: Callable[[str, Optional[List[str]], Hashable], Hashable] = None,
+                 poll_interval: float = 0.05):
+        """
+        Parameters:
+        key (Callable[[str, Optional[List[str]], Hashable], Hashable], optional): Maps (message, message_files, user) to the key of a request. Defaults to SingleFlight.default_key.
+        poll_interval (float, optional): Seconds between two checks of the cancel token and deadline of a waiting request. Defaults to 0.05.
+        """
+        self.key = key or self.default_key
+        self.poll_interval = poll_interval
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+        # metrics
+        self.leaders = 0
+        self.coalesced = 0
+        self.retried = 0     # waiting requests that ran themselves after their leader failed
+
+    @staticmethod
+    def default_key(message: str, message_files: Optional[List[str]], user: Hashable) -> Hashable:
+        return user, " ".join(message.split()), tuple(message_files or ())
+
+    def attach(self, key: Hashable, deadline: Deadline = None,
+               cancel_token: CancellationToken = None) -> Tuple[bool, Any]:
+        """
+        Returns (True, None) if the caller leads the request of `key`: it must run it and pass its completion through
+        `lead()`. Otherwise waits for the request in flight and returns (False, its answer).
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    self._calls[key] = _Call()
+                    self.leaders += 1
+                    return True, None
+
+            while not call.done.wait(self.poll_interval):
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+                if deadline and deadline.expired():
+                    raise Exception("Timed out waiting for an identical request in flight.")
+            with self._lock:
+                if not call.failed:
+                    self.coalesced += 1
+                    return False, call.result
+                self.retried += 1
+
+    def lead(self, key: Hashable, completion) -> Generator:
+        """
+        Passes the completion generator of the leader through and hands its answer to the waiting requests. If the
+        completion fails, or the returned generator is closed or dropped before it is done, the waiting requests run
+        again.
+        """
+        call = self._calls[key]
+        leader = self._lead(key, call, completion)
+        weakref.finalize(leader, self._abandon, key, call)  # dropped without ever being iterated
+        return leader
+
+    def _lead(self, key: Hashable, call: _Call, completion):
+        try:
+            result = yield from completion
+        except BaseException:   # 包括GeneratorExit：生成器被提前关闭
+            self._finish(key, call, failed=True)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    def abandon(self, key: Hashable):
+        """Ends a request the leader could not start, the waiting requests run again."""
+        call = self._calls.get(key)
+        if call is not None:
+            self._abandon(key, call)
+
+    def _abandon(self, key: Hashable, call: _Call):
+        if not call.done.is_set():
+            self._finish(key, call, failed=True)
+
+    def _finish(self, key: Hashable, call: _Call, result: Any = None, failed: bool = False):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.result = result
+            call.failed = failed
+        call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._calls),
+                    "leaders": self.leaders,
+                    "coalesced": self.coalesced,
+                    "retried": self.retried}
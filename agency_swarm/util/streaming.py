@@ -1,14 +1,211 @@
+import uuid
 from abc import ABC
 
+from openai._models import construct_type
 from openai.lib.streaming import AssistantEventHandler
+from openai.types.beta.threads import Text
+from openai.types.beta.threads.runs import ToolCall
+
+
+class StreamContext:
+    """State of one streamed request, shared by the handlers of all its hops."""
+
+    def __init__(self):
+        self.request_id = uuid.uuid4().hex
+        self.state = {}     # free for handlers to keep per-request state
 
 
 class AgencyEventHandler(AssistantEventHandler, ABC):
+    """
+    Event handler of a streamed request. The class passed to Agency.get_completion_stream is never modified: every
+    request works with its own subclass (see `for_request`) holding the request's StreamContext, and every hop with a
+    subclass of it (see `for_hop`) holding the names of the hop's agents. Concurrent streams and nested hops therefore
+    never overwrite each other's attribution.
+    """
     agent_name = None
     recipient_agent_name = None
+    context: StreamContext = None
+
+    @classmethod
+    def for_request(cls, context: StreamContext = None) -> type:
+        """Returns the handler class of a new request."""
+        return type(cls.__name__, (cls,), {"context": context or StreamContext()})
+
+    @classmethod
+    def for_hop(cls, agent_name: str, recipient_agent_name: str) -> type:
+        """Returns the handler class of one hop of the request, agent_name being the caller of the hop."""
+        return type(cls.__name__, (cls,), {"agent_name": agent_name, "recipient_agent_name": recipient_agent_name})
+
+    @classmethod
+    def with_tool_call_listener(cls, listener) -> type:
+        """
+        Returns a handler class that calls `listener(tool_call)` after on_tool_call_done of every function call, i.e.
+        as soon as the arguments of the call are complete.
+        """
+        def on_tool_call_done(self, tool_call):
+            super(handler, self).on_tool_call_done(tool_call)
+            if tool_call.type == "function":
+                listener(tool_call)
+
+        handler = type(cls.__name__, (cls,), {"on_tool_call_done": on_tool_call_done})
+        return handler
 
     @classmethod
     def on_all_streams_end(cls):
         """Fires when streams for all agents have ended, as there can be multiple if you're agents are communicating
         with each other or using tools."""
         pass
+
+
+_CALLBACKS = ("on_event", "on_run_step_created", "on_run_step_delta", "on_run_step_done", "on_tool_call_created",
+              "on_tool_call_delta", "on_tool_call_done", "on_message_created", "on_message_delta", "on_message_done",
+              "on_text_created", "on_text_delta", "on_text_done", "on_image_file_done")
+
+_RUN_STATES = {"thread.run.created", "thread.run.queued", "thread.run.in_progress", "thread.run.cancelling"}
+_RUN_ENDS = {"thread.run.completed", "thread.run.cancelled", "thread.run.expired", "thread.run.failed",
+             "thread.run.requires_action"}
+_STEP_ENDS = {"thread.run.step.completed", "thread.run.step.cancelled", "thread.run.step.expired",
+              "thread.run.step.failed"}
+
+
+class LeanEventHandler(AgencyEventHandler):
+    """
+    Low-overhead AgencyEventHandler for consumers that only need text deltas and message / tool call boundaries.
+
+    AssistantEventHandler rebuilds the message and run step snapshots on every delta event. This handler does not:
+    the `snapshot` arguments of the delta callbacks are None, and only the callbacks overridden by the subclass are
+    dispatched. Tool calls are still assembled, so on_tool_call_done receives the complete call; on_message_done,
+    on_text_done and on_run_step_done receive the completed objects sent by the API (on_text_done therefore fires
+    for every text block when the message completes).
+
+    Set `accumulate_snapshots = True` on a subclass to get the full behaviour of AgencyEventHandler back.
+    """
+    accumulate_snapshots = False
+
+    def __init__(self):
+        super().__init__()
+        self._subscribed = self._subscriptions()
+        self._final_run = None
+        self._final_messages = []
+        self._final_steps = {}
+        self._text_index = None
+        self._tool_call_index = None
+        self._tool_call_start = None    # first delta of the tool call being streamed
+        self._tool_call_arguments = []
+
+    @classmethod
+    def _subscriptions(cls) -> frozenset:
+        subscribed = cls.__dict__.get("_subscribed_callbacks")
+        if subscribed is None:
+            subscribed = frozenset(name for name in _CALLBACKS
+                                   if getattr(cls, name) is not getattr(AssistantEventHandler, name))
+            cls._subscribed_callbacks = subscribed
+        return subscribed
+
+    @property
+    def current_run(self):
+        return super().current_run if self.accumulate_snapshots else self._final_run
+
+    def get_final_run(self):
+        if self.accumulate_snapshots:
+            return super().get_final_run()
+        self.until_done()
+        if not self._final_run:
+            raise RuntimeError("No final run object found")
+        return self._final_run
+
+    def get_final_run_steps(self):
+        if self.accumulate_snapshots:
+            return super().get_final_run_steps()
+        self.until_done()
+        return list(self._final_steps.values())
+
+    def get_final_messages(self):
+        if self.accumulate_snapshots:
+            return super().get_final_messages()
+        self.until_done()
+        return list(self._final_messages)
+
+    def _emit_sse_event(self, event) -> None:
+        if self.accumulate_snapshots:
+            return super()._emit_sse_event(event)
+
+        subscribed = self._subscribed
+        name = event.event
+        self._current_event = event
+        if "on_event" in subscribed:
+            self.on_event(event)
+
+        if name == "thread.message.delta":
+            for content in event.data.delta.content or []:
+                if content.type != "text" or not content.text:
+                    continue
+                if content.index != self._text_index:
+                    self._text_index = content.index
+                    if "on_text_created" in subscribed:
+                        self.on_text_created(Text(value=content.text.value or "", annotations=[]))
+                if "on_text_delta" in subscribed:
+                    self.on_text_delta(content.text, None)
+            if "on_message_delta" in subscribed:
+                self.on_message_delta(event.data.delta, None)
+        elif name == "thread.run.step.delta":
+            details = event.data.delta.step_details
+            if details and details.type == "tool_calls" and details.tool_calls:
+                for delta in details.tool_calls:
+                    new_call = delta.index != self._tool_call_index
+                    if new_call:
+                        self._finish_tool_call()
+                        self._tool_call_index = delta.index
+                        self._tool_call_start = delta
+                    if delta.type == "function" and delta.function and delta.function.arguments:
+                        self._tool_call_arguments.append(delta.function.arguments)
+                    if new_call and "on_tool_call_created" in subscribed:
+                        self.on_tool_call_created(self._tool_call())
+                    elif not new_call and "on_tool_call_delta" in subscribed:
+                        self.on_tool_call_delta(delta, None)
+            if "on_run_step_delta" in subscribed:
+                self.on_run_step_delta(event.data.delta, None)
+        elif name in _RUN_STATES:
+            self._final_run = event.data
+        elif name in _RUN_ENDS:
+            self._final_run = event.data
+            self._finish_tool_call()
+        elif name == "thread.message.created":
+            self._text_index = None
+            if "on_message_created" in subscribed:
+                self.on_message_created(event.data)
+        elif name == "thread.message.completed" or name == "thread.message.incomplete":
+            self._final_messages.append(event.data)
+            for content in event.data.content:
+                if content.type == "text" and "on_text_done" in subscribed:
+                    self.on_text_done(content.text)
+                elif content.type == "image_file" and "on_image_file_done" in subscribed:
+                    self.on_image_file_done(content.image_file)
+            if "on_message_done" in subscribed:
+                self.on_message_done(event.data)
+        elif name == "thread.run.step.created":
+            self._final_steps[event.data.id] = event.data
+            if "on_run_step_created" in subscribed:
+                self.on_run_step_created(event.data)
+        elif name in _STEP_ENDS:
+            self._final_steps[event.data.id] = event.data
+            self._finish_tool_call()
+            if "on_run_step_done" in subscribed:
+                self.on_run_step_done(event.data)
+
+        self._current_event = None
+
+    def _tool_call(self) -> ToolCall:
+        data = self._tool_call_start.model_dump(exclude_unset=True, exclude={"index"})
+        if data.get("type") == "function":
+            data["function"] = dict(data.get("function") or {}, arguments="".join(self._tool_call_arguments))
+        return construct_type(type_=ToolCall, value=data)
+
+    def _finish_tool_call(self):
+        if self._tool_call_start is None:
+            return
+        if "on_tool_call_done" in self._subscribed:
+            self.on_tool_call_done(self._tool_call())
+        self._tool_call_index = None
+        self._tool_call_start = None
+        self._tool_call_arguments = []
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "arguments")
+
+    def __init__(self, value: Any, expires: float, arguments: dict):
+        self.value = value
+        self.expires = expires
+        self.arguments = arguments
+
+
+class ToolResultCache:
+    """
+    LRU cache of tool results with a time to live, shared by every session of the process.
+
+    Only tools declaring `cacheable = True` (see BaseTool) are cached, keyed on the tool name, its `cache_namespace`
+    and the canonical JSON of their arguments (`BaseTool.cache_key`). Tools with side effects drop the results they make stale through
+    `BaseTool.invalidates` / `BaseTool.invalidate_cache`, or explicitly with `invalidate()`.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 300.0):
+        """
+        Parameters:
+        max_entries (int, optional): Least recently used results are evicted above this size; 0 disables the cache.
+            Defaults to 1024.
+        default_ttl (float, optional): Seconds a result stays valid when its tool declares no cache_ttl.
+            Defaults to 300.
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Tuple[str, Optional[str], str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._tools: Dict[str, Dict[str, int]] = {}
+
+    def get(self, tool) -> Tuple[bool, Any]:
+        """Returns (True, result) if a valid result of the same call is cached, else (False, None)."""
+        key = (tool.__class__.__name__, tool.cache_namespace, tool.cache_key())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            counters = self._tools.setdefault(key[0], {"hits": 0, "misses": 0})
+            if entry is None:
+                self.misses += 1
+                counters["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            counters["hits"] += 1
+            return True, entry.value
+
+    def put(self, tool, value: Any):
+        if self.max_entries <= 0:
+            return
+        ttl = tool.cache_ttl if tool.cache_ttl is not None else self.default_ttl
+        key = (tool.__class__.__name__, tool.cache_namespace, tool.cache_key())
+        with self._lock:
+            self._entries[key] = _Entry(value, time.monotonic() + ttl, tool.cache_arguments())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, tool_name: str = None, **arguments) -> int:
+        """
+        Drops the cached results of `tool_name` (of every tool if None) whose arguments include all the given ones,
+        e.g. `invalidate("ReadFile", file_path="./a.txt")`. Returns the number of results dropped.
+        """
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if (tool_name is None or key[0] == tool_name)
+                     and all(entry.arguments.get(name) == value for name, value in arguments.items())]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self.invalidate()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                    "evictions": self.evictions,
+                    "expirations": self.expirations,
+                    "invalidations": self.invalidations,
+                    "tools": {name: dict(counters) for name, counters in self._tools.items()}}
+
+
+tool_cache_lock = threading.Lock()
+tool_cache = None
+
+
+def get_tool_cache() -> ToolResultCache:
+    global tool_cache
+    with tool_cache_lock:
+        if tool_cache is None:
+            tool_cache = ToolResultCache()
+    return tool_cache
+
+
+def set_tool_cache(new_cache: Optional[ToolResultCache]):
+    global tool_cache
+    with tool_cache_lock:
+        tool_cache = new_cache
@@ -0,0 +1,395 @@
+import asyncio
+import inspect
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from agency_swarm.util.log_config import setup_logging
+from agency_swarm.util.tool_resources import get_tool_resources
+
+logger = setup_logging()
+
+EXECUTIONS = ("inline", "thread", "process")
+INTERNAL_FIELDS = {"caller_agent", "event_handler", "deadline", "cancel_token"}
+
+_http_clients = weakref.WeakKeyDictionary()   # event loop -> httpx.AsyncClient
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _run_tool(tool, caller_thread=None):
+    """Calls tool.run, passing the caller thread only if run takes it (run(self) or run(self, caller_thread))."""
+    if len(inspect.signature(tool.run).parameters):
+        return tool.run(caller_thread)
+    return tool.run()
+
+
+def _run_in_process(tool_class, arguments: dict):
+    """Entry point of a worker process: rebuilds the tool from its arguments and runs it."""
+    tool = tool_class(**arguments)
+    release = get_tool_resources().acquire(tool)   # the resources of the worker process
+    try:
+        output = _run_tool(tool)  # the caller thread stays in the parent process
+        return asyncio.run(output) if inspect.iscoroutine(output) else output
+    finally:
+        release()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """The connection pool shared by the async tools running on the current event loop, e.g. the async OpenAPI tools."""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = _http_clients[loop] = httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_connections=100))
+    return client
+
+
+async def _drain():
+    """Cancels the pending tool calls of the loop and closes its connection pool."""
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class _ExecutionMetrics:
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.cancelled = 0
+        self.run_time = 0.0
+        self.max_run_time = 0.0
+
+    def as_dict(self) -> dict:
+        return {"submitted": self.submitted, "completed": self.completed, "failed": self.failed,
+                "timeouts": self.timeouts, "crashes": self.crashes, "cancelled": self.cancelled,
+                "run_time": round(self.run_time, 3), "max_run_time": round(self.max_run_time, 3)}
+
+
+class ToolExecutor:
+    """
+    Runs tool calls according to the `execution` declared by the tool class (see BaseTool):
+
+    - "inline": on the thread of the session, as before.
+    - "thread": on a shared thread pool, so the session can give up waiting on a timeout or a cancellation.
+    - "process": on a pool of warm worker processes, for CPU-bound tools that would hold the GIL and stall every
+      other conversation of the process. The worker rebuilds the tool from its class and its arguments (the model
+      dump without the internal fields), so the tool class must be importable and its output picklable. A worker
+      that crashes or runs over its timeout is terminated and the pool restarted; the call fails with an error
+      that is handed to the model like any other tool error.
+
+    Tools with an `async def run` (unless they run in a process) are scheduled on one shared event loop running on
+    its own thread, so the I/O of all the async tool calls of the process is multiplexed on that loop while each
+    session waits for its own call.
+
+    Before a call, the ToolResources of the process lend the resources declared by the tool (see
+    util/tool_resources.py); they are given back with the concurrency slots.
+
+    The executor also enforces the concurrency constraints declared by the tool classes, across all the sessions of
+    the process: at most `max_concurrency` calls of a `concurrency_group` at once (1 makes the group exclusive), and
+    one call at a time per resource key returned by `resource_keys()`. A call waits for its slots before it runs and
+    gives up on its deadline or its cancellation. The slots are held until the call has really finished, even when
+    the session stopped waiting for it. A tool holding a slot must not wait for another call of the same group.
+    """
+
+    def __init__(self,
+                 max_threads: int = 8,
+                 max_processes: int = None,
+                 mp_context: str = "spawn",
+                 poll_interval: float = 0.05,
+                 concurrency_limits: Dict[str, int] = None):
+        """
+        Parameters:
+        max_threads (int, optional): Size of the thread pool of "thread" tools. Defaults to 8.
+        max_processes (int, optional): Number of worker processes of "process" tools. Defaults to the number of CPUs.
+        mp_context (str, optional): Start method of the worker processes. "spawn" does not copy the locks held by the threads of this process. Defaults to "spawn".
+        poll_interval (float, optional): Seconds between two checks of the cancel token of a waiting call. Defaults to 0.05.
+        concurrency_limits (Dict[str, int], optional): Limits of concurrency groups overriding the max_concurrency of their tools, e.g. {"browser": 1}. Defaults to None.
+        """
+        self.max_threads = max_threads
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self.mp_context = mp_context
+        self.poll_interval = poll_interval
+        self.concurrency_limits = dict(concurrency_limits or {})
+
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _ExecutionMetrics] = {execution: _ExecutionMetrics()
+                                                       for execution in EXECUTIONS + ("async",)}
+        self._groups: Dict[str, threading.BoundedSemaphore] = {}
+        self._resources: Dict[str, list] = {}   # resource key -> [lock, calls holding or waiting for it]
+        self._slot_metrics: Dict[str, dict] = {}
+        self._submitted: Dict[object, set] = {}   # pool -> its calls that are not done yet
+        self.restarts = 0
+
+    def run(self, tool, caller_thread=None):
+        """Runs a tool instance, with the deadline and the cancel token set on it by the session."""
+        execution = tool.execution
+        if execution not in EXECUTIONS:
+            raise Exception(f"Invalid execution of {tool.__class__.__name__}: {execution}. "
+                            f"Must be one of {', '.join(EXECUTIONS)}.")
+        if execution != "process" and inspect.iscoroutinefunction(tool.run):
+            execution = "async"
+        metrics = self._metrics[execution]
+        with self._lock:
+            metrics.submitted += 1
+        started = time.monotonic()
+        try:
+            release = self._acquire(tool)
+            if execution != "process":
+                release = self._lend_resources(tool, release)
+            if execution == "inline":
+                try:
+                    output = _run_tool(tool, caller_thread)
+                finally:
+                    release()
+            elif execution == "thread":
+                pool = self._thread_pool()
+                future = self._track(pool, self._hold(release, pool.submit, _run_tool, tool, caller_thread))
+                output = self._wait(future, tool, metrics)
+            elif execution == "async":
+                future = self._hold(release, lambda: asyncio.run_coroutine_threadsafe(_run_tool(tool, caller_thread),
+                                                                                      self._event_loop()))
+                output = self._wait(future, tool, metrics)
+            else:
+                output = self._run_in_process(tool, metrics, release)
+        except Exception:
+            with self._lock:
+                metrics.failed += 1
+            raise
+        run_time = time.monotonic() - started
+        with self._lock:
+            metrics.completed += 1
+            metrics.run_time += run_time
+            metrics.max_run_time = max(metrics.max_run_time, run_time)
+        return output
+
+    def _run_in_process(self, tool, metrics: _ExecutionMetrics, release: Callable[[], None]):
+        arguments = tool.model_dump(exclude=INTERNAL_FIELDS)
+        pool = self._process_pool()
+        try:
+            future = self._track(pool, self._hold(release, pool.submit, _run_in_process, tool.__class__, arguments))
+            return self._wait(future, tool, metrics, pool)
+        except BrokenProcessPool:
+            with self._lock:
+                metrics.crashes += 1
+            self._restart(pool)
+            raise Exception(f"The process running {tool.__class__.__name__} crashed.")
+
+    def _wait(self, future: Future, tool, metrics: _ExecutionMetrics, pool: ProcessPoolExecutor = None):
+        timeouts = [t for t in (tool.execution_timeout, tool.deadline.remaining() if tool.deadline else None)
+                    if t is not None]
+        expires = time.monotonic() + min(timeouts) if timeouts else None
+        while True:
+            wait = self.poll_interval if tool.cancel_token else None
+            if expires is not None:
+                remaining = max(0.0, expires - time.monotonic())
+                wait = remaining if wait is None else min(wait, remaining)
+            try:
+                return future.result(timeout=wait)
+            except TimeoutError:
+                pass
+            if tool.cancel_token and tool.cancel_token.cancelled:
+                future.cancel()
+                with self._lock:
+                    metrics.cancelled += 1
+                tool.cancel_token.raise_if_cancelled()
+            if expires is not None and time.monotonic() >= expires:
+                with self._lock:
+                    metrics.timeouts += 1
+                if not future.cancel() and pool is not None:
+                    self._restart(pool)  # 终止卡住的worker进程
+                raise Exception(f"{tool.__class__.__name__} timed out after {min(timeouts):.1f}s.")
+
+    def _acquire(self, tool) -> Callable[[], None]:
+        """Waits for the concurrency slots of a call and returns the function releasing them."""
+        slots = []   # (name, slot, resource key)
+        group = tool.concurrency_group or tool.__class__.__name__
+        limit = self.concurrency_limits.get(group, tool.max_concurrency)
+        if limit is not None:
+            with self._lock:
+                if group not in self._groups:
+                    self._groups[group] = threading.BoundedSemaphore(limit)
+                slots.append((group, self._groups[group], None))
+        for key in sorted(set(tool.resource_keys())):   # 固定的顺序，避免死锁
+            with self._lock:
+                entry = self._resources.setdefault(key, [threading.Lock(), 0])
+                entry[1] += 1
+            slots.append((key, entry[0], key))
+
+        acquired = []
+
+        def release():
+            for _, slot, _ in reversed(acquired):
+                slot.release()
+            with self._lock:
+                for _, _, key in slots:
+                    if key is not None:
+                        self._resources[key][1] -= 1
+                        if not self._resources[key][1]:
+                            del self._resources[key]
+
+        try:
+            for name, slot, key in slots:
+                self._wait_for_slot(name, slot, tool)
+                acquired.append((name, slot, key))
+        except BaseException:
+            release()
+            raise
+        return release
+
+    @staticmethod
+    def _lend_resources(tool, release_slots: Callable[[], None]) -> Callable[[], None]:
+        try:
+            release_resources = get_tool_resources().acquire(tool)
+        except BaseException:
+            release_slots()
+            raise
+
+        def release():
+            release_resources()
+            release_slots()
+
+        return release
+
+    def _wait_for_slot(self, name: str, slot, tool):
+        started = time.monotonic()
+        contended = not slot.acquire(blocking=False)
+        while contended and not slot.acquire(timeout=self.poll_interval):
+            if tool.cancel_token:
+                tool.cancel_token.raise_if_cancelled()
+            if tool.deadline and tool.deadline.expired():
+                raise Exception(f"{tool.__class__.__name__} timed out waiting for {name}.")
+        waited = time.monotonic() - started
+        with self._lock:
+            metrics = self._slot_metrics.setdefault(name, {"calls": 0, "waited": 0, "wait_time": 0.0,
+                                                           "max_wait_time": 0.0})
+            metrics["calls"] += 1
+            metrics["waited"] += contended
+            metrics["wait_time"] += waited
+            metrics["max_wait_time"] = max(metrics["max_wait_time"], waited)
+
+    @staticmethod
+    def _hold(release: Callable[[], None], submit, *args) -> Future:
+        """Submits a call whose concurrency slots are released when it is done, not when the session stops waiting."""
+        try:
+            future = submit(*args)
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(lambda _: release())
+        return future
+
+    def _track(self, pool, future: Future) -> Future:
+        """Remembers the calls of a pool that are not done yet, so that shutting it down cancels those not started."""
+        with self._lock:
+            self._submitted.setdefault(pool, set()).add(future)
+        future.add_done_callback(lambda _: self._untrack(pool, future))
+        return future
+
+    def _untrack(self, pool, future: Future):
+        with self._lock:
+            self._submitted.get(pool, set()).discard(future)
+
+    def _shutdown(self, pool, wait: bool):
+        """Shuts a pool down and cancels its calls that have not started (cancel_futures needs Python 3.9)."""
+        with self._lock:
+            futures = self._submitted.pop(pool, set())
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=wait)
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="tool_thread")
+            return self._threads
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="tool_event_loop", daemon=True).start()
+            return self._loop
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_processes,
+                                                      mp_context=multiprocessing.get_context(self.mp_context))
+            return self._processes
+
+    def _restart(self, pool: ProcessPoolExecutor):
+        """Terminates the workers of a broken or stuck pool; the next call starts a new pool."""
+        with self._lock:
+            if self._processes is not pool:
+                return
+            self._processes = None
+            self.restarts += 1
+        logger.info("Restarting the tool process pool...")
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        self._shutdown(pool, wait=False)
+
+    def warm_up(self):
+        """Starts all the worker processes now instead of on the first "process" tool call."""
+        pool = self._process_pool()
+        for future in [pool.submit(_warm_up) for _ in range(self.max_processes)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            threads, processes, loop = self._threads, self._processes, self._loop
+            self._threads = self._processes = self._loop = None
+        if loop:
+            asyncio.run_coroutine_threadsafe(_drain(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+        if threads:
+            self._shutdown(threads, wait=False)
+        if processes:
+            self._shutdown(processes, wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {execution: metrics.as_dict() for execution, metrics in self._metrics.items()}
+            stats["processes"] = len(self._processes._processes or {}) if self._processes else 0
+            stats["restarts"] = self.restarts
+            stats["concurrency"] = {name: {**metrics, "wait_time": round(metrics["wait_time"], 3),
+                                           "max_wait_time": round(metrics["max_wait_time"], 3)}
+                                    for name, metrics in self._slot_metrics.items()}
+            return stats
+
+
+executor_lock = threading.Lock()
+executor = None
+
+
+def get_tool_executor() -> ToolExecutor:
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ToolExecutor()
+    return executor
+
+
+def set_tool_executor(new_executor: Optional[ToolExecutor]):
+    global executor
+    with executor_lock:
+        executor = new_executor
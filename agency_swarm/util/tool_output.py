@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class ToolOutputPolicy:
+    """
+    Bounds the size of a tool output submitted to the model.
+
+    An output longer than `max_chars` keeps its head and its tail. The middle is dropped, or with `spill` it is kept
+    in the ToolOutputStore and the output tells the model the handle to page through the whole output with the
+    ReadToolOutput tool. Set it for one tool with `output_policy` on the tool class, or for all the tools of an agent
+    with `Agent(tool_output_policy=...)`.
+    """
+
+    def __init__(self, max_chars: Optional[int] = 8000, head_ratio: float = 0.7, spill: bool = True):
+        """
+        Parameters:
+        max_chars (int, optional): Longest output submitted as it is, None for no limit. Defaults to 8000.
+        head_ratio (float, optional): Share of max_chars kept from the start of a longer output, the rest is kept from its end. Defaults to 0.7.
+        spill (bool, optional): Store longer outputs in the ToolOutputStore so they can be read with ReadToolOutput. Defaults to True.
+        """
+        self.max_chars = max_chars
+        self.head_ratio = head_ratio
+        self.spill = spill
+
+    def apply(self, tool_name: str, output: str, store: 'ToolOutputStore') -> str:
+        if self.max_chars is None or len(output) <= self.max_chars:
+            return output
+        head = int(self.max_chars * self.head_ratio)
+        tail = self.max_chars - head
+        omitted = len(output) - head - tail
+        if self.spill:
+            handle = store.put(tool_name, output)
+            note = (f"[... {omitted} characters omitted. The whole output has {len(output)} characters, read it with "
+                    f'ReadToolOutput(handle="{handle}", offset={head}, limit=...) ...]')
+        else:
+            note = f"[... {omitted} characters omitted ...]"
+        return output[:head] + "\n" + note + "\n" + (output[-tail:] if tail else "")
+
+
+class ToolOutputStore:
+    """
+    Local blob store of spilled tool outputs, one file per output, and size metrics of all tool outputs.
+
+    The files are written to `directory` (a new temporary directory by default, created on the first spill). Only the
+    `max_outputs` most recent outputs are kept.
+    """
+
+    def __init__(self, directory: str = None, max_outputs: int = 256):
+        self.directory = directory
+        self.max_outputs = max_outputs
+        self._outputs: "OrderedDict[str, tuple]" = OrderedDict()   # handle -> (path, characters)
+        self._owns_directory = directory is None
+        self._lock = threading.Lock()
+        self._tools: Dict[str, dict] = {}
+
+    def put(self, tool_name: str, output: str) -> str:
+        """Stores a whole output and returns its handle."""
+        handle = "out_" + uuid.uuid4().hex[:16]
+        with self._lock:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix="agency_swarm_tool_outputs_")
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, handle + ".txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(output)
+            self._outputs[handle] = (path, len(output))
+            self._metrics(tool_name)["spilled"] += 1
+            while len(self._outputs) > self.max_outputs:
+                _, (stale, _) = self._outputs.popitem(last=False)
+                self._remove(stale)
+        return handle
+
+    def read(self, handle: str, offset: int = 0, limit: int = 4000) -> str:
+        """Returns `limit` characters of a stored output, starting at `offset`."""
+        path, _ = self._lookup(handle)
+        with open(path, "r", encoding="utf-8") as f:
+            output = f.read()
+        return output[offset:offset + limit]
+
+    def size(self, handle: str) -> int:
+        """Number of characters of a stored output."""
+        return self._lookup(handle)[1]
+
+    def _lookup(self, handle: str) -> tuple:
+        with self._lock:
+            stored = self._outputs.get(handle)
+        if stored is None:
+            raise Exception(f"Unknown tool output handle: {handle}. It may have expired.")
+        return stored
+
+    def record(self, tool_name: str, chars: int, submitted_chars: int):
+        """Records the size of an output of a tool and the size actually submitted to the model."""
+        with self._lock:
+            metrics = self._metrics(tool_name)
+            metrics["calls"] += 1
+            metrics["chars"] += chars
+            metrics["max_chars"] = max(metrics["max_chars"], chars)
+            metrics["submitted_chars"] += submitted_chars
+            if submitted_chars != chars:
+                metrics["truncated"] += 1
+
+    def _metrics(self, tool_name: str) -> dict:
+        return self._tools.setdefault(tool_name, {"calls": 0, "chars": 0, "max_chars": 0, "submitted_chars": 0,
+                                                  "truncated": 0, "spilled": 0})
+
+    def clear(self):
+        """Deletes all stored outputs."""
+        with self._lock:
+            for path, _ in self._outputs.values():
+                self._remove(path)
+            self._outputs.clear()
+            if self._owns_directory and self.directory:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                self.directory = None
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self._outputs)
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: dict(metrics) for name, metrics in self._tools.items()}
+
+
+store_lock = threading.Lock()
+store = None
+
+
+def get_tool_output_store() -> ToolOutputStore:
+    global store
+    with store_lock:
+        if store is None:
+            store = ToolOutputStore()
+    return store
+
+
+def set_tool_output_store(new_store: ToolOutputStore):
+    global store
+    with store_lock:
+        store = new_store
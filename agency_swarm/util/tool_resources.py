@@ -0,0 +1,268 @@
+import atexit
+import threading
+import weakref
+from collections import deque
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+from agency_swarm.util.log_config import setup_logging
+
+logger = setup_logging()
+
+T = TypeVar("T")
+
+
+class ToolResource(Generic[T]):
+    """
+    An expensive resource of a tool, e.g. a DB connection, an HTTP session or a loaded model. It is created once by
+    the ToolResources of the process (so once per worker for "process" tools) and reused by the calls of the tool,
+    instead of being rebuilt on every call or hidden in a module global.
+
+    Declare it on the tool class and use it like an attribute in run():
+
+        class Query(BaseTool):
+            db: ClassVar[ToolResource[sqlite3.Connection]] = ToolResource(
+                lambda: sqlite3.connect("app.db", check_same_thread=False), close=lambda c: c.close(), pool_size=4)
+
+            def run(self):
+                return self.db.execute(self.sql).fetchall()
+
+    Without `pool_size` all the calls share one instance, which must then be thread-safe. With `pool_size` each call
+    borrows its own instance from a pool of at most `pool_size` instances and gives it back when it is done. The same
+    ToolResource object declared on several tool classes is shared by them.
+    """
+
+    def __init__(self,
+                 factory: Callable[[], T],
+                 close: Callable[[T], None] = None,
+                 pool_size: int = None,
+                 check: Callable[[T], bool] = None,
+                 name: str = None):
+        """
+        Parameters:
+        factory (Callable[[], T]): Creates an instance of the resource.
+        close (Callable[[T], None], optional): Releases an instance when the resources are closed. Defaults to None.
+        pool_size (int, optional): Maximum number of instances, each used by one call at a time. Defaults to None (one instance shared by all the calls).
+        check (Callable[[T], bool], optional): Tells whether an idle pooled instance can still be used, otherwise it is closed and replaced. Defaults to None.
+        name (str, optional): Name of the resource in the stats. Defaults to the name of the attribute declaring it.
+        """
+        self.factory = factory
+        self.close = close
+        self.pool_size = pool_size
+        self.check = check
+        self.name = name
+
+    def __set_name__(self, owner, name):
+        self.name = self.name or name
+
+    def __get__(self, tool, owner=None) -> T:
+        if tool is None:
+            return self
+        leased = tool._resources
+        if self not in leased:
+            # the tool is run directly, not by the ToolExecutor: the instance is given back with the tool
+            registry = get_tool_resources()
+            registry.start(tool.__class__)
+            pool = registry._pool(self)
+            leased[self] = pool.acquire(tool, registry.poll_interval)
+            weakref.finalize(tool, pool.release, leased[self])
+        return leased[self]
+
+
+class _Pool:
+    def __init__(self, resource: ToolResource):
+        self.resource = resource
+        self.condition = threading.Condition()
+        self.shared = None
+        self.idle = deque()
+        self.created = 0
+        self.in_use = 0
+        self.borrowed = 0
+        self.waited = 0
+        self.closed = False
+
+    def acquire(self, tool, poll_interval: float):
+        with self.condition:
+            if self.resource.pool_size is None:
+                if self.shared is None:
+                    self.shared = self.resource.factory()
+                    self.created += 1
+                self.in_use += 1
+                self.borrowed += 1
+                return self.shared
+            waited = False
+            while True:
+                while self.idle:
+                    instance = self.idle.pop()
+                    if self.resource.check is None or self.resource.check(instance):
+                        self.in_use += 1
+                        self.borrowed += 1
+                        return instance
+                    self.created -= 1
+                    self._close(instance)
+                if self.created < self.resource.pool_size:
+                    self.created += 1
+                    break
+                if not waited:
+                    waited = True
+                    self.waited += 1
+                self.condition.wait(poll_interval)
+                if tool.cancel_token:
+                    tool.cancel_token.raise_if_cancelled()
+                if tool.deadline and tool.deadline.expired():
+                    raise Exception(f"{tool.__class__.__name__} timed out waiting for the resource "
+                                    f"{self.resource.name}.")
+        try:
+            instance = self.resource.factory()
+        except BaseException:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.in_use += 1
+            self.borrowed += 1
+        return instance
+
+    def release(self, instance):
+        with self.condition:
+            self.in_use -= 1
+            if instance is self.shared:
+                if not self.closed or self.in_use:
+                    return
+                self.shared = None   # the last call using a closed shared instance closes it
+                self.created -= 1
+                self._close(instance)
+                return
+            if self.closed:
+                self.created -= 1
+                self._close(instance)
+                return
+            self.idle.append(instance)
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            instances = list(self.idle)
+            if self.shared is not None and not self.in_use:
+                instances.append(self.shared)
+                self.shared = None
+            self.created -= len(instances)
+            self.idle.clear()
+        for instance in instances:
+            self._close(instance)
+
+    def _close(self, instance):
+        if self.resource.close is None:
+            return
+        try:
+            self.resource.close(instance)
+        except Exception as e:
+            logger.warning(f"Failed to close the resource {self.resource.name}: {e}")
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {"created": self.created, "in_use": self.in_use, "idle": len(self.idle),
+                    "borrowed": self.borrowed, "waited": self.waited}
+
+
+class ToolResources:
+    """
+    Lifespan of the tools of a process: runs the `startup` hook of a tool class before its first call and its
+    `shutdown` hook on `close()`, and creates, lends and closes the ToolResources declared by the tools. The
+    ToolExecutor lends the resources of a call before running it and takes them back once the call is done.
+    """
+
+    def __init__(self, poll_interval: float = 0.05):
+        """
+        Parameters:
+        poll_interval (float, optional): Seconds between two checks of the cancel token of a call waiting for a pooled resource. Defaults to 0.05.
+        """
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pools: Dict[ToolResource, _Pool] = {}
+        self._started: Dict[type, None] = {}   # in the order of their startup
+        self._starting: Dict[type, threading.Lock] = {}
+
+    def start(self, *tool_classes: type):
+        """Runs the startup hooks of tool classes that have not been started yet, e.g. when a server starts."""
+        for tool_class in tool_classes:
+            with self._lock:
+                if tool_class in self._started:
+                    continue
+                lock = self._starting.setdefault(tool_class, threading.Lock())
+            with lock:   # 其他调用等待startup完成
+                with self._lock:
+                    if tool_class in self._started:
+                        continue
+                tool_class.startup()
+                with self._lock:
+                    self._started[tool_class] = None
+
+    def acquire(self, tool, resources: List[ToolResource] = None) -> Callable[[], None]:
+        """Starts the tool class and lends the resources of a call. Returns the function giving them back."""
+        self.start(tool.__class__)
+        if resources is None:
+            resources = list(tool.tool_resources().values())
+        leased = []
+
+        def release():
+            for pool, resource, instance in reversed(leased):
+                tool._resources.pop(resource, None)
+                pool.release(instance)
+            leased.clear()
+
+        try:
+            for resource in resources:
+                pool = self._pool(resource)
+                instance = pool.acquire(tool, self.poll_interval)
+                leased.append((pool, resource, instance))
+                tool._resources[resource] = instance
+        except BaseException:
+            release()
+            raise
+        return release
+
+    def _pool(self, resource: ToolResource) -> _Pool:
+        with self._lock:
+            pool = self._pools.get(resource)
+            if pool is None:
+                pool = self._pools[resource] = _Pool(resource)
+            return pool
+
+    def close(self):
+        """Runs the shutdown hooks of the started tool classes and closes the resources, those in use once their call is done."""
+        with self._lock:
+            started, self._started = list(self._started), {}
+            pools, self._pools = list(self._pools.values()), {}
+        for tool_class in reversed(started):
+            try:
+                tool_class.shutdown()
+            except Exception as e:
+                logger.warning(f"Shutdown hook of {tool_class.__name__} failed: {e}")
+        for pool in pools:
+            pool.close()
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            pools = list(self._pools.values())
+        return {pool.resource.name: pool.stats() for pool in pools}
+
+
+resources_lock = threading.Lock()
+resources = None
+
+
+def get_tool_resources() -> ToolResources:
+    global resources
+    with resources_lock:
+        if resources is None:
+            resources = ToolResources()
+            atexit.register(resources.close)
+    return resources
+
+
+def set_tool_resources(new_resources: Optional[ToolResources]):
+    global resources
+    with resources_lock:
+        resources = new_resources
@@ -0,0 +1,77 @@
+"""
+Compares a fixed concurrency limit with the adaptive limiter against the stand-in backend with injected throttling.
+
+The backend accepts `capacity` concurrent generations per model and answers everything above it with HTTP 429, and
+its latency grows with load. Each worker runs one-off Session hops against one of two agents using different models.
+
+Usage: python tests/benchmarks/bench_adaptive_limiter.py [--workers 32] [--hops 4] [--capacity 6]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from stand_in_backend import StandInBackend, stand_in_agent
+
+from agency_swarm.util import AdaptiveLimiter, set_openai_client, set_concurrency_limiter
+from agency_swarm.sessions import Session
+from agency_swarm.user import User
+
+
+def run(limiter: AdaptiveLimiter, workers: int, hops: int, capacity: int):
+    backend = StandInBackend(latency=0.05, capacity=capacity, congestion=0.1)
+    set_openai_client(backend.client())
+    set_concurrency_limiter(limiter)
+    agents = [stand_in_agent(backend, "Writer", model="gpt-4"),
+              stand_in_agent(backend, "Reader", model="gpt-3.5-turbo")]
+    failures = []
+
+    def worker(i):
+        agent = agents[i % len(agents)]
+        for hop in range(hops):
+            try:
+                gen = Session(User(), agent).get_completion(f"task {i}.{hop}", is_persist=False)
+                while True:
+                    next(gen)
+            except StopIteration:
+                pass
+            except Exception as e:
+                failures.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    return {"elapsed": elapsed,
+            "hops/s": workers * hops / elapsed,
+            "429s": backend.throttled,
+            "failures": len(failures),
+            "limits": {m: s["limit"] for m, s in limiter.stats().items() if m != "default"}}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--hops", type=int, default=4)
+    parser.add_argument("--capacity", type=int, default=6)
+    args = parser.parse_args()
+
+    fixed = AdaptiveLimiter(initial_limit=args.workers, min_limit=args.workers, max_limit=args.workers,
+                            max_retries=50)
+    adaptive = AdaptiveLimiter(initial_limit=4, max_retries=50)
+
+    for name, limiter in (("fixed", fixed), ("adaptive", adaptive)):
+        result = run(limiter, args.workers, args.hops, args.capacity)
+        print(f"{name:>8}: {result['elapsed']:.2f}s  {result['hops/s']:.1f} hops/s  "
+              f"429s={result['429s']}  failures={result['failures']}  limits={result['limits']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares the busy-thread policies of an agent under bursty traffic to one topic.
+
+Every message is routed to the same existing thread of the agent, so all but one of each burst find it busy. With
+"fork" each of them copies the thread (threads.create + messages.list per copy, and one more server thread per
+message); with "wait" they queue for the thread instead.
+
+Usage: python tests/benchmarks/bench_busy_thread_policy.py [--burst 8] [--rounds 3] [--latency 0.1]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from stand_in_backend import StandInBackend, default_responder, stand_in_agent
+
+from agency_swarm.sessions import Session
+from agency_swarm.threads import ThreadLockManager, set_thread_lock_manager
+from agency_swarm.user import User
+from agency_swarm.util import set_openai_client, set_concurrency_limiter
+
+
+def same_topic(assistant, messages):
+    if messages and '"session_id"' in messages[0]["content"]:
+        return {"content": json.dumps({"session_id": 1, "reason": "same topic"})}
+    return default_responder(assistant, messages)
+
+
+def complete(session, message):
+    gen = session.get_completion(message)
+    try:
+        while True:
+            next(gen)
+    except StopIteration as e:
+        return e.value
+
+
+def run(policy: str, burst: int, rounds: int, latency: float):
+    backend = StandInBackend(responder=same_topic, latency=latency)
+    set_openai_client(backend.client())
+    set_concurrency_limiter(None)
+    manager = ThreadLockManager()
+    set_thread_lock_manager(manager)
+    agent = stand_in_agent(backend, "Worker", busy_thread_policy=policy, busy_thread_timeout=60)
+    complete(Session(User(), agent), "warm up")
+    backend.reset_calls()
+
+    latencies = []
+
+    def request(message):
+        started = time.monotonic()
+        complete(Session(User(), agent), message)
+        latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    for r in range(rounds):
+        threads = [threading.Thread(target=request, args=(f"message {r}.{i}",)) for i in range(burst)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.monotonic() - started
+
+    stats = manager.stats()
+    latencies.sort()
+    return {"elapsed": elapsed,
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[int(len(latencies) * 0.95) - 1],
+            "server threads": backend.count("threads.create"),
+            "copy reads": backend.count("messages.list") - burst * rounds,
+            "forks": stats["forks"],
+            "queued": stats["queued"],
+            "wait_time": stats["wait_time"]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    for policy in ("fork", "wait"):
+        result = run(policy, args.burst, args.rounds, args.latency)
+        print(f"{policy:>5}: {result['elapsed']:.2f}s  p50={result['p50']:.2f}s  p95={result['p95']:.2f}s  "
+              f"server threads={result['server threads']}  copy reads={result['copy reads']}  "
+              f"forks={result['forks']}  queued={result['queued']}  wait={result['wait_time']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compares the cost of dispatching a recorded Assistants stream through AgencyEventHandler (which rebuilds message and
+run step snapshots on every delta) and LeanEventHandler, both with the callbacks of a typical consumer: text deltas
+and tool call boundaries.
+
+The stream is recorded once from the stand-in backend: a run calling two tools with long arguments, then a long
+answer, streamed `--chunk` characters per delta. Events are replayed from memory, so only the handler is measured.
+
+Usage: python tests/benchmarks/bench_lean_stream.py [--chars 20000] [--chunk 4] [--rounds 5]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from stand_in_backend import StandInBackend
+
+from agency_swarm import AgencyEventHandler, LeanEventHandler
+
+
+class Consumer:
+    def on_text_delta(self, delta, snapshot):
+        self.chars += len(delta.value)
+
+    def on_tool_call_done(self, tool_call):
+        self.tool_calls.append(tool_call.function.name)
+
+
+class FullConsumer(Consumer, AgencyEventHandler):
+    def __init__(self):
+        super().__init__()
+        self.chars, self.tool_calls = 0, []
+
+
+class LeanConsumer(Consumer, LeanEventHandler):
+    def __init__(self):
+        super().__init__()
+        self.chars, self.tool_calls = 0, []
+
+
+class Replay(list):
+    def close(self):
+        pass
+
+
+def record(chars: int, chunk: int) -> list:
+    """Returns the events of each stream of the run: the tool calls, then the answer."""
+    def responder(assistant, messages):
+        if messages[-1]["role"] == "tool":
+            return {"content": ("lorem ipsum " * (chars // 12 + 1))[:chars]}
+        return {"tool_calls": [{"name": "Search", "arguments": {"query": "q" * (chars // 10)}},
+                               {"name": "Fetch", "arguments": {"urls": ["https://example.com"] * (chars // 200)}}]}
+
+    return StandInBackend(responder=responder, chunk_size=chunk).record_streams("go")
+
+
+def replay(handler_class, streams: list) -> tuple:
+    """Replays every stream with its own handler, as Session does, and returns what the consumers saw."""
+    chars, tool_calls = 0, []
+    for events in streams:
+        handler = handler_class()
+        handler._init(Replay(events))
+        handler.until_done()
+        chars += handler.chars
+        tool_calls += handler.tool_calls
+    return chars, tool_calls
+
+
+def run(handler_class, streams: list, rounds: int) -> dict:
+    # the full handler mutates the events it accumulates into, every round gets its own copy
+    copies = [[[event.model_copy(deep=True) for event in events] for events in streams] for _ in range(rounds + 1)]
+    seen = replay(handler_class, copies.pop())
+
+    started = time.perf_counter()
+    for copy in copies[1:]:
+        replay(handler_class, copy)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    replay(handler_class, copies[0])
+    _, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    events = sum(len(events) for events in streams)
+    return {"events/s": events * (rounds - 1) / elapsed, "peak": peak, "blocks": blocks, "seen": seen}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chars", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    streams = record(args.chars, args.chunk)
+    print(f"recorded {sum(len(events) for events in streams)} events in {len(streams)} streams")
+    results = {}
+    for handler_class in (FullConsumer, LeanConsumer):
+        results[handler_class] = result = run(handler_class, streams, max(args.rounds, 2))
+        print(f"{handler_class.__name__:>13}: {result['events/s']:>10,.0f} events/s  "
+              f"peak {result['peak'] / 1024:,.0f} KiB  blocks retained {result['blocks']:,}")
+    full, lean = results[FullConsumer], results[LeanConsumer]
+    assert full["seen"] == lean["seen"], "the handlers disagree"
+    print(f"speed-up x{lean['events/s'] / full['events/s']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the Assistants engine (Session) with the chat completions engine (ChatCompletionSession) on the same
+agency: a CEO that delegates every user message to a Worker through SendMessage.
+
+Every request to the stand-in backend costs `--rtt` seconds and every generation `--latency` more. The benchmark
+reports, per user request, the API round trips, the time to the first streamed token and the total time.
+
+Usage: python tests/benchmarks/bench_session_engines.py [--requests 5] [--rtt 0.03] [--latency 0.2]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from stand_in_backend import StandInBackend, default_responder
+
+from agency_swarm import Agency, Agent, AgencyEventHandler
+from agency_swarm.util import set_openai_client, set_concurrency_limiter
+
+
+def responder(assistant, messages):
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    last = messages[-1]
+    if "You are the CEO" in system:
+        if last["role"] == "user":
+            return {"tool_calls": [{"name": "SendMessage",
+                                    "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                                  "message": last["content"]}}]}
+        return {"content": f"The worker says: {last['content']}"}
+    return default_responder(assistant, messages)
+
+
+class FirstTokenHandler(AgencyEventHandler):
+    first_token_at = None
+
+    def on_text_delta(self, delta, snapshot):
+        if FirstTokenHandler.first_token_at is None:
+            FirstTokenHandler.first_token_at = time.monotonic()
+
+
+def run(engine: str, requests: int, rtt: float, latency: float):
+    cwd, tmp = os.getcwd(), tempfile.mkdtemp()
+    os.chdir(tmp)
+    try:
+        backend = StandInBackend(responder=responder, rtt=rtt, latency=latency)
+        set_openai_client(backend.client())
+        set_concurrency_limiter(None)
+        ceo = Agent(name="CEO", description="ceo", instructions="You are the CEO.")
+        worker = Agent(name="Worker", description="worker", instructions="You are the worker.")
+        agency = Agency([ceo, [ceo, worker]], engine=engine)
+
+        calls, first_tokens, totals = 0, [], []
+        for i in range(requests):
+            backend.reset_calls()
+            FirstTokenHandler.first_token_at = None
+            started = time.monotonic()
+            agency.get_completion_stream(f"task number {i}", FirstTokenHandler, message_files=None)
+            totals.append(time.monotonic() - started)
+            first_tokens.append(FirstTokenHandler.first_token_at - started)
+            calls += len(backend.calls)
+        return {"calls/request": calls / requests,
+                "first token": sum(first_tokens) / requests,
+                "total": sum(totals) / requests}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--rtt", type=float, default=0.03)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    for engine in ("assistants", "chat_completions"):
+        result = run(engine, args.requests, args.rtt, args.latency)
+        print(f"{engine:>16}: {result['calls/request']:.1f} calls/request  "
+              f"first token {result['first token']:.2f}s  total {result['total']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,657 @@
+"""
+A local stand-in for the OpenAI REST API used by tests and benchmarks.
+
+The stand-in is plugged into a real `openai.OpenAI` client through an `httpx.MockTransport`, so every request goes
+through the same SDK code paths (pagination, streaming, error mapping) as in production, without any network access.
+
+Only the endpoints used by agency_swarm are implemented: assistants, threads, messages, runs (polling and streaming),
+tool output submission, run listing and cancellation, chat completions (plain and streaming), files and batches.
+The batch endpoint is directory based: uploaded files and result files are stored in `batch_dir`, and a batch
+answers every line of its input file with the responder when it is created.
+
+The behaviour of the "model" is decided by a responder callable:
+
+    responder(assistant: dict, messages: List[dict]) -> dict
+
+`messages` is a list of {"role": ..., "content": ...} dicts (tool outputs of the current run are appended with role
+"tool"). The responder returns either {"content": "..."} or {"tool_calls": [{"name": ..., "arguments": {...}}]}.
+Returning {"hang": True} keeps the run `in_progress` until it is cancelled.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("AS_PROJECT_ROOT", tempfile.gettempdir())
+
+import httpx
+import openai
+
+
+def default_responder(assistant: dict, messages: List[dict]) -> dict:
+    """Echoes the last message back. Understands the thread classifier and the task description prompts."""
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    if '"session_id"' in system:
+        return {"content": json.dumps({"session_id": -1, "reason": "stand-in"})}
+    if '"existing results"' in system:
+        return {"content": json.dumps({"backgroud": "stand-in", "status": "completed"})}
+
+    last = messages[-1] if messages else {"role": "user", "content": ""}
+    if last["role"] == "tool":
+        return {"content": f"done: {last['content']}"}
+    return {"content": f"echo: {last['content']}"}
+
+
+class StandInBackend:
+    def __init__(self,
+                 responder: Callable[[dict, List[dict]], dict] = None,
+                 latency: float = 0.0,
+                 capacity: Optional[int] = None,
+                 congestion: float = 0.0,
+                 queued_polls: int = 0,
+                 chunk_size: int = 8,
+                 rtt: float = 0.0,
+                 batch_dir: str = None,
+                 event_delay: float = 0.0):
+        """
+        Parameters:
+        responder (callable, optional): Decides what the model answers. Defaults to `default_responder`.
+        latency (float, optional): Seconds every generation request (runs, tool output submissions, chat completions) takes.
+        capacity (int, optional): Concurrent generation requests allowed per model before answering with HTTP 429.
+        congestion (float, optional): Extra latency factor per concurrent generation request of the same model.
+        queued_polls (int, optional): How many `runs.retrieve` calls report `in_progress` before the run settles.
+        chunk_size (int, optional): Characters per streamed text delta.
+        rtt (float, optional): Seconds of network round trip added to every request.
+        batch_dir (str, optional): Directory of the uploaded and result files. Defaults to a new temporary directory.
+        event_delay (float, optional): Seconds between two events of a streamed run, as if they were generated live.
+        """
+        self.responder = responder or default_responder
+        self.latency = latency
+        self.capacity = capacity
+        self.congestion = congestion
+        self.queued_polls = queued_polls
+        self.chunk_size = chunk_size
+        self.rtt = rtt
+        self.batch_dir = batch_dir or tempfile.mkdtemp(prefix="stand_in_batches_")
+        self.event_delay = event_delay
+
+        self.assistants: Dict[str, dict] = {}
+        self.threads: Dict[str, dict] = {}
+        self.messages: Dict[str, List[dict]] = defaultdict(list)
+        self.runs: Dict[str, dict] = {}
+        self.files: Dict[str, dict] = {}
+        self.batches: Dict[str, dict] = {}
+        self.calls: List[str] = []
+        self.throttled = 0
+        self.max_inflight: Dict[str, int] = defaultdict(int)
+
+        self._inflight: Dict[str, int] = defaultdict(int)
+        self._lock = threading.RLock()
+        self._pending: Dict[str, dict] = {}
+
+    # --- client ---
+
+    def client(self, max_retries: int = 0) -> openai.OpenAI:
+        return openai.OpenAI(api_key="sk-stand-in",
+                             base_url="http://stand-in/v1",
+                             max_retries=max_retries,
+                             http_client=httpx.Client(transport=httpx.MockTransport(self.handle)))
+
+    def count(self, operation: str) -> int:
+        return self.calls.count(operation)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = []
+
+    def record_streams(self, message: str, tool_output: str = "ok") -> List[list]:
+        """
+        Streams a run of a new assistant on `message` until it completes, answering every tool call with
+        `tool_output`, and returns the parsed events of each stream (the run, then every tool output submission).
+        """
+        client = self.client()
+        assistant_id = self.add_assistant("Recorder")
+        thread = client.beta.threads.create()
+        client.beta.threads.messages.create(thread_id=thread.id, role="user", content=message)
+        with client.beta.threads.runs.stream(thread_id=thread.id, assistant_id=assistant_id) as stream:
+            streams = [self._copy_events(stream)]
+        run = streams[-1][-1].data
+        while run.status == "requires_action":
+            outputs = [{"tool_call_id": call.id, "output": tool_output}
+                       for call in run.required_action.submit_tool_outputs.tool_calls]
+            with client.beta.threads.runs.submit_tool_outputs_stream(thread_id=thread.id, run_id=run.id,
+                                                                     tool_outputs=outputs) as stream:
+                streams.append(self._copy_events(stream))
+            run = streams[-1][-1].data
+        return streams
+
+    @staticmethod
+    def _copy_events(stream) -> list:
+        # the handler of the stream keeps accumulating the deltas into the data of thread.message.created
+        return [event.model_copy(deep=True) for event in stream]
+
+    # --- transport ---
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.rtt:
+            time.sleep(self.rtt)
+        path = request.url.path[len("/v1"):]
+        parts = [p for p in path.split("/") if p]
+        multipart = request.headers.get("content-type", "").startswith("multipart/")
+        body = json.loads(request.content) if request.content and not multipart else {}
+        method = request.method
+
+        if parts[0] == "assistants":
+            return self._assistants(method, parts, body)
+        if parts[0] == "files":
+            return self._files(method, parts, request)
+        if parts[0] == "batches":
+            return self._batches(method, parts, body)
+        if parts[0] == "chat":
+            return self._generate("chat.completions.create", self._model_of(body), self._chat_completion, body)
+        if parts[0] == "threads":
+            if len(parts) >= 2 and parts[1] == "runs":
+                assistant = self.assistants.get(body["assistant_id"], {})
+                return self._generate("threads.create_and_run", body.get("model") or assistant.get("model"),
+                                      self._create_and_run, body)
+            if len(parts) == 1:
+                self._record("threads.create")
+                return self._json(self._create_thread(body))
+            thread_id = parts[1]
+            if len(parts) == 2:
+                self._record("threads.retrieve" if method == "GET" else "threads.update")
+                return self._json(self.threads[thread_id])
+            if parts[2] == "messages":
+                if method == "POST":
+                    self._record("messages.create")
+                    return self._json(self._add_message(thread_id, body["content"], body.get("role", "user"),
+                                                        body.get("attachments"), body.get("metadata")))
+                self._record("messages.list")
+                return self._json(self._list_messages(thread_id, request.url.params))
+            if parts[2] == "runs":
+                return self._runs(method, thread_id, parts[3:], body)
+        return httpx.Response(404, json={"error": {"message": f"{method} {path} not found"}})
+
+    def _runs(self, method, thread_id, parts, body):
+        if not parts and method == "GET":
+            self._record("runs.list")
+            data = [self._public(r) for r in self.runs.values() if r["thread_id"] == thread_id][::-1]
+            return self._json({"object": "list", "data": data, "first_id": data[0]["id"] if data else None,
+                               "last_id": data[-1]["id"] if data else None, "has_more": False})
+        if not parts:
+            assistant = self.assistants.get(body["assistant_id"], {})
+            return self._generate("runs.create", body.get("model") or assistant.get("model"),
+                                  self._create_run, thread_id, body)
+        run = self.runs[parts[0]]
+        if len(parts) == 1:
+            self._record("runs.retrieve")
+            return self._json(self._poll(run))
+        if parts[1] == "cancel":
+            self._record("runs.cancel")
+            with self._lock:
+                if run["status"] in ("queued", "in_progress", "requires_action"):
+                    run["status"] = "cancelled"
+                    run["cancelled_at"] = int(time.time())
+                    run["required_action"] = None
+                    self._pending.pop(run["id"], None)
+            return self._json(self._public(run))
+        if parts[1] == "submit_tool_outputs":
+            return self._generate("runs.submit_tool_outputs", run["model"], self._submit_tool_outputs, run, body)
+        return httpx.Response(404, json={"error": {"message": "not found"}})
+
+    def _generate(self, operation, model, fn, *args):
+        """Applies throttling and latency to generation requests."""
+        model = model or "unknown"
+        with self._lock:
+            self._record(operation)
+            if self.capacity is not None and self._inflight[model] >= self.capacity:
+                self.throttled += 1
+                return httpx.Response(429, json={"error": {"message": f"Rate limit reached for {model}",
+                                                           "type": "requests",
+                                                           "code": "rate_limit_exceeded"}})
+            self._inflight[model] += 1
+            self.max_inflight[model] = max(self.max_inflight[model], self._inflight[model])
+            inflight = self._inflight[model]
+        try:
+            if self.latency:
+                time.sleep(self.latency * (1 + self.congestion * (inflight - 1)))
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._inflight[model] -= 1
+
+    def _record(self, operation):
+        with self._lock:
+            self.calls.append(operation)
+
+    # --- assistants ---
+
+    def _assistants(self, method, parts, body):
+        if method == "POST" and len(parts) == 1:
+            self._record("assistants.create")
+            assistant = {"id": "asst_" + uuid.uuid4().hex[:12], "object": "assistant", "created_at": int(time.time()),
+                         "name": body.get("name"), "description": body.get("description"),
+                         "instructions": body.get("instructions"), "model": body.get("model", "gpt-4"),
+                         "tools": body.get("tools", []), "metadata": body.get("metadata", {}),
+                         "tool_resources": body.get("tool_resources"), "file_ids": []}
+            self.assistants[assistant["id"]] = assistant
+            return self._json(assistant)
+        assistant = self.assistants.get(parts[1])
+        if assistant is None:
+            return httpx.Response(404, json={"error": {"message": "No assistant found"}})
+        if method == "POST":
+            self._record("assistants.update")
+            assistant.update({k: v for k, v in body.items() if k in assistant})
+        elif method == "DELETE":
+            self._record("assistants.delete")
+            self.assistants.pop(parts[1])
+            return self._json({"id": parts[1], "object": "assistant.deleted", "deleted": True})
+        else:
+            self._record("assistants.retrieve")
+        return self._json(assistant)
+
+    def add_assistant(self, name: str, model: str = "gpt-4", tools: List[dict] = None) -> str:
+        """Registers an assistant directly and returns its id."""
+        assistant_id = "asst_" + uuid.uuid4().hex[:12]
+        self.assistants[assistant_id] = {"id": assistant_id, "object": "assistant", "created_at": int(time.time()),
+                                         "name": name, "description": None, "instructions": "", "model": model,
+                                         "tools": tools or [], "metadata": {}, "tool_resources": None,
+                                         "file_ids": []}
+        return assistant_id
+
+    # --- threads & messages ---
+
+    def _create_thread(self, body):
+        thread = {"id": "thread_" + uuid.uuid4().hex[:12], "object": "thread", "created_at": int(time.time()),
+                  "metadata": body.get("metadata", {}), "tool_resources": body.get("tool_resources")}
+        self.threads[thread["id"]] = thread
+        for message in body.get("messages", []) or []:
+            self._add_message(thread["id"], message["content"], message.get("role", "user"),
+                              message.get("attachments"), message.get("metadata"))
+        return thread
+
+    def _add_message(self, thread_id, content, role="user", attachments=None, metadata=None,
+                     assistant_id=None, run_id=None):
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content)
+        message = {"id": "msg_" + uuid.uuid4().hex[:12], "object": "thread.message", "created_at": int(time.time()),
+                   "thread_id": thread_id, "role": role, "status": "completed",
+                   "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+                   "attachments": attachments or [], "metadata": metadata or {},
+                   "assistant_id": assistant_id, "run_id": run_id}
+        with self._lock:
+            self.messages[thread_id].append(message)
+        return message
+
+    def _list_messages(self, thread_id, params):
+        data = list(self.messages[thread_id])
+        if params.get("order", "desc") == "desc":
+            data = data[::-1]
+        if params.get("after"):
+            data = data[[m["id"] for m in data].index(params["after"]) + 1:]
+        limit = int(params.get("limit", 20))
+        data, has_more = data[:limit], len(data) > limit
+        return {"object": "list", "data": data, "first_id": data[0]["id"] if data else None,
+                "last_id": data[-1]["id"] if data else None, "has_more": has_more}
+
+    def conversation(self, thread_id) -> List[dict]:
+        return [{"role": m["role"], "content": m["content"][0]["text"]["value"]} for m in self.messages[thread_id]]
+
+    # --- runs ---
+
+    def _new_run(self, thread_id, body):
+        assistant = self.assistants[body["assistant_id"]]
+        run = {"id": "run_" + uuid.uuid4().hex[:12], "object": "thread.run", "created_at": int(time.time()),
+               "assistant_id": assistant["id"], "thread_id": thread_id, "status": "queued",
+               "instructions": assistant.get("instructions") or "", "model": body.get("model") or assistant["model"],
+               "tools": assistant.get("tools", []), "required_action": None, "last_error": None,
+               "truncation_strategy": body.get("truncation_strategy"),
+               "max_prompt_tokens": body.get("max_prompt_tokens")}
+        self.runs[run["id"]] = run
+        return run
+
+    def _create_run(self, thread_id, body):
+        for message in body.get("additional_messages", []) or []:
+            self._add_message(thread_id, message["content"], message.get("role", "user"),
+                              message.get("attachments"), message.get("metadata"))
+        run = self._new_run(thread_id, body)
+        return self._advance(run, [], body.get("stream", False))
+
+    def _create_and_run(self, body):
+        thread = self._create_thread(body.get("thread") or {})
+        run = self._new_run(thread["id"], body)
+        return self._advance(run, [], body.get("stream", False))
+
+    def _submit_tool_outputs(self, run, body):
+        if run["status"] != "requires_action":
+            return httpx.Response(400, json={"error": {"message": f"Run {run['id']} is {run['status']}, "
+                                                                  f"not requires_action."}})
+        calls = {c["id"]: c for c in run["required_action"]["submit_tool_outputs"]["tool_calls"]}
+        outputs = [{"role": "tool", "content": o["output"], "name": calls[o["tool_call_id"]]["function"]["name"]}
+                   for o in body["tool_outputs"]]
+        prefix = self._step_completed_events(run, body["tool_outputs"], calls) if body.get("stream") else []
+        run["required_action"] = None
+        return self._advance(run, run.get("_tool_outputs", []) + outputs, body.get("stream", False), prefix)
+
+    def _advance(self, run, tool_outputs, stream, prefix=None):
+        """Asks the responder for the next step of the run."""
+        run["_tool_outputs"] = tool_outputs
+        messages = self.conversation(run["thread_id"])
+        if run.get("truncation_strategy") and run["truncation_strategy"].get("type") == "last_messages":
+            messages = messages[-run["truncation_strategy"]["last_messages"]:]
+        messages = [{"role": "system", "content": run["instructions"]}] + messages + tool_outputs
+        reply = self.responder(self.assistants[run["assistant_id"]], messages)
+
+        if reply.get("hang"):
+            run["status"] = "in_progress"
+            return self._run_events(run, prefix or []) if stream else self._json(self._public(run))
+
+        if reply.get("tool_calls"):
+            tool_calls = [{"id": "call_" + uuid.uuid4().hex[:12], "type": "function",
+                           "function": {"name": c["name"], "arguments": json.dumps(c.get("arguments", {}))}}
+                          for c in reply["tool_calls"]]
+            settled = dict(run, status="requires_action",
+                           required_action={"type": "submit_tool_outputs",
+                                            "submit_tool_outputs": {"tool_calls": tool_calls}})
+            events = self._tool_call_events(run, tool_calls) if stream else []
+        else:
+            content = reply.get("content", "")
+            settled = dict(run, status="completed", completed_at=int(time.time()), required_action=None)
+            events = self._message_events(run, content) if stream else []
+            if not stream:
+                self._add_message(run["thread_id"], content, "assistant", assistant_id=run["assistant_id"],
+                                  run_id=run["id"])
+            settled["_message"] = content
+
+        if stream:
+            run.update(settled)
+            return self._run_events(run, (prefix or []) + events)
+
+        if self.queued_polls:
+            run["status"] = "in_progress"
+            self._pending[run["id"]] = {"polls": self.queued_polls, "settled": settled}
+            return self._json(self._public(run))
+        run.update(settled)
+        return self._json(self._public(run))
+
+    def _poll(self, run):
+        with self._lock:
+            pending = self._pending.get(run["id"])
+            if pending:
+                pending["polls"] -= 1
+                if pending["polls"] <= 0:
+                    run.update(pending["settled"])
+                    self._pending.pop(run["id"])
+        return self._public(run)
+
+    @staticmethod
+    def _public(run):
+        return {k: v for k, v in run.items() if not k.startswith("_")}
+
+    # --- streaming ---
+
+    def _run_events(self, run, events):
+        public = self._public(run)
+        head = [("thread.run.created", dict(public, status="queued", required_action=None)),
+                ("thread.run.in_progress", dict(public, status="in_progress", required_action=None))]
+        if run["status"] == "in_progress":
+            return self._sse(head + events)
+        tail = [("thread.run." + run["status"], public)]
+        if run["status"] == "completed":
+            self._add_message(run["thread_id"], run.get("_message", ""), "assistant",
+                              assistant_id=run["assistant_id"], run_id=run["id"])
+        return self._sse(head + events + tail)
+
+    def _step(self, run, step_type, details, status="in_progress"):
+        return {"id": "step_" + uuid.uuid4().hex[:12], "object": "thread.run.step", "created_at": int(time.time()),
+                "assistant_id": run["assistant_id"], "thread_id": run["thread_id"], "run_id": run["id"],
+                "type": step_type, "status": status, "step_details": details}
+
+    def _message_events(self, run, content):
+        message_id = "msg_" + uuid.uuid4().hex[:12]
+        step = self._step(run, "message_creation", {"type": "message_creation",
+                                                    "message_creation": {"message_id": message_id}})
+        message = {"id": message_id, "object": "thread.message", "created_at": int(time.time()),
+                   "thread_id": run["thread_id"], "role": "assistant", "status": "in_progress", "content": [],
+                   "assistant_id": run["assistant_id"], "run_id": run["id"], "attachments": [], "metadata": {}}
+        events = [("thread.run.step.created", step), ("thread.message.created", message)]
+        for i in range(0, len(content), self.chunk_size) or [0]:
+            events.append(("thread.message.delta", {
+                "id": message_id, "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text",
+                                       "text": {"value": content[i:i + self.chunk_size], "annotations": []}}]}}))
+        done = dict(message, status="completed",
+                    content=[{"type": "text", "text": {"value": content, "annotations": []}}])
+        events += [("thread.message.completed", done),
+                   ("thread.run.step.completed", dict(step, status="completed"))]
+        return events
+
+    def _tool_call_events(self, run, tool_calls):
+        step = self._step(run, "tool_calls", {"type": "tool_calls", "tool_calls": []})
+        run["_tool_step"] = step
+        events = [("thread.run.step.created", step)]
+        for index, call in enumerate(tool_calls):
+            events.append(("thread.run.step.delta", {
+                "id": step["id"], "object": "thread.run.step.delta",
+                "delta": {"step_details": {"type": "tool_calls", "tool_calls": [
+                    {"index": index, "id": call["id"], "type": "function",
+                     "function": {"name": call["function"]["name"], "arguments": "", "output": None}}]}}}))
+            arguments = call["function"]["arguments"]
+            for i in range(0, len(arguments), self.chunk_size):
+                events.append(("thread.run.step.delta", {
+                    "id": step["id"], "object": "thread.run.step.delta",
+                    "delta": {"step_details": {"type": "tool_calls", "tool_calls": [
+                        {"index": index, "type": "function",
+                         "function": {"arguments": arguments[i:i + self.chunk_size]}}]}}}))
+        return events
+
+    def _step_completed_events(self, run, tool_outputs, calls):
+        step = run.get("_tool_step")
+        if not step:
+            return []
+        outputs = {o["tool_call_id"]: o["output"] for o in tool_outputs}
+        calls = [{"id": c["id"], "type": "function", "function": dict(c["function"], output=outputs.get(c["id"]))}
+                 for c in calls.values()]
+        return [("thread.run.step.completed", dict(step, status="completed",
+                                                   step_details={"type": "tool_calls", "tool_calls": calls}))]
+
+    def _sse(self, events):
+        if isinstance(events, httpx.Response):
+            return events
+        blocks = [f"event: {name}\ndata: {json.dumps(data)}\n\n".encode() for name, data in events]
+        blocks.append(b"event: done\ndata: [DONE]\n\n")
+        if self.event_delay:
+            def live():
+                for block in blocks:
+                    time.sleep(self.event_delay)
+                    yield block
+            return httpx.Response(200, content=live(), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, content=b"".join(blocks), headers={"content-type": "text/event-stream"})
+
+    # --- files & batches ---
+
+    def _files(self, method, parts, request):
+        if method == "POST":
+            self._record("files.create")
+            purpose, content = self._multipart(request)
+            return self._json(self._store_file(content, purpose))
+        if len(parts) == 3 and parts[2] == "content":
+            self._record("files.content")
+            with open(self.files[parts[1]]["_path"], "rb") as f:
+                return httpx.Response(200, content=f.read(), headers={"content-type": "application/octet-stream"})
+        self._record("files.retrieve")
+        return self._json(self._public(self.files[parts[1]]))
+
+    @staticmethod
+    def _multipart(request):
+        boundary = request.headers["content-type"].split("boundary=")[1].encode()
+        fields = {}
+        for part in request.content.split(b"--" + boundary):
+            if b"\r\n\r\n" not in part:
+                continue
+            headers, content = part.split(b"\r\n\r\n", 1)
+            name = headers.split(b'name="')[1].split(b'"')[0].decode()
+            fields[name] = content[:-2] if content.endswith(b"\r\n") else content
+        return fields["purpose"].decode(), fields["file"]
+
+    def _store_file(self, content: bytes, purpose: str) -> dict:
+        file_id = "file-" + uuid.uuid4().hex[:12]
+        path = os.path.join(self.batch_dir, file_id + ".jsonl")
+        with open(path, "wb") as f:
+            f.write(content)
+        self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                               "filename": file_id + ".jsonl", "purpose": purpose, "status": "processed",
+                               "_path": path}
+        return self._public(self.files[file_id])
+
+    def _batches(self, method, parts, body):
+        if method == "POST" and len(parts) == 1:
+            self._record("batches.create")
+            return self._json(self._create_batch(body))
+        batch = self.batches[parts[1]]
+        self._record("batches.retrieve")
+        with self._lock:
+            pending = self._pending.get(batch["id"])
+            if pending:
+                pending["polls"] -= 1
+                if pending["polls"] <= 0:
+                    batch.update(pending["settled"])
+                    self._pending.pop(batch["id"])
+        return self._json(batch)
+
+    def _create_batch(self, body):
+        with open(self.files[body["input_file_id"]]["_path"], "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        lines, failed = [], 0
+        for request in requests:
+            self._record("batch." + request["url"].strip("/").replace("/", ".")[3:])
+            try:
+                response = {"status_code": 200, "request_id": "req_" + uuid.uuid4().hex[:12],
+                            "body": json.loads(self._chat_completion(dict(request["body"], stream=False)).content)}
+            except Exception as e:
+                failed += 1
+                response = {"status_code": 500, "request_id": "req_" + uuid.uuid4().hex[:12],
+                            "body": {"error": {"message": str(e), "type": "server_error"}}}
+            lines.append({"id": "batch_req_" + uuid.uuid4().hex[:12], "custom_id": request["custom_id"],
+                          "response": response, "error": None})
+        output = self._store_file("".join(json.dumps(line) + "\n" for line in lines).encode(), "batch_output")
+
+        batch = {"id": "batch_" + uuid.uuid4().hex[:12], "object": "batch", "endpoint": body["endpoint"],
+                 "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+                 "status": "in_progress", "created_at": int(time.time()), "output_file_id": None,
+                 "error_file_id": None, "errors": None, "metadata": body.get("metadata"),
+                 "request_counts": {"total": len(requests), "completed": 0, "failed": 0}}
+        settled = {"status": "completed", "completed_at": int(time.time()), "output_file_id": output["id"],
+                   "request_counts": {"total": len(requests), "completed": len(requests) - failed, "failed": failed}}
+        self.batches[batch["id"]] = batch
+        if self.queued_polls:
+            self._pending[batch["id"]] = {"polls": self.queued_polls, "settled": settled}
+        else:
+            batch.update(settled)
+        return batch
+
+    # --- chat completions ---
+
+    def _chat_completion(self, body):
+        reply = self.responder({"name": None, "model": body.get("model")}, body["messages"])
+        tool_calls = [{"id": "call_" + uuid.uuid4().hex[:12], "type": "function",
+                       "function": {"name": c["name"], "arguments": json.dumps(c.get("arguments", {}))}}
+                      for c in reply.get("tool_calls", [])]
+        content = reply.get("content") if not tool_calls else None
+        completion_id = "chatcmpl-" + uuid.uuid4().hex[:12]
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return self._json({"id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                               "model": body.get("model"),
+                               "choices": [{"index": 0, "message": message,
+                                            "finish_reason": "tool_calls" if tool_calls else "stop"}],
+                               "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}})
+
+        def chunk(delta, finish_reason=None):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        chunks = [chunk({"role": "assistant", "content": ""})]
+        if tool_calls:
+            for index, call in enumerate(tool_calls):
+                chunks.append(chunk({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                                     "function": {"name": call["function"]["name"],
+                                                                  "arguments": ""}}]}))
+                arguments = call["function"]["arguments"]
+                for i in range(0, len(arguments), self.chunk_size):
+                    chunks.append(chunk({"tool_calls": [{"index": index, "function": {
+                        "arguments": arguments[i:i + self.chunk_size]}}]}))
+            chunks.append(chunk({}, "tool_calls"))
+        else:
+            for i in range(0, len(content or ""), self.chunk_size):
+                chunks.append(chunk({"content": content[i:i + self.chunk_size]}))
+            chunks.append(chunk({}, "stop"))
+        payload = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, content=payload.encode(), headers={"content-type": "text/event-stream"})
+
+    @staticmethod
+    def _model_of(body):
+        return body.get("model")
+
+    @staticmethod
+    def _json(data):
+        if isinstance(data, httpx.Response):
+            return data
+        return httpx.Response(200, json=data)
+
+
+def stand_in_agent(backend: StandInBackend, name: str, model: str = "gpt-4", tools: list = None, **kwargs):
+    """Creates an Agent bound to an assistant of the backend without touching settings.json."""
+    from agency_swarm import Agent
+
+    agent = Agent(name=name, model=model, tools=tools, **kwargs)
+    agent.id = backend.add_assistant(name, model, agent.get_oai_tools())
+    agent.assistant = agent.client.beta.assistants.retrieve(agent.id)
+    return agent
+
+
+def use_temp_dir(test) -> str:
+    """Runs a test in a new temporary directory (agents keep their settings.json in the cwd), removed afterwards."""
+    import shutil
+
+    tmp = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, tmp)
+    test.addCleanup(os.chdir, os.getcwd())
+    os.chdir(tmp)
+    return tmp
+
+
+def use_stand_in_backend(test, backend: StandInBackend = None, **kwargs) -> StandInBackend:
+    """
+    Plugs a stand-in backend (the given one or StandInBackend(**kwargs)) into the OpenAI client of the process for
+    the duration of a test. The test starts with a new concurrency limiter, thread lock manager, tool result cache
+    and tool output store, and every global it touched, the tool executor included, is reset by its cleanups.
+    """
+    from agency_swarm.threads import set_thread_lock_manager
+    from agency_swarm.util import set_concurrency_limiter, set_openai_client, set_tool_cache, set_tool_output_store
+
+    backend = backend or StandInBackend(**kwargs)
+    test.addCleanup(_drop_tool_executor)
+    for reset in (set_concurrency_limiter, set_thread_lock_manager, set_tool_cache, set_tool_output_store):
+        reset(None)
+        test.addCleanup(reset, None)
+    set_openai_client(backend.client())
+    test.addCleanup(set_openai_client, None)
+    return backend
+
+
+def _drop_tool_executor():
+    """Shuts down the tool executor a test left behind, the next one starts a new executor."""
+    from agency_swarm.util import tool_executor
+
+    with tool_executor.executor_lock:
+        executor, tool_executor.executor = tool_executor.executor, None
+    if executor is not None:
+        executor.shutdown()
@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent, LeanEventHandler
+from agency_swarm.util import ApiCallAudit, get_api_audit, set_api_audit
+
+
+def responder(assistant, messages):
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    if '"session_id"' in system:
+        return {"content": json.dumps({"session_id": 1, "reason": "same task"})}
+    last = messages[-1]
+    if assistant["name"] == "CEO" and last["role"] == "user" and last["content"].startswith("delegate"):
+        return {"tool_calls": [{"name": "SendMessage",
+                                "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                              "message": last["content"]}}]}
+    return default_responder(assistant, messages)
+
+
+class ApiAuditTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+        self.ceo = Agent(name="CEO", description="ceo")
+        self.worker = Agent(name="Worker", description="worker")
+        self.agency = Agency([self.ceo, [self.ceo, self.worker]])
+        set_api_audit(ApiCallAudit())
+
+    def tearDown(self):
+        set_api_audit(None)
+
+    def test_new_thread_is_created_with_its_run(self):
+        self.assertEqual(self.agency.get_completion("hello", yield_messages=False), "echo: hello")
+
+        self.assertEqual(get_api_audit().sequences("User -> CEO"), [[
+            "POST /threads/runs",
+            "GET /threads/{id}/messages",
+            "POST /chat/completions",   # task description of the session
+        ]])
+        self.assertEqual(self.backend.count("threads.create"), 0)
+        self.assertEqual(self.backend.count("messages.create"), 0)
+
+    def test_message_is_sent_with_the_run(self):
+        self.agency.get_completion("hello", yield_messages=False)
+        set_api_audit(ApiCallAudit())
+
+        self.assertEqual(self.agency.get_completion("again", yield_messages=False), "echo: again")
+        self.assertEqual(get_api_audit().sequences("User -> CEO"), [[
+            "POST /chat/completions",   # which session continues the conversation
+            "POST /threads/{id}/runs",
+            "GET /threads/{id}/messages",
+            "POST /chat/completions",
+        ]])
+
+    def test_streamed_reply_is_not_fetched_again(self):
+        response = self.agency.get_completion_stream("hello", LeanEventHandler.for_request(), message_files=None)
+
+        self.assertEqual(response, "echo: hello")
+        self.assertEqual(get_api_audit().sequences("User -> CEO"), [[
+            "POST /threads/runs (stream)",
+            "POST /chat/completions",
+        ]])
+
+    def test_calls_are_attributed_to_their_hop(self):
+        response = self.agency.get_completion("delegate the report", yield_messages=False)
+
+        self.assertEqual(response, "done: echo: delegate the report")
+        audit = get_api_audit()
+        self.assertEqual(audit.sequences("CEO -> Worker"), [[
+            "POST /threads/runs",
+            "GET /threads/{id}/messages",
+            "POST /chat/completions",
+        ]])
+        self.assertEqual(audit.sequences("User -> CEO"), [[
+            "POST /threads/runs",
+            "POST /threads/{id}/runs/{id}/submit_tool_outputs",
+            "GET /threads/{id}/messages",
+            "POST /chat/completions",
+        ]])
+        self.assertIs(audit.hops[1].parent, audit.hops[0])
+        self.assertEqual(audit.unattributed, [])
+        self.assertEqual(audit.count(), 7)
+
+    def test_disabled(self):
+        set_api_audit(None)
+        self.agency.get_completion("hello", yield_messages=False)
+        self.assertIsNone(get_api_audit())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+import httpx
+from pydantic import Field
+
+from agency_swarm import Agency, Agent, BaseTool
+from agency_swarm.tools import ToolFactory
+from agency_swarm.util import CancellationToken, RequestCancelled, ToolExecutor, set_tool_executor
+from agency_swarm.util import tool_executor
+
+SCHEMA = {
+    "openapi": "3.0.0",
+    "servers": [{"url": "https://api.example.com"}],
+    "paths": {
+        "/users/{user_id}": {
+            "get": {
+                "operationId": "GetUser",
+                "description": "Gets a user.",
+                "parameters": [{"name": "user_id", "in": "path", "required": True, "schema": {"type": "string"}}],
+            }
+        }
+    },
+}
+
+
+class Wait(BaseTool):
+    """Waits without blocking a thread."""
+
+    seconds: float = Field(..., description="Seconds to wait.")
+
+    async def run(self, caller_thread=None):
+        await asyncio.sleep(self.seconds)
+        return threading.current_thread().name
+
+
+def responder(assistant, messages):
+    if "You are the CEO" not in messages[0]["content"]:
+        return default_responder(assistant, messages)
+    last = messages[-1]
+    if last["role"] == "user":
+        return {"tool_calls": [{"name": "Wait", "arguments": {"seconds": 0.01}}]}
+    return {"content": last["content"]}
+
+
+class AsyncToolTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = ToolExecutor()
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_concurrent_calls_share_one_loop(self):
+        started = time.monotonic()
+        with ThreadPoolExecutor(20) as pool:
+            names = list(pool.map(lambda _: self.executor.run(Wait(seconds=0.5)), range(20)))
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(set(names), {"tool_event_loop"})
+        self.assertEqual(self.executor.stats()["async"]["completed"], 20)
+
+    def test_waiting_call_can_be_cancelled(self):
+        tool = Wait(seconds=5)
+        tool.cancel_token = CancellationToken()
+        threading.Timer(0.1, tool.cancel_token.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            self.executor.run(tool)
+        self.assertEqual(self.executor.stats()["async"]["cancelled"], 1)
+
+    def test_openapi_tools_share_a_connection_pool(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[1]})
+
+        loop = self.executor._event_loop()
+        tool_executor._http_clients[loop] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        get_user, = ToolFactory.from_openapi_schema(SCHEMA, headers={"Authorization": "Bearer key"}, use_async=True)
+
+        outputs = [self.executor.run(get_user(parameters={"user_id": str(i)})) for i in range(3)]
+
+        self.assertEqual(outputs, [{"id": "0"}, {"id": "1"}, {"id": "2"}])
+        self.assertEqual(requests[0].headers["Authorization"], "Bearer key")
+        self.assertEqual(str(requests[0].url), "https://api.example.com/users/0")
+
+
+class SessionAsyncToolTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+        self.executor = ToolExecutor()
+        set_tool_executor(self.executor)
+        self.agency = Agency([Agent(name="CEO", description="ceo", instructions="You are the CEO.", tools=[Wait])])
+
+    def tearDown(self):
+        set_tool_executor(None)
+        self.executor.shutdown()
+
+    def test_async_tool_output_is_submitted(self):
+        self.assertEqual(self.agency.get_completion("wait", yield_messages=False), "tool_event_loop")
+        self.assertEqual(self.executor.stats()["async"]["completed"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
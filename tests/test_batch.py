@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = use_temp_dir(self)
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.max_inflight = 0
+        self.failing = {"bad"}
+
+        def responder(assistant, messages):
+            last = messages[-1]["content"]
+            if last in self.failing:
+                raise RuntimeError("backend crashed")
+            with self.lock:
+                self.inflight += 1
+                self.max_inflight = max(self.max_inflight, self.inflight)
+            time.sleep(0.05)
+            with self.lock:
+                self.inflight -= 1
+            return default_responder(assistant, messages)
+
+        self.backend = use_stand_in_backend(self, responder=responder)
+        self.ceo = Agent(name="CEO", description="ceo", instructions="You are the CEO.")
+        self.agency = Agency([self.ceo])
+
+    def runs_created(self):
+        # a new thread is created together with its first run
+        return self.backend.count("runs.create") + self.backend.count("threads.create_and_run")
+
+    def test_bounded_concurrency(self):
+        messages = [f"ticket {i}" for i in range(12)]
+        results = list(self.agency.run_batch(messages, concurrency=4))
+
+        self.assertEqual(sorted(r.index for r in results), list(range(12)))
+        for result in results:
+            self.assertTrue(result.ok)
+            self.assertEqual(result.response, f"echo: {messages[result.index]}")
+        self.assertLessEqual(self.max_inflight, 4)
+        self.assertGreater(self.max_inflight, 1)
+        # one-off entrance threads: the conversations are not kept in the CEO's threads
+        self.assertEqual(self.ceo.threads, [])
+
+    def test_checkpoint_resume(self):
+        path = os.path.join(self.tmp, "batch.jsonl")
+        messages = ["a", "bad", "c"]
+        first = {r.index: r for r in self.agency.run_batch(messages, concurrency=2, checkpoint_path=path)}
+        self.assertTrue(first[0].ok and first[2].ok)
+        self.assertFalse(first[1].ok)
+
+        self.failing = set()
+        self.backend.reset_calls()
+        second = list(self.agency.run_batch(messages, concurrency=2, checkpoint_path=path))
+
+        self.assertEqual([(r.index, r.resumed) for r in second], [(0, True), (2, True), (1, False)])
+        self.assertEqual(second[-1].response, "echo: bad")
+        self.assertEqual(self.runs_created(), 1)
+
+    def test_invalid_concurrency_fails_on_call(self):
+        with self.assertRaises(Exception):
+            self.agency.run_batch(["ticket"], concurrency=0)
+
+    def test_threads_of_finished_conversations_are_dropped(self):
+        def responder(assistant, messages):
+            last = messages[-1]
+            if assistant["name"] == "Manager" and last["role"] == "user":
+                return {"tool_calls": [{"name": "SendMessage",
+                                        "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                                      "message": last["content"]}}]}
+            return default_responder(assistant, messages)
+
+        self.backend.responder = responder
+        ceo = Agent(name="Manager", description="manager", instructions="You are the manager.")
+        worker = Agent(name="Worker", description="worker", instructions="You are the worker.")
+        agency = Agency([ceo, [ceo, worker]])
+        results = list(agency.run_batch([f"ticket {i}" for i in range(6)], concurrency=3))
+
+        self.assertEqual(sorted(result.response for result in results),
+                         sorted(f"done: echo: ticket {i}" for i in range(6)))
+        self.assertEqual(ceo.threads, [])
+        self.assertEqual(worker.threads, [])
+
+    def test_close_cancels_in_flight(self):
+        self.failing = set()
+        results = self.agency.run_batch([f"ticket {i}" for i in range(8)], concurrency=2)
+        next(results)
+        results.close()
+        self.assertLess(self.runs_created(), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
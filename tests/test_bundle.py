@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent
+from agency_swarm.agents import agent as agent_module
+from agency_swarm.cli import build
+from agency_swarm.util import AgencyBundle, get_agency_bundle, set_agency_bundle
+
+SCHEMAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "schemas")
+
+AGENCY_MODULE = """
+from agency_swarm import Agency, Agent
+
+
+def create_agency():
+    return Agency([Agent(name="CEO", description="ceo", instructions="instructions.md", schemas_folder="schemas")])
+"""
+
+
+class AgencyBundleTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        shutil.copytree(SCHEMAS, "schemas")
+        with open("instructions.md", "w") as f:
+            f.write("You are the CEO.")
+        self.backend = use_stand_in_backend(self)
+
+    def tearDown(self):
+        set_agency_bundle(None)
+
+    def start(self) -> Agency:
+        set_agency_bundle(AgencyBundle("agency_bundle.json"))
+        self.backend.reset_calls()
+        with patch.object(agent_module, "validate_openapi_spec", wraps=agent_module.validate_openapi_spec) as validate:
+            agency = Agency([Agent(name="CEO", description="ceo", instructions="instructions.md",
+                                   schemas_folder="schemas")])
+        self.validated = validate.call_count
+        return agency
+
+    def test_unchanged_agency_starts_from_the_bundle(self):
+        first = self.start()
+        get_agency_bundle().save()
+        self.assertEqual(get_agency_bundle().stats()["rebuilt"], 1 + 4 + 1)
+        self.assertEqual(self.validated, 4)
+
+        second = self.start()
+        self.assertEqual(get_agency_bundle().stats()["reused"], 1 + 4 + 1)
+        self.assertEqual(self.validated, 0)
+        self.assertEqual(self.backend.calls, [])
+        self.assertEqual(second.ceo.id, first.ceo.id)
+        self.assertEqual(second.ceo.instructions, first.ceo.instructions)
+        self.assertEqual(second.ceo.get_oai_tools(), first.ceo.get_oai_tools())
+
+        self.assertEqual(second.get_completion("hello", yield_messages=False), "echo: hello")
+        self.assertEqual(self.backend.count("assistants.retrieve"), 0)
+
+    def test_only_what_changed_is_rebuilt(self):
+        first = self.start()
+        get_agency_bundle().save()
+        time.sleep(0.01)
+        with open("instructions.md", "w") as f:
+            f.write("You are the new CEO.")
+
+        second = self.start()
+        stats = get_agency_bundle().stats()
+        self.assertEqual((stats["reused"], stats["rebuilt"]), (4, 2))
+        self.assertEqual(self.validated, 0)
+        self.assertEqual(self.backend.count("assistants.update"), 1)
+        self.assertEqual(second.ceo.id, first.ceo.id)
+        self.assertIn("You are the new CEO.", self.backend.assistants[second.ceo.id]["instructions"])
+        self.assertEqual(second.get_completion("hello", yield_messages=False), "echo: hello")
+
+    def test_build_command(self):
+        with open("bundled_agency.py", "w") as f:
+            f.write(AGENCY_MODULE)
+        build(argparse.Namespace(agency="bundled_agency:create_agency", output="bundle.json"))
+        sys.modules.pop("bundled_agency", None)
+
+        with open("bundle.json") as f:
+            bundle = json.load(f)
+        self.assertEqual(list(bundle["assistants"]), ["CEO"])
+        self.assertEqual(len(bundle["schemas"]), 4)
+        operation = bundle["schemas"][os.path.abspath("schemas/get-weather.json")]["operations"][0]
+        self.assertEqual(operation["function"]["name"], "GetCurrentWeather")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent
+from agency_swarm.threads import ThreadStatus
+from agency_swarm.util import CancellationToken, RequestCancelled
+
+
+hang = {"Worker": True}
+
+
+def responder(assistant, messages):
+    last = messages[-1]
+    if assistant["name"] == "Worker":
+        return {"hang": True} if hang["Worker"] else {"content": "finished"}
+    if assistant["name"] == "CEO" and last["role"] == "user":
+        return {"tool_calls": [{"name": "SendMessage",
+                                "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                              "message": last["content"]}}]}
+    if last["role"] == "tool":
+        return {"content": f"CEO got: {last['content']}"}
+    return {"content": "ok"}
+
+
+class CancellationTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        hang["Worker"] = True
+        self.backend = use_stand_in_backend(self, responder=responder)
+
+        self.ceo = Agent(name="CEO", description="ceo")
+        self.worker = Agent(name="Worker", description="worker")
+        self.agency = Agency([self.ceo, [self.ceo, self.worker]])
+
+    def wait_for_worker_run(self):
+        for _ in range(100):
+            if any(self.backend.assistants[run["assistant_id"]]["name"] == "Worker"
+                   for run in list(self.backend.runs.values())):
+                return
+            time.sleep(0.05)
+        self.fail("Worker run was never created")
+
+    def assert_torn_down(self):
+        statuses = {self.backend.assistants[run["assistant_id"]]["name"]: run["status"]
+                    for run in self.backend.runs.values()}
+        self.assertEqual(statuses, {"CEO": "cancelled", "Worker": "cancelled"})
+        self.assertEqual(self.backend.count("runs.cancel"), 2)
+
+    def test_cancel_tears_down_the_request_tree(self):
+        token = CancellationToken()
+        errors = []
+
+        def request():
+            try:
+                self.agency.get_completion("do the task", yield_messages=False, cancel_token=token)
+            except RequestCancelled as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        self.wait_for_worker_run()
+
+        started = time.monotonic()
+        token.cancel()
+        thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(len(errors), 1)
+        self.assert_torn_down()
+
+        # nothing is left locked: the next request goes through
+        hang["Worker"] = False
+        response = self.agency.get_completion("do the task again", yield_messages=False)
+        self.assertIn("CEO got: finished", response)
+        self.assertTrue(all(t.status is ThreadStatus.Ready for t in self.ceo.threads + self.worker.threads))
+
+    def test_abandoned_generator_cancels_runs(self):
+        gen = self.agency.get_completion("do the task", yield_messages=True)
+        # the SendMessage call of the CEO is announced before the Worker runs
+        for message in gen:
+            if message.msg_type == "function":
+                break
+        gen.close()
+
+        statuses = {self.backend.assistants[run["assistant_id"]]["name"]: run["status"]
+                    for run in self.backend.runs.values()}
+        self.assertEqual(statuses, {"CEO": "cancelled"})
+
+
+if __name__ == '__main__':
+    unittest.main()
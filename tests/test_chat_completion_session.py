@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent, AgencyEventHandler
+from agency_swarm.sessions import ChatCompletionSession
+from agency_swarm.threads import LocalThread, Thread
+
+
+def responder(assistant, messages):
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    last = messages[-1]
+    if "You are the CEO" in system:
+        if last["role"] == "user":
+            return {"tool_calls": [{"name": "SendMessage",
+                                    "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                                  "message": last["content"]}}]}
+        return {"content": f"CEO got: {last['content']}"}
+    return default_responder(assistant, messages)
+
+
+class RecordingHandler(AgencyEventHandler):
+    events = []
+
+    def on_message_created(self, message):
+        self.events.append(("message_created", message.role))
+
+    def on_text_delta(self, delta, snapshot):
+        self.events.append(("text_delta", delta.value))
+
+    def on_tool_call_created(self, tool_call):
+        self.events.append(("tool_call_created", tool_call.function.name))
+
+    def on_tool_call_done(self, tool_call):
+        self.events.append(("tool_call_done", tool_call.function.name))
+
+    def on_run_step_done(self, run_step):
+        for tool_call in run_step.step_details.tool_calls:
+            self.events.append(("tool_output", tool_call.function.output))
+
+
+class ChatCompletionSessionTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+
+        self.ceo = Agent(name="CEO", description="ceo", instructions="You are the CEO.")
+        self.worker = Agent(name="Worker", description="worker", instructions="You are the worker.")
+        self.agency = Agency([self.ceo, [self.ceo, self.worker]], engine="chat_completions")
+
+    def test_send_message_hop(self):
+        self.assertIsInstance(self.agency.entrance_session, ChatCompletionSession)
+        messages = list(self.agency.get_completion("write a haiku"))
+        types = [(m.msg_type, m.sender_name, m.receiver_name) for m in messages]
+
+        self.assertEqual(types, [("text", "User", "CEO"),
+                                 ("function", "CEO", "User"),
+                                 ("response_text", "CEO", "User")])
+        self.assertEqual(messages[-1].content, "CEO got: echo: write a haiku")
+
+        # no assistants, threads, messages or runs on the server
+        self.assertEqual(set(self.backend.calls), {"chat.completions.create"})
+        # CEO: tool call + answer, Worker: answer, task descriptions of both persisted threads
+        self.assertEqual(self.backend.count("chat.completions.create"), 5)
+        self.assertIsInstance(self.ceo.threads[0], LocalThread)
+        self.assertEqual([m["role"] for m in self.ceo.threads[0].messages], ["user", "assistant", "tool", "assistant"])
+
+    def test_event_handler_surface(self):
+        RecordingHandler.events = []
+        response = self.agency.get_completion_stream("hello there", RecordingHandler, message_files=None)
+
+        self.assertEqual(response, "CEO got: echo: hello there")
+        events = RecordingHandler.events
+        self.assertIn(("tool_call_created", "SendMessage"), events)
+        self.assertIn(("tool_call_done", "SendMessage"), events)
+        self.assertIn(("tool_output", "echo: hello there"), events)
+        self.assertEqual(events.count(("message_created", "assistant")), 2)
+        text = "".join(value for kind, value in events if kind == "text_delta")
+        self.assertEqual(text, "echo: hello thereCEO got: echo: hello there")
+
+    def test_follow_up_reuses_local_history(self):
+        self.agency.get_completion("first", yield_messages=False)
+        thread = LocalThread(copy_from=self.ceo.threads[0])
+        self.assertEqual(thread.messages, self.ceo.threads[0].messages)
+        self.assertIsNot(thread.messages, self.ceo.threads[0].messages)
+
+    def test_local_thread_has_the_attributes_of_a_thread(self):
+        calls = len(self.backend.calls)
+        thread = LocalThread()
+        self.assertLessEqual(set(vars(Thread(lazy=True))), set(vars(thread)))
+        self.assertIsNone(thread.streamed_reply)
+        self.assertTrue(thread.created)
+        self.assertEqual(len(self.backend.calls), calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
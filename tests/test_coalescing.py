@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent
+from agency_swarm.server.app import SSEEventHandler
+from agency_swarm.util import AdaptiveLimiter, DeltaCoalescer, set_concurrency_limiter
+
+
+class DeltaCoalescerTest(unittest.TestCase):
+    def test_merges_text_of_the_same_message(self):
+        frames = DeltaCoalescer(interval=0)
+        frames.push({"op": "message", "text": "CEO"})
+        for token in ["Hel", "lo", " world"]:
+            frames.append(token, agent="CEO")
+        frames.append("!", agent="Worker")
+        frames.close()
+
+        self.assertEqual(list(frames), [[{"op": "message", "text": "CEO"},
+                                         {"op": "text", "agent": "CEO", "text": "Hello world"},
+                                         {"op": "text", "agent": "Worker", "text": "!"}]])
+
+    def test_frames_are_bounded_by_time(self):
+        frames = DeltaCoalescer(interval=0.05)
+
+        def produce():
+            for _ in range(500):
+                frames.append("x")
+                time.sleep(0.0005)
+            frames.close()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        received = list(frames)
+        producer.join()
+
+        self.assertEqual("".join(patch["text"] for frame in received for patch in frame), "x" * 500)
+        self.assertLess(len(received), 100)
+
+    def test_size_seals_a_frame(self):
+        frames = DeltaCoalescer(interval=60, max_chars=10)
+        frames.append("a" * 6)
+        self.assertEqual(frames.poll(), (None, False))
+        frames.append("b" * 6)
+        self.assertEqual(frames.poll(), ([{"op": "text", "text": "a" * 6 + "b" * 6}], False))
+
+    def test_backpressure_blocks_the_producer(self):
+        frames = DeltaCoalescer(interval=60, max_chars=1, max_frames=2)
+        produced = []
+
+        def produce():
+            for i in range(10):
+                frames.push({"op": "step", "i": i})
+                frames.append("x")
+                produced.append(i)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        time.sleep(0.1)
+        self.assertLess(len(produced), 10)
+
+        frames.poll()
+        time.sleep(0.1)
+        self.assertLess(len(produced), 10)
+
+        frames.abandon()    # the consumer went away: the producer runs to the end
+        producer.join(1)
+        self.assertEqual(len(produced), 10)
+
+
+class StalledConsumerTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, chunk_size=1)
+        self.limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+        set_concurrency_limiter(self.limiter)
+
+    def run_with_stalled_consumer(self, engine):
+        agent = Agent(name="CEO", description="ceo", instructions="You are the CEO.", model="gpt-4")
+        agency = Agency([agent], engine=engine)
+        frames = DeltaCoalescer(interval=60, max_chars=1, max_frames=1)   # nobody consumes the frames
+        handler = SSEEventHandler.for_request()
+        handler.context.state["frames"] = frames
+        stalled = threading.Thread(target=agency.get_completion_stream, daemon=True,
+                                   args=("a long message for a slow client", handler),
+                                   kwargs={"message_files": None, "session": agency.create_entrance_session()})
+        stalled.start()
+        deadline = time.monotonic() + 5
+        while len(frames._ready) <= frames.max_frames and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(stalled.is_alive())
+
+        # the producer of the slow client is blocked, but holds no slot of the model: another user gets its answer
+        responses = []
+        other = threading.Thread(target=lambda: responses.append(agency.get_completion(
+            "hi", yield_messages=False, session=agency.create_entrance_session())), daemon=True)
+        other.start()
+        other.join(5)
+        self.assertEqual(responses, ["echo: hi"])
+        self.assertTrue(stalled.is_alive())
+        self.assertEqual(self.limiter.stats()["gpt-4"]["inflight"], 0)
+
+        frames.abandon()
+        stalled.join(5)
+        self.assertFalse(stalled.is_alive())
+
+    def test_assistants_stream(self):
+        self.run_with_stalled_consumer("assistants")
+
+    def test_chat_completions_stream(self):
+        self.run_with_stalled_consumer("chat_completions")
+
+
+if __name__ == '__main__':
+    unittest.main()
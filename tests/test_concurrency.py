@@ -0,0 +1,152 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import stand_in_agent, use_stand_in_backend
+
+import openai
+import httpx
+
+from agency_swarm.util import AdaptiveLimiter, set_concurrency_limiter
+from agency_swarm.sessions import Session
+from agency_swarm.user import User
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "http://stand-in/v1/chat/completions")
+    return openai.RateLimitError("Rate limit reached", response=httpx.Response(429, request=request), body=None)
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def test_grows_while_latency_is_stable(self):
+        limiter = AdaptiveLimiter(initial_limit=2, max_limit=8)
+        state = limiter._get("gpt-4")
+        for _ in range(40):
+            with state.cond:
+                state.inflight = int(state.limit)
+            for _ in range(int(state.limit)):
+                limiter._release("gpt-4", state, latency=0.05)
+        self.assertGreater(limiter.get_limit("gpt-4"), 2)
+        self.assertLessEqual(limiter.get_limit("gpt-4"), 8)
+
+    def test_cuts_on_rate_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=8, base_backoff=0, max_retries=0)
+        with self.assertRaises(openai.RateLimitError):
+            limiter.call("gpt-4", self._raise_rate_limit)
+        self.assertEqual(limiter.get_limit("gpt-4"), 4)
+        self.assertEqual(limiter.stats()["gpt-4"]["throttled"], 1)
+
+    def test_cuts_once_per_round_trip(self):
+        limiter = AdaptiveLimiter(initial_limit=8)
+        limiter._get("gpt-4").baseline_latency = 60
+        for _ in range(3):
+            limiter.on_throttle("gpt-4")
+        self.assertEqual(limiter.get_limit("gpt-4"), 4)
+        self.assertEqual(limiter.stats()["gpt-4"]["throttled"], 3)
+
+    def test_cuts_on_latency_spike(self):
+        limiter = AdaptiveLimiter(initial_limit=10)
+        state = limiter._get("gpt-4")
+        state.baseline_latency = 0.001
+        with state.cond:
+            state.inflight += 1
+        limiter._release("gpt-4", state, latency=1.0)
+        self.assertEqual(limiter.get_limit("gpt-4"), 9)
+        self.assertEqual(limiter.stats()["gpt-4"]["latency_spikes"], 1)
+
+    def test_limits_are_per_model(self):
+        limiter = AdaptiveLimiter(initial_limit=8, base_backoff=0, max_retries=0,
+                                  model_limits={"gpt-3.5-turbo": 2})
+        with self.assertRaises(openai.RateLimitError):
+            limiter.call("gpt-4", self._raise_rate_limit)
+        self.assertEqual(limiter.get_limit("gpt-4"), 4)
+        self.assertEqual(limiter.get_limit("gpt-3.5-turbo"), 2)
+
+    def test_passes_the_model_keyword_through(self):
+        limiter = AdaptiveLimiter()
+        self.assertEqual(limiter.call("gpt-4", lambda model, messages: model, model="gpt-4", messages=[]), "gpt-4")
+
+    def test_blocks_above_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+        entered = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with limiter.acquire("gpt-4"):
+                entered.set()
+                release.wait()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        entered.wait()
+        waiter = threading.Thread(target=lambda: limiter.call("gpt-4", lambda: None))
+        waiter.start()
+        waiter.join(0.1)
+        self.assertTrue(waiter.is_alive())
+        release.set()
+        waiter.join()
+        holder.join()
+        self.assertEqual(limiter.stats()["gpt-4"]["queued"], 1)
+
+    def test_stream_slot_is_released_before_consumption(self):
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+        events = []
+
+        class Manager:
+            def __enter__(self):
+                time.sleep(0.01)
+                return "stream"
+
+            def __exit__(self, *exc_info):
+                events.append("closed")
+
+        for _ in range(3):
+            with limiter.stream("gpt-4", Manager()) as stream:
+                self.assertEqual(stream, "stream")
+                self.assertEqual(limiter.stats()["gpt-4"]["inflight"], 0)
+                # a second request of the same model does not wait for the consumer
+                limiter.call("gpt-4", lambda: None)
+                time.sleep(0.1)  # slow consumer
+        stats = limiter.stats()["gpt-4"]
+        self.assertEqual(stats["latency_spikes"], 0)
+        self.assertEqual(stats["queued"], 0)
+        self.assertEqual(events, ["closed"] * 3)
+
+    @staticmethod
+    def _raise_rate_limit():
+        raise rate_limit_error()
+
+
+class SessionLimiterTest(unittest.TestCase):
+    def test_session_recovers_from_throttling(self):
+        backend = use_stand_in_backend(self, latency=0.02, capacity=2)
+        limiter = AdaptiveLimiter(initial_limit=8, base_backoff=0.01, max_retries=20)
+        set_concurrency_limiter(limiter)
+        agent = stand_in_agent(backend, "Worker", model="gpt-4")
+
+        results = []
+
+        def converse(i):
+            gen = Session(User(), agent).get_completion(f"hello {i}", is_persist=False)
+            try:
+                while True:
+                    next(gen)
+            except StopIteration as e:
+                results.append(e.value)
+
+        workers = [threading.Thread(target=converse, args=(i,)) for i in range(8)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        self.assertEqual(sorted(results), sorted(f"echo: hello {i}" for i in range(8)))
+        self.assertLessEqual(limiter.get_limit("gpt-4"), 4)
+        self.assertGreater(limiter.stats()["gpt-4"]["throttled"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
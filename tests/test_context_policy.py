@@ -0,0 +1,158 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, stand_in_agent, use_stand_in_backend
+
+from agency_swarm.sessions import Session, ChatCompletionSession
+from agency_swarm.threads import LocalThread, Thread
+from agency_swarm.user import User
+from agency_swarm.util import ContextPolicy
+
+
+def complete(session, message):
+    gen = session.get_completion(message)
+    try:
+        while True:
+            next(gen)
+    except StopIteration as e:
+        return e.value
+
+
+def responder(assistant, messages):
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    if '"session_id"' in system:
+        return {"content": json.dumps({"session_id": 1, "reason": "same task"})}
+    if "compressing" in system:
+        return {"content": "short summary"}
+    return default_responder(assistant, messages)
+
+
+class ContextPolicyTest(unittest.TestCase):
+    def test_trim(self):
+        messages = [{"role": "user", "content": "word " * 200},
+                    {"role": "assistant", "content": None,
+                     "tool_calls": [{"id": "call_1", "function": {"name": "Tool", "arguments": "{}"}}]},
+                    {"role": "tool", "tool_call_id": "call_1", "content": "out"},
+                    {"role": "assistant", "content": "done"},
+                    {"role": "user", "content": "next"}]
+
+        self.assertEqual(ContextPolicy().trim(messages), messages)
+        # never starts with a tool output
+        self.assertEqual(ContextPolicy(last_messages=3).trim(messages), messages[3:])
+        self.assertEqual(ContextPolicy(max_prompt_tokens=256).trim(messages), messages[1:])
+        self.assertEqual(ContextPolicy(max_prompt_tokens=256).trim(messages, reserved_tokens=240), messages[3:])
+
+    def test_invalid_budget(self):
+        with self.assertRaises(Exception):
+            ContextPolicy(max_prompt_tokens=100)
+
+
+class ContextBudgetSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.user = User()  # threads are routed per user
+        self.backend = use_stand_in_backend(self, responder=responder)
+
+    def test_run_params(self):
+        policy = ContextPolicy(max_prompt_tokens=1000, last_messages=2)
+        agent = stand_in_agent(self.backend, "Worker", context_policy=policy)
+        complete(Session(self.user, agent), "first")
+        complete(Session(self.user, agent), "second")
+
+        runs = [run for run in self.backend.runs.values() if run["assistant_id"] == agent.id]
+        self.assertEqual(len(runs), 2)
+        for run in runs:
+            self.assertEqual(run["max_prompt_tokens"], 1000)
+            self.assertEqual(run["truncation_strategy"], {"type": "last_messages", "last_messages": 2})
+
+    def test_token_growth(self):
+        agent = stand_in_agent(self.backend, "Worker")
+        complete(Session(self.user, agent), "first")
+        complete(Session(self.user, agent), "second")
+
+        thread = agent.threads[0]
+        self.assertEqual(len(thread.token_growth), 2)
+        self.assertGreater(thread.token_growth[1], thread.token_growth[0])
+        self.assertEqual(thread.token_estimate, thread.token_growth[-1])
+
+    def test_compaction(self):
+        policy = ContextPolicy(compact_at_tokens=30, keep_last_messages=2)
+        agent = stand_in_agent(self.backend, "Worker", context_policy=policy)
+        for message in ("first task " * 5, "second task " * 5):
+            complete(Session(self.user, agent), message)
+        old = agent.threads[0]
+        self.assertGreaterEqual(old.token_estimate, 30)
+
+        self.assertEqual(complete(Session(self.user, agent), "third"), "echo: third")
+        self.assertEqual(len(agent.threads), 1)
+        compacted = agent.threads[0]
+        self.assertNotEqual(compacted.thread_id, old.thread_id)
+        self.assertEqual(compacted.compactions, 1)
+        self.assertIsNone(old.lease)
+
+        conversation = self.backend.conversation(compacted.thread_id)
+        self.assertEqual(conversation[0]["content"], "[Summary of the earlier conversation]\nshort summary")
+        self.assertEqual([m["content"] for m in conversation[1:]],
+                         ["second task " * 5, "echo: " + "second task " * 5, "third", "echo: third"])
+
+    def test_failed_compaction_releases_the_thread(self):
+        policy = ContextPolicy(compact_at_tokens=30, keep_last_messages=2)
+        agent = stand_in_agent(self.backend, "Worker", context_policy=policy)
+        for message in ("first task " * 5, "second task " * 5):
+            complete(Session(self.user, agent), message)
+        thread = agent.threads[0]
+
+        def failing(assistant, messages):
+            if "compressing" in messages[0]["content"]:
+                raise Exception("summary failed")
+            return responder(assistant, messages)
+
+        self.backend.responder = failing
+        with self.assertRaises(Exception):
+            complete(Session(self.user, agent), "third")
+        self.assertIsNone(thread.lease)
+
+        self.backend.responder = responder
+        self.assertEqual(complete(Session(self.user, agent), "third"), "echo: third")
+        self.assertEqual(agent.threads[0].compactions, 1)
+
+    def test_compaction_keeps_the_latest_messages_of_long_threads(self):
+        policy = ContextPolicy(compact_at_tokens=30, keep_last_messages=2)
+        agent = stand_in_agent(self.backend, "Worker", context_policy=policy)
+        complete(Session(self.user, agent), "first")
+        old = agent.threads[0]
+        for i in range(150):
+            self.backend._add_message(old.thread_id, f"message {i}", "user" if i % 2 == 0 else "assistant")
+        old.token_estimate = 1000
+
+        self.assertEqual(complete(Session(self.user, agent), "last"), "echo: last")
+        conversation = self.backend.conversation(agent.threads[0].thread_id)
+        self.assertEqual([m["content"] for m in conversation[1:]], ["message 148", "message 149", "last", "echo: last"])
+
+    def test_copy_of_an_uncreated_thread(self):
+        messages = [{"role": "user", "content": "[Summary of the earlier conversation]\nshort summary"},
+                    {"role": "assistant", "content": "ok"}]
+        lazy = Thread(messages=messages, lazy=True)
+        self.assertEqual(Thread(copy_from=lazy, lazy=True).pending_messages, messages)
+
+        copy = Thread(copy_from=lazy)
+        self.assertEqual(self.backend.conversation(copy.thread_id), messages)
+
+    def test_local_compaction(self):
+        policy = ContextPolicy(compact_at_tokens=30, keep_last_messages=2)
+        agent = stand_in_agent(self.backend, "Worker", context_policy=policy)
+        for message in ("first task " * 5, "second task " * 5, "third"):
+            complete(ChatCompletionSession(self.user, agent), message)
+
+        thread = agent.threads[0]
+        self.assertIsInstance(thread, LocalThread)
+        self.assertEqual(thread.compactions, 1)
+        self.assertEqual(thread.messages[0]["content"], "[Summary of the earlier conversation]\nshort summary")
+        self.assertEqual(len(thread.messages), 5)
+        self.assertEqual(thread.token_estimate, thread.token_growth[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent
+from agency_swarm.util import Deadline
+
+
+def responder(assistant, messages):
+    last = messages[-1]
+    if assistant["name"] == "Worker":
+        return {"hang": True}
+    if assistant["name"] == "CEO" and last["role"] == "user":
+        return {"tool_calls": [{"name": "SendMessage",
+                                "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                              "message": last["content"]}}]}
+    if last["role"] == "tool":
+        return {"content": f"CEO got: {last['content']}"}
+    return {"content": "ok"}
+
+
+class DeadlineTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+
+    def test_shrink(self):
+        deadline = Deadline(10)
+        child = deadline.shrink()
+        self.assertLess(child.remaining(), deadline.remaining())
+        self.assertAlmostEqual(child.remaining(), 9, delta=0.1)
+
+    def test_hanging_recipient_is_cancelled(self):
+        ceo = Agent(name="CEO", description="ceo")
+        worker = Agent(name="Worker", description="worker")
+        agency = Agency([ceo, [ceo, worker]])
+
+        started = time.monotonic()
+        response = agency.get_completion("do the task", yield_messages=False, timeout=2)
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 3)
+        self.assertIn("CEO got:", response)
+        self.assertIn("Worker ran out of time", response)
+        self.assertEqual(self.backend.count("runs.cancel"), 1)
+        cancelled = [run for run in self.backend.runs.values() if run["status"] == "cancelled"]
+        self.assertEqual(len(cancelled), 1)
+        self.assertEqual(self.backend.assistants[cancelled[0]["assistant_id"]]["name"], "Worker")
+
+
+if __name__ == '__main__':
+    unittest.main()
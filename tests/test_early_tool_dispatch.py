@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from pydantic import Field
+
+from agency_swarm import Agency, Agent, BaseTool, LeanEventHandler
+from agency_swarm.sessions.tool_dispatch import EarlyToolDispatcher
+
+started = {}
+
+
+class Slow(BaseTool):
+    """Takes a while."""
+    n: int = Field(..., description="Number of the call.")
+
+    def run(self, caller_thread=None):
+        started[self.n] = (time.monotonic(), threading.current_thread().name)
+        time.sleep(0.2)
+        return f"slow {self.n}"
+
+
+def responder(assistant, messages):
+    if "You are the CEO" not in messages[0]["content"]:
+        return default_responder(assistant, messages)
+    if messages[-1]["role"] == "user":
+        return {"tool_calls": [{"name": "Slow", "arguments": {"n": n}} for n in range(3)]}
+    return {"content": ", ".join(m["content"] for m in messages if m["role"] == "tool")}
+
+
+class Handler(LeanEventHandler):
+    def on_tool_call_done(self, tool_call):
+        self.context.state.setdefault("arguments_done", []).append(time.monotonic())
+
+
+class EarlyToolDispatchTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        started.clear()
+        self.backend = use_stand_in_backend(self, responder=responder, event_delay=0.03)
+        self.agency = Agency([Agent(name="CEO", description="ceo", instructions="You are the CEO.", tools=[Slow])])
+
+    def complete(self, early: bool):
+        session = self.agency.create_entrance_session()
+        session.early_tool_dispatch = early
+        handler = Handler.for_request()
+        response = self.agency.get_completion_stream("go", handler, message_files=None, session=session)
+        return response, handler.context.state["arguments_done"]
+
+    def test_calls_start_while_the_step_is_generated(self):
+        response, arguments_done = self.complete(early=True)
+
+        self.assertEqual(response, "slow 0, slow 1, slow 2")
+        self.assertLess(started[0][0], arguments_done[-1])
+        self.assertTrue(started[0][1].startswith("early_tool_dispatch"))
+        # one after the other, in the order of the step
+        self.assertLess(started[0][0], started[1][0])
+        self.assertLess(started[1][0], started[2][0])
+        self.assertEqual(self.backend.count("runs.submit_tool_outputs"), 1)
+
+    def test_disabled(self):
+        self.assertFalse(self.agency.create_entrance_session().early_tool_dispatch)
+        response, arguments_done = self.complete(early=False)
+
+        self.assertEqual(response, "slow 0, slow 1, slow 2")
+        self.assertGreater(started[0][0], arguments_done[-1])
+
+    def test_tools_that_stream_are_not_dispatched_early(self):
+        Slow.early_dispatch = False
+        try:
+            response, arguments_done = self.complete(early=True)
+        finally:
+            Slow.early_dispatch = True
+
+        self.assertEqual(response, "slow 0, slow 1, slow 2")
+        self.assertGreater(started[0][0], arguments_done[-1])
+
+    def test_close_waits_for_the_running_call(self):
+        finished = []
+
+        def run_tool_call(tool_call):
+            time.sleep(0.1)
+            finished.append(tool_call.id)
+            yield from ()
+            return "done"
+
+        dispatcher = EarlyToolDispatcher(run_tool_call)
+        for n in range(3):
+            dispatcher.dispatch(SimpleNamespace(id=f"call_{n}"))
+        time.sleep(0.05)
+        dispatcher.close()
+        self.assertEqual(finished, ["call_0"])
+        time.sleep(0.15)
+        self.assertEqual(finished, ["call_0"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["openai", "instructor", "pydantic", "rich", "deepdiff", "dotenv", "numpy", "httpx", "jsonref",
+                 "gradio", "selenium", "langchain"]
+
+IMPORT_BUDGET = 0.25  # seconds, the CLI takes a few milliseconds
+
+
+def run_python(code: str, cwd: str, **env) -> dict:
+    """Runs code in a fresh interpreter and returns the JSON it prints."""
+    environment = {k: v for k, v in os.environ.items() if k != "AS_PROJECT_ROOT"}
+    environment.update(env, PYTHONPATH=ROOT)
+    output = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=environment, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class ImportTimeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def measure(self, module: str) -> dict:
+        return run_python(f"""
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+""", self.tmp)
+
+    def test_package_import_is_lazy(self):
+        for module in ("agency_swarm", "agency_swarm.util", "agency_swarm.cli"):
+            measured = self.measure(module)
+            self.assertEqual(measured["loaded"], [], module)
+            self.assertLess(measured["elapsed"], IMPORT_BUDGET, module)
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_public_api_is_loaded_on_use(self):
+        result = run_python("""
+import json, agency_swarm
+from agency_swarm import Agency, Agent, BaseTool, LeanEventHandler
+from agency_swarm.util import Deadline, ToolExecutor, create_agent_template
+try:
+    agency_swarm.Missing
+    missing = False
+except AttributeError:
+    missing = True
+print(json.dumps({"names": [Agency.__name__, Agent.__name__, BaseTool.__name__, LeanEventHandler.__name__,
+                            Deadline.__name__, ToolExecutor.__name__, create_agent_template.__name__],
+                  "all": all(hasattr(agency_swarm, name) for name in agency_swarm.__all__),
+                  "dir": "Agency" in dir(agency_swarm), "missing": missing}))
+""", self.tmp)
+        self.assertEqual(result, {"names": ["Agency", "Agent", "BaseTool", "LeanEventHandler", "Deadline",
+                                            "ToolExecutor", "create_agent_template"],
+                                  "all": True, "dir": True, "missing": True})
+
+    def test_log_file_is_created_on_the_first_record(self):
+        result = run_python("""
+import json, os
+from agency_swarm import Agency
+from agency_swarm.util import setup_logging
+before = os.path.exists("logs")
+setup_logging().debug("first record")
+print(json.dumps({"before": before, "after": os.listdir("logs")}))
+""", self.tmp, AS_PROJECT_ROOT=self.tmp)
+        self.assertFalse(result["before"])
+        self.assertEqual(len(result["after"]), 1)
+
+    def test_no_log_file_without_a_configured_folder(self):
+        code = """
+import json, os
+from agency_swarm.util import setup_logging
+setup_logging().debug("record")
+print(json.dumps(sorted(os.listdir("."))))
+"""
+        self.assertEqual(run_python(code, self.tmp), [])
+        log_dir = os.path.join(self.tmp, "custom")
+        self.assertEqual(run_python(code, self.tmp, AS_LOG_DIR=log_dir), ["custom"])
+        self.assertEqual(len(os.listdir(log_dir)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import StandInBackend, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent, AgencyEventHandler, LeanEventHandler
+
+
+def responder(assistant, messages):
+    if messages[-1]["role"] == "tool":
+        return {"content": "The weather in Paris is " + "very " * 50 + "sunny."}
+    return {"tool_calls": [{"name": "GetWeather", "arguments": {"city": "Paris", "unit": "celsius"}},
+                           {"name": "GetTime", "arguments": {"city": "Paris"}}]}
+
+
+class Replay(list):
+    def close(self):
+        pass
+
+
+def replay(handler_class, events):
+    handler = handler_class()
+    handler._init(Replay(event.model_copy(deep=True) for event in events))  # the full handler mutates the events
+    handler.until_done()
+    return handler
+
+
+class Recorder:
+    def on_message_created(self, message):
+        self.log.append(("message_created", message.role))
+
+    def on_text_delta(self, delta, snapshot):
+        self.log.append(("text_delta", delta.value))
+
+    def on_text_done(self, text):
+        self.log.append(("text_done", text.value))
+
+    def on_message_done(self, message):
+        self.log.append(("message_done", message.content[0].text.value))
+
+    def on_tool_call_created(self, tool_call):
+        self.log.append(("tool_call_created", tool_call.id, tool_call.function.name))
+
+    def on_tool_call_done(self, tool_call):
+        self.log.append(("tool_call_done", tool_call.id, tool_call.function.name, tool_call.function.arguments))
+
+    def on_run_step_done(self, run_step):
+        self.log.append(("run_step_done", run_step.type))
+
+
+class FullRecorder(Recorder, AgencyEventHandler):
+    def __init__(self):
+        super().__init__()
+        self.log = []
+
+
+class LeanRecorder(Recorder, LeanEventHandler):
+    def __init__(self):
+        super().__init__()
+        self.log = []
+
+
+class LeanEventHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = StandInBackend(responder=responder, chunk_size=4)
+        self.streams = self.backend.record_streams("What is the weather in Paris?")
+
+    def test_same_callbacks_as_the_full_handler(self):
+        for events in self.streams:
+            full, lean = replay(FullRecorder, events), replay(LeanRecorder, events)
+            self.assertEqual(lean.log, full.log)
+            self.assertEqual(lean.get_final_run().status, full.get_final_run().status)
+
+        tool_calls, message = replay(LeanRecorder, self.streams[0]), replay(LeanRecorder, self.streams[1])
+        self.assertIn(("tool_call_done", tool_calls.log[0][1], "GetWeather", '{"city": "Paris", "unit": "celsius"}'),
+                      tool_calls.log)
+        self.assertEqual(message.get_final_messages()[0].content[0].text.value,
+                         "The weather in Paris is " + "very " * 50 + "sunny.")
+
+    def test_only_subscribed_callbacks_are_dispatched(self):
+        class TextOnly(LeanEventHandler):
+            def on_text_delta(self, delta, snapshot):
+                self.context.state.setdefault("text", []).append((delta.value, snapshot))
+
+        handler_class = TextOnly.for_request()
+        self.assertEqual(handler_class._subscriptions(), {"on_text_delta"})
+        for events in self.streams:
+            replay(handler_class, events)
+        text = handler_class.context.state["text"]
+        self.assertEqual("".join(value for value, _ in text), "The weather in Paris is " + "very " * 50 + "sunny.")
+        self.assertEqual({snapshot for _, snapshot in text}, {None})
+
+    def test_accumulate_snapshots(self):
+        class WithSnapshots(LeanEventHandler):
+            accumulate_snapshots = True
+
+            def on_text_delta(self, delta, snapshot):
+                self.snapshot = snapshot.value
+
+        self.assertEqual(replay(WithSnapshots, self.streams[1]).snapshot,
+                         "The weather in Paris is " + "very " * 50 + "sunny.")
+
+
+class LeanStreamingAgencyTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, chunk_size=3)
+
+    def test_get_completion_stream(self):
+        class Handler(LeanEventHandler):
+            def on_text_delta(self, delta, snapshot):
+                self.context.state["text"] = self.context.state.get("text", "") + delta.value
+
+        agency = Agency([Agent(name="CEO", description="ceo", instructions="You are the CEO.")])
+        handler = Handler.for_request()
+        self.assertEqual(agency.get_completion_stream("hello there", handler, message_files=None), "echo: hello there")
+        self.assertEqual(handler.context.state["text"], "echo: hello there")
+
+
+if __name__ == '__main__':
+    unittest.main()
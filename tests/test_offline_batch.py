@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from pydantic import Field
+
+from agency_swarm import Agency, Agent, BaseTool
+
+
+class Reverse(BaseTool):
+    """Reverses a text."""
+    text: str = Field(..., description="The text to reverse.")
+
+    def run(self, caller_thread=None):
+        return self.text[::-1]
+
+
+class OfflineBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = use_temp_dir(self)
+        self.flaky = set()
+
+        def responder(assistant, messages):
+            system = messages[0]["content"]
+            last = messages[-1]
+            if "You are the CEO" in system:
+                if last["role"] == "user":
+                    return {"tool_calls": [{"name": "SendMessage",
+                                            "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                                          "message": last["content"]}}]}
+                return {"content": f"CEO: {last['content']}"}
+            if last["role"] == "user":
+                if last["content"] in self.flaky:
+                    self.flaky.remove(last["content"])
+                    raise RuntimeError("overloaded")
+                return {"tool_calls": [{"name": "Reverse", "arguments": {"text": last["content"]}}]}
+            return default_responder(assistant, messages)
+
+        self.backend = use_stand_in_backend(self, responder=responder, batch_dir=os.path.join(self.tmp, "batches"),
+                                            queued_polls=2)
+        os.makedirs(self.backend.batch_dir)
+        ceo = Agent(name="CEO", description="ceo", instructions="You are the CEO.")
+        worker = Agent(name="Worker", description="worker", instructions="You are the worker.", tools=[Reverse])
+        self.agency = Agency([ceo, [ceo, worker]])
+        self.backend.reset_calls()
+
+    def test_waves(self):
+        work_dir = os.path.join(self.tmp, "work")
+        results = self.agency.run_offline_batch(["abc", "hello"], work_dir=work_dir, poll_interval=0)
+
+        self.assertEqual([r.response for r in results], ["CEO: done: cba", "CEO: done: olleh"])
+        # CEO delegates, Worker calls the tool, Worker answers, CEO answers
+        self.assertEqual(self.backend.count("batches.create"), 4)
+        self.assertEqual(self.backend.count("batch.chat.completions"), 8)
+        self.assertEqual(self.backend.count("batches.retrieve"), 8)
+        self.assertNotIn("runs.create", self.backend.calls)
+        self.assertNotIn("chat.completions.create", self.backend.calls)
+
+        with open(os.path.join(work_dir, "wave_2_requests.jsonl")) as f:
+            requests = [json.loads(line) for line in f]
+        self.assertEqual(requests[0]["body"]["messages"][1:], [{"role": "user", "content": "abc"}])
+        self.assertIn("You are the worker.", requests[0]["body"]["messages"][0]["content"])
+        self.assertEqual([tool["function"]["name"] for tool in requests[0]["body"]["tools"]], ["Reverse"])
+        self.assertTrue(os.path.isfile(os.path.join(work_dir, "wave_4_results.jsonl")))
+
+    def test_failed_request_is_retried(self):
+        self.flaky = {"hello"}
+        results = self.agency.run_offline_batch(["abc", "hello"], poll_interval=0)
+
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(results[1].response, "CEO: done: olleh")
+        self.assertEqual(self.backend.count("batches.create"), 5)
+
+    def test_max_waves(self):
+        results = self.agency.run_offline_batch(["abc"], poll_interval=0, max_waves=2)
+        self.assertFalse(results[0].ok)
+        self.assertIn("2 waves", results[0].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent
+from agency_swarm.user import User
+from agency_swarm.util import ResponseCache
+
+
+def responder(assistant, messages):
+    last = messages[-1]
+    if assistant["name"] == "CEO" and last["role"] == "user":
+        return {"tool_calls": [{"name": "SendMessage",
+                                "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                              "message": last["content"]}}]}
+    if assistant["name"] == "CEO" and last["role"] == "tool":
+        return {"content": last["content"]}
+    return default_responder(assistant, messages)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_exact_after_normalization(self):
+        cache = ResponseCache()
+        cache.store("What is the Q3 revenue?", "42")
+        self.assertEqual(cache.lookup("  what is the q3 REVENUE "), "42")
+        self.assertEqual(cache.stats()["exact_hits"], 1)
+
+    def test_near_duplicates(self):
+        cache = ResponseCache(threshold=0.8)
+        cache.store("Summarize the quarterly revenue report for the sales team", "summary")
+
+        self.assertEqual(cache.lookup("Please summarize the quarterly revenue report for the sales team"), "summary")
+        self.assertIsNone(cache.lookup("Write a poem about the ocean"))
+        stats = cache.stats()
+        self.assertEqual((stats["near_hits"], stats["misses"]), (1, 1))
+
+    def test_threshold_one_only_matches_exactly(self):
+        cache = ResponseCache(threshold=1.01)
+        cache.store("Summarize the report", "summary")
+        self.assertIsNone(cache.lookup("Summarize the report please"))
+        self.assertEqual(cache.lookup("summarize the report!"), "summary")
+
+    def test_freshness_window(self):
+        cache = ResponseCache(ttl=0.05)
+        cache.store("status", "green")
+        time.sleep(0.06)
+        self.assertIsNone(cache.lookup("status"))
+        self.assertEqual(len(cache), 0)
+
+    def test_scopes(self):
+        cache = ResponseCache()
+        cache.store("status", "green", scope="alice")
+        self.assertIsNone(cache.lookup("status", scope="bob"))
+        self.assertEqual(cache.lookup("status", scope="alice"), "green")
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResponseCache(max_entries=2)
+        cache.store("first request", "1")
+        cache.store("second request", "2")
+        cache.lookup("first request")
+        cache.store("third request", "3")
+
+        self.assertEqual(cache.lookup("first request"), "1")
+        self.assertIsNone(cache.lookup("second request"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class SendMessageCacheTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+        self.ceo = Agent(name="CEO", description="ceo")
+        self.worker = Agent(name="Worker", description="worker", response_cache=ResponseCache(threshold=0.8))
+        self.agency = Agency([self.ceo, [self.ceo, self.worker]])
+        self.user = User()
+
+    def ask(self, message, user=None):
+        session = self.agency.create_entrance_session(user or self.user)
+        return self.agency.get_completion(message, yield_messages=False, session=session)
+
+    def worker_runs(self):
+        worker_id = next(id for id, a in self.backend.assistants.items() if a["name"] == "Worker")
+        return sum(run["assistant_id"] == worker_id for run in self.backend.runs.values())
+
+    def test_repeated_request_skips_the_run(self):
+        self.assertEqual(self.ask("Compile the weekly sales figures for the north region"),
+                         "echo: Compile the weekly sales figures for the north region")
+        self.assertEqual(self.ask("compile the weekly sales figures for the north region please"),
+                         "echo: Compile the weekly sales figures for the north region")
+
+        self.assertEqual(self.worker_runs(), 1)
+        self.assertEqual(self.worker.response_cache.stats()["near_hits"], 1)
+
+    def test_other_users_are_not_served_from_the_cache(self):
+        self.ask("Compile the weekly sales figures")
+        self.ask("Compile the weekly sales figures", user=User())
+        self.assertEqual(self.worker_runs(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+import httpx
+
+from agency_swarm import Agency, Agent
+from agency_swarm.server import AgencyServer
+
+
+def responder(assistant, messages):
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    if '"session_id"' in system:
+        return {"content": json.dumps({"session_id": 1, "reason": "same task"})}
+    return default_responder(assistant, messages)
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class AgencyServerTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder, latency=0.05)
+        self.ceo = Agent(name="CEO", description="ceo", instructions="You are the CEO.")
+        self.agency = Agency([self.ceo])
+        self.server = AgencyServer(self.agency)
+
+    def tearDown(self):
+        self.server.executor.shutdown()
+
+    def request(self, *requests):
+        async def run():
+            transport = httpx.ASGITransport(app=self.server)
+            async with httpx.AsyncClient(transport=transport, base_url="http://agency") as client:
+                return await asyncio.gather(*(client.request(method, url, json=body)
+                                              for method, url, body in requests))
+        return asyncio.run(run())
+
+    def test_stream_per_user(self):
+        users = [f"user{i}" for i in range(10)]
+        responses = self.request(*[("POST", f"/users/{user}/messages", {"message": f"hi from {user}"})
+                                   for user in users])
+
+        for user, response in zip(users, responses):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["content-type"], "text/event-stream")
+            events = parse_sse(response.text)
+            self.assertEqual(events[-1], ("done", {"response": f"echo: hi from {user}"}))
+            text = "".join(data["text"] for event, data in events if event == "text_delta")
+            self.assertEqual(text, f"echo: hi from {user}")
+            self.assertIn(("message_created", {"agent": "CEO", "recipient": "User"}), events)
+
+        # every user got its own CEO thread, the classifier never routed a user into another user's thread
+        self.assertEqual(len(self.ceo.threads), 10)
+        self.assertEqual(len({thread.owner for thread in self.ceo.threads}), 10)
+        self.assertEqual(self.backend.count("chat.completions.create"), 10)  # task descriptions only
+
+    def test_follow_up_reuses_the_users_thread(self):
+        self.request(("POST", "/users/alice/messages", {"message": "one", "stream": False}),
+                     ("POST", "/users/bob/messages", {"message": "two", "stream": False}))
+        response, = self.request(("POST", "/users/alice/messages", {"message": "three", "stream": False}))
+
+        self.assertEqual(response.json(), {"response": "echo: three"})
+        self.assertEqual(len(self.ceo.threads), 2)
+        alice = self.server.sessions.acquire("alice").user.uuid
+        thread = next(thread for thread in self.ceo.threads if thread.owner == alice)
+        self.assertEqual([m["content"] for m in self.backend.conversation(thread.thread_id)],
+                         ["one", "echo: one", "three", "echo: three"])
+
+    def test_idle_eviction(self):
+        self.server.sessions.idle_timeout = 0
+        self.request(("POST", "/users/alice/messages", {"message": "one", "stream": False}))
+        self.assertEqual(len(self.ceo.threads), 1)
+
+        self.request(("POST", "/users/bob/messages", {"message": "two", "stream": False}))
+        self.assertNotIn("alice", self.server.sessions)
+        self.assertEqual(len(self.ceo.threads), 1)
+
+        response, = self.request(("DELETE", "/users/bob", None))
+        self.assertEqual(response.json(), {"deleted": True})
+        self.assertEqual(self.ceo.threads, [])
+
+    def test_requests_wait_for_a_free_worker(self):
+        self.server.executor.shutdown()
+        self.server = AgencyServer(self.agency, max_workers=2)
+        users = [f"user{i}" for i in range(5)]
+        with self.assertLogs("agency_swarm", level="WARNING") as logs:
+            responses = self.request(*[("POST", f"/users/{user}/messages", {"message": user, "stream": False})
+                                       for user in users])
+
+        self.assertEqual([response.json() for response in responses], [{"response": f"echo: {u}"} for u in users])
+        self.assertIn("All 2 workers are busy", logs.output[0])
+        health, = self.request(("GET", "/health", None))
+        self.assertEqual(health.json(), {"status": "ok", "users": 5, "requests": 0, "queued": 0, "max_workers": 2})
+        with self.assertRaises(Exception):
+            AgencyServer(self.agency, max_workers=0)
+
+    def test_bad_requests(self):
+        missing, empty, unknown = self.request(("POST", "/users/alice/messages", {"text": "hi"}),
+                                               ("POST", "/users/alice/messages", None),
+                                               ("GET", "/nowhere", None))
+        self.assertEqual(missing.status_code, 400)
+        self.assertEqual(empty.status_code, 400)
+        self.assertEqual(unknown.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent
+from agency_swarm.util import CancellationToken, RequestCancelled, SingleFlight
+
+
+def responder(assistant, messages):
+    last = messages[-1]
+    if assistant["name"] == "CEO" and last["role"] == "user":
+        return {"tool_calls": [{"name": "SendMessage",
+                                "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                              "message": last["content"]}}]}
+    if assistant["name"] == "CEO" and last["role"] == "tool":
+        return {"content": last["content"]}
+    if assistant["name"] == "Worker":
+        time.sleep(0.3)
+    return default_responder(assistant, messages)
+
+
+def completion(result):
+    yield "working"
+    return result
+
+
+def failing_completion():
+    yield "working"
+    raise RuntimeError("leader crashed")
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_waiting_requests_get_the_answer_of_the_leader(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.attach("k"), (True, None))
+        leader = flight.lead("k", completion("answer"))
+        with ThreadPoolExecutor(3) as pool:
+            waiting = [pool.submit(flight.attach, "k") for _ in range(3)]
+            time.sleep(0.1)
+            self.assertEqual(list(leader), ["working"])
+            self.assertEqual([f.result() for f in waiting], [(False, "answer")] * 3)
+        self.assertEqual(flight.stats(), {"in_flight": 0, "leaders": 1, "coalesced": 3, "retried": 0})
+
+    def test_failed_leader_is_replaced(self):
+        flight = SingleFlight()
+        flight.attach("k")
+        leader = flight.lead("k", failing_completion())
+        with ThreadPoolExecutor(1) as pool:
+            waiting = pool.submit(flight.attach, "k")
+            time.sleep(0.1)
+            with self.assertRaises(RuntimeError):
+                list(leader)
+            self.assertEqual(waiting.result(), (True, None))
+        self.assertEqual(flight.stats()["retried"], 1)
+
+    def test_closed_or_dropped_leader_is_replaced(self):
+        flight = SingleFlight()
+        flight.attach("k")
+        leader = flight.lead("k", completion("answer"))
+        next(leader)
+        leader.close()  # the caller stopped consuming the stream
+        self.assertEqual(flight.attach("k"), (True, None))
+
+        flight.lead("k", completion("answer"))  # never iterated
+        self.assertEqual(flight.attach("k"), (True, None))
+        self.assertEqual(flight.stats()["leaders"], 3)
+
+    def test_waiting_request_can_be_cancelled(self):
+        flight = SingleFlight()
+        flight.attach("k")
+        token = CancellationToken()
+        threading.Timer(0.1, token.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            flight.attach("k", cancel_token=token)
+
+    def test_default_key(self):
+        self.assertEqual(SingleFlight.default_key(" a  b ", None, "user"), ("user", "a b", ()))
+
+
+class SendMessageSingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+
+    def run_parallel(self, flight, messages):
+        self.ceo = Agent(name="CEO", description="ceo")
+        self.worker = Agent(name="Worker", description="worker", single_flight=flight)
+        agency = Agency([self.ceo, [self.ceo, self.worker]])
+        results = list(agency.run_batch(messages, concurrency=len(messages)))
+        return sorted(result.response for result in results)
+
+    def worker_runs(self):
+        worker_id = next(id for id, a in self.backend.assistants.items() if a["name"] == "Worker")
+        return sum(run["assistant_id"] == worker_id for run in self.backend.runs.values())
+
+    def test_identical_requests_share_one_run(self):
+        flight = SingleFlight(key=lambda message, message_files, user: message)
+        responses = self.run_parallel(flight, ["status report"] * 4 + ["other report"])
+
+        self.assertEqual(responses, ["echo: other report"] + ["echo: status report"] * 4)
+        self.assertEqual(self.worker_runs(), 2)
+        self.assertEqual(flight.stats()["coalesced"], 3)
+
+    def test_default_key_keeps_users_apart(self):
+        flight = SingleFlight()
+        self.run_parallel(flight, ["status report"] * 3)
+
+        self.assertEqual(self.worker_runs(), 3)
+        self.assertEqual(flight.stats()["coalesced"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent, AgencyEventHandler
+
+
+def responder(assistant, messages):
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    last = messages[-1]
+    if "You are the CEO" in system:
+        if last["role"] == "user":
+            return {"tool_calls": [{"name": "SendMessage",
+                                    "arguments": {"chain_of_thought": "delegate", "recipient": "Worker",
+                                                  "message": last["content"]}}]}
+        return {"content": f"CEO got: {last['content']}"}
+    return default_responder(assistant, messages)
+
+
+class RecordingHandler(AgencyEventHandler):
+    def on_text_delta(self, delta, snapshot):
+        texts = self.context.state.setdefault("texts", {})
+        key = (self.agent_name, self.recipient_agent_name)
+        texts[key] = texts.get(key, "") + delta.value
+
+
+class StreamIsolationTest(unittest.TestCase):
+    streams = 50
+
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder, latency=0.01)
+
+    def run_streams(self, engine):
+        ceo = Agent(name="CEO", description="ceo", instructions="You are the CEO.")
+        worker = Agent(name="Worker", description="worker", instructions="You are the worker.")
+        agency = Agency([ceo, [ceo, worker]], engine=engine)
+        handlers, responses, errors = {}, {}, []
+
+        def stream(i):
+            handlers[i] = RecordingHandler.for_request()
+            try:
+                responses[i] = agency.get_completion_stream(f"task {i}", handlers[i], message_files=None,
+                                                            session=agency.create_entrance_session())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=stream, args=(i,)) for i in range(self.streams)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for i in range(self.streams):
+            self.assertEqual(responses[i], f"CEO got: echo: task {i}")
+            self.assertEqual(handlers[i].context.state["texts"], {("CEO", "Worker"): f"echo: task {i}",
+                                                                  ("User", "CEO"): f"CEO got: echo: task {i}"})
+        # the handler class passed by the caller is never modified
+        self.assertIsNone(RecordingHandler.agent_name)
+        self.assertIsNone(RecordingHandler.context)
+
+    def test_assistants_streams(self):
+        self.run_streams("assistants")
+
+    def test_chat_completions_streams(self):
+        self.run_streams("chat_completions")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, stand_in_agent, use_stand_in_backend
+
+from agency_swarm.sessions import Session
+from agency_swarm.threads import ThreadLockManager, ThreadStatus, set_thread_lock_manager
+from agency_swarm.user import User
+
+
+def fake_thread(thread_id="thread_1"):
+    return SimpleNamespace(thread_id=thread_id, status=ThreadStatus.Ready, lease=None)
+
+
+def complete(session, message):
+    gen = session.get_completion(message)
+    try:
+        while True:
+            next(gen)
+    except StopIteration as e:
+        return e.value
+
+
+class ThreadLockManagerTest(unittest.TestCase):
+    def test_contention(self):
+        manager = ThreadLockManager()
+        thread = fake_thread()
+        lease = manager.acquire(thread)
+
+        self.assertIsNotNone(lease)
+        self.assertIs(thread.status, ThreadStatus.Running)
+        self.assertIsNone(manager.acquire(thread))
+
+        lease.release()
+        self.assertIs(thread.status, ThreadStatus.Ready)
+        self.assertIsNotNone(manager.acquire(thread))
+        self.assertEqual(manager.stats()["contended"], 1)
+
+    def test_expired_lease_is_reclaimed(self):
+        manager = ThreadLockManager(lease_ttl=0.05)
+        thread = fake_thread()
+        old = manager.acquire(thread)
+        time.sleep(0.1)
+
+        new = manager.acquire(thread)
+        self.assertIsNotNone(new)
+        self.assertTrue(new.stale)
+        self.assertEqual(manager.stats()["reclaimed"], 1)
+
+        # the late release of the old owner does not unlock the new one
+        old.release()
+        self.assertIs(thread.lease, new)
+        self.assertIs(thread.status, ThreadStatus.Running)
+
+    def test_heartbeat_renews_lease_and_parent(self):
+        manager = ThreadLockManager(lease_ttl=0.2)
+        parent_thread, child_thread = fake_thread("parent"), fake_thread("child")
+        parent = manager.acquire(parent_thread)
+        child = manager.acquire(child_thread, parent=parent)
+        for _ in range(4):
+            time.sleep(0.1)
+            child.heartbeat()
+
+        self.assertIsNone(manager.acquire(parent_thread))
+        self.assertIsNone(manager.acquire(child_thread))
+
+    def test_dead_owner_is_reclaimed(self):
+        manager = ThreadLockManager()
+        thread = fake_thread()
+        owner = threading.Thread(target=manager.acquire, args=(thread,))
+        owner.start()
+        owner.join()
+
+        lease = manager.acquire(thread)
+        self.assertIsNotNone(lease)
+        self.assertTrue(lease.stale)
+        self.assertEqual(manager.stats()["reclaimed"], 1)
+
+    def test_waiters_are_served_in_order(self):
+        manager = ThreadLockManager()
+        thread = fake_thread()
+        lease = manager.acquire(thread)
+        order = []
+
+        def wait(name):
+            waiter_lease = manager.acquire(thread, timeout=5)
+            order.append(name)
+            waiter_lease.release()
+
+        waiters = []
+        for name in ("first", "second", "third"):
+            waiters.append(threading.Thread(target=wait, args=(name,)))
+            waiters[-1].start()
+            time.sleep(0.05)
+        lease.release()
+        for waiter in waiters:
+            waiter.join()
+
+        self.assertEqual(order, ["first", "second", "third"])
+        self.assertEqual(manager.stats()["handed_over"], 3)
+
+    def test_wait_times_out(self):
+        manager = ThreadLockManager()
+        thread = fake_thread()
+        manager.acquire(thread)
+
+        started = time.monotonic()
+        self.assertIsNone(manager.acquire(thread, timeout=0.2))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(manager.stats()["wait_timeouts"], 1)
+
+    def test_never_waits_for_own_chain(self):
+        manager = ThreadLockManager()
+        thread = fake_thread()
+        lease = manager.acquire(thread)
+        child = manager.acquire(fake_thread("child"), parent=lease)
+
+        started = time.monotonic()
+        self.assertIsNone(manager.acquire(thread, parent=child, timeout=5))
+        self.assertLess(time.monotonic() - started, 1)
+
+
+class SessionThreadLockTest(unittest.TestCase):
+    def setUp(self):
+        self.user = User()  # threads are routed per user
+        self.crash = False
+
+        def responder(assistant, messages):
+            system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+            if '"session_id"' in system:
+                return {"content": json.dumps({"session_id": 1, "reason": "same task"})}
+            if self.crash:
+                raise RuntimeError("backend crashed")
+            return default_responder(assistant, messages)
+
+        self.backend = use_stand_in_backend(self, responder=responder, latency=0.2)
+        self.manager = ThreadLockManager()
+        set_thread_lock_manager(self.manager)
+        self.agent = stand_in_agent(self.backend, "Worker")
+        complete(Session(self.user, self.agent), "first")
+
+    def tearDown(self):
+        set_thread_lock_manager(None)
+
+    def concurrent(self, *messages):
+        results, errors = [], []
+
+        def request(message):
+            try:
+                results.append(complete(Session(self.user, self.agent), message))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=request, args=(message,)) for message in messages]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_failed_request_does_not_leak_the_thread(self):
+        session = Session(self.user, self.agent)
+        self.assertEqual(len(self.agent.threads), 1)
+        thread = self.agent.threads[0]
+
+        self.crash = True
+        with self.assertRaises(Exception):
+            complete(session, "second")
+        self.assertIs(thread.status, ThreadStatus.Ready)
+
+        self.crash = False
+        created = self.backend.count("threads.create")
+        self.assertEqual(complete(session, "third"), "echo: third")
+
+        # the thread is reused (after checking for leftover runs) instead of being copied
+        self.assertEqual(self.backend.count("threads.create"), created)
+        self.assertEqual(self.backend.count("runs.list"), 1)
+        self.assertEqual(self.manager.stats()["active"], 0)
+
+    def test_fork_policy(self):
+        results, errors = self.concurrent("a", "b")
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.manager.stats()["forks"], 1)
+        self.assertEqual(len(self.agent.threads), 2)
+
+    def test_wait_policy(self):
+        self.agent.busy_thread_policy = "wait"
+        results, errors = self.concurrent("a", "b", "c")
+        self.assertEqual(sorted(results), ["echo: a", "echo: b", "echo: c"])
+        stats = self.manager.stats()
+        self.assertEqual(stats["forks"], 0)
+        self.assertEqual(stats["queued"], 2)
+        self.assertEqual(len(self.agent.threads), 1)
+
+    def test_reject_policy(self):
+        self.agent.busy_thread_policy = "reject"
+        results, errors = self.concurrent("a", "b")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(errors), 1)
+        self.assertIn("busy", str(errors[0]))
+        self.assertEqual(self.manager.stats()["rejected"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
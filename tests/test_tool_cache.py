@@ -0,0 +1,183 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from pydantic import Field
+
+from agency_swarm import Agency, Agent, BaseTool
+from agency_swarm.tools import ToolFactory
+from agency_swarm.tools.coding import ReadFile
+from agency_swarm.util import ToolResultCache, get_tool_cache, set_tool_cache
+
+SCHEMAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "schemas")
+
+calls = []
+
+
+class Lookup(BaseTool):
+    """Looks a key up."""
+    cacheable = True
+    cache_ttl = 60.0
+    cache_key_fields = ["key"]
+
+    key: str = Field(..., description="Key to look up.")
+    reason: str = Field("", description="Why the key is needed.")
+
+    def run(self, caller_thread=None):
+        calls.append(("Lookup", self.key))
+        return f"value of {self.key} #{len(calls)}"
+
+
+class Store(BaseTool):
+    """Stores a key."""
+    invalidates = ["Lookup"]
+
+    key: str = Field(..., description="Key to store.")
+
+    def run(self, caller_thread=None):
+        calls.append(("Store", self.key))
+        return f"stored {self.key}"
+
+
+class Fragile(BaseTool):
+    """Fails on its first call."""
+    cacheable = True
+
+    def run(self, caller_thread=None):
+        calls.append(("Fragile", None))
+        if len(calls) == 1:
+            raise ValueError("not yet")
+        return "fine"
+
+
+def responder(assistant, messages):
+    if "You are the CEO" not in messages[0]["content"]:
+        return default_responder(assistant, messages)
+    last = messages[-1]
+    if last["role"] == "user":
+        name, _, key = last["content"].partition(" ")
+        arguments = {"key": key} if key else {}
+        if name == "Lookup":
+            arguments["reason"] = f"asked at {len(calls)}"
+        return {"tool_calls": [{"name": name, "arguments": arguments}]}
+    return {"content": last["content"]}
+
+
+class ToolResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_lru_eviction(self):
+        cache = ToolResultCache(max_entries=2)
+        for key in "abc":
+            cache.put(Lookup(key=key), key)
+        cache.get(Lookup(key="b"))
+        cache.put(Lookup(key="d"), "d")
+
+        self.assertEqual(cache.get(Lookup(key="a")), (False, None))
+        self.assertEqual(cache.get(Lookup(key="b")), (True, "b"))
+        self.assertEqual(cache.get(Lookup(key="c")), (False, None))
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_ttl(self):
+        cache = ToolResultCache()
+        Lookup.cache_ttl = 0.05
+        try:
+            cache.put(Lookup(key="a"), "a")
+            self.assertEqual(cache.get(Lookup(key="a")), (True, "a"))
+            time.sleep(0.06)
+            self.assertEqual(cache.get(Lookup(key="a")), (False, None))
+        finally:
+            Lookup.cache_ttl = 60.0
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_key_fields(self):
+        cache = ToolResultCache()
+        cache.put(Lookup(key="a", reason="first"), "a")
+        self.assertEqual(cache.get(Lookup(key="a", reason="second")), (True, "a"))
+
+    def test_invalidate_by_arguments(self):
+        cache = ToolResultCache()
+        cache.put(Lookup(key="a"), "a")
+        cache.put(Lookup(key="b"), "b")
+
+        self.assertEqual(cache.invalidate("Lookup", key="a"), 1)
+        self.assertEqual(cache.get(Lookup(key="a")), (False, None))
+        self.assertEqual(cache.get(Lookup(key="b")), (True, "b"))
+        self.assertEqual(cache.invalidate(), 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        cache = ToolResultCache(max_entries=0)
+        cache.put(Lookup(key="a"), "a")
+        self.assertEqual(cache.get(Lookup(key="a")), (False, None))
+
+    def test_openapi_tools_built_with_other_headers_do_not_share_results(self):
+        cache = ToolResultCache()
+        with open(os.path.join(SCHEMAS, "get-weather.json")) as f:
+            schema = f.read()
+        first = ToolFactory.from_openapi_schema(schema, headers={"Authorization": "Bearer a"}, cache_ttl=60)[0]
+        second = ToolFactory.from_openapi_schema(schema, headers={"Authorization": "Bearer b"}, cache_ttl=60)[0]
+        arguments = {"parameters": {"location": "Paris"}}
+        cache.put(first(**arguments), "weather for a")
+
+        self.assertEqual(cache.get(first(**arguments)), (True, "weather for a"))
+        self.assertEqual(cache.get(second(**arguments)), (False, None))
+
+    def test_read_file_results_follow_the_file(self):
+        cache = ToolResultCache()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "notes.txt")
+        with open(path, "w") as f:
+            f.write("first")
+        cache.put(ReadFile(file_path=path), ReadFile(file_path=path).run())
+
+        with open(path, "w") as f:
+            f.write("second version")  # changed outside of the coding tools
+        self.assertEqual(cache.get(ReadFile(file_path=path)), (False, None))
+
+
+class SessionToolCacheTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        calls.clear()
+        self.backend = use_stand_in_backend(self, responder=responder)
+        set_tool_cache(ToolResultCache())
+        ceo = Agent(name="CEO", description="ceo", instructions="You are the CEO.", tools=[Lookup, Store, Fragile])
+        self.agency = Agency([ceo])
+
+    def ask(self, message):
+        return self.agency.get_completion(message, yield_messages=False, session=self.agency.create_entrance_session())
+
+    def test_results_are_shared_across_threads(self):
+        self.assertEqual(self.ask("Lookup a"), "value of a #1")
+        self.assertEqual(self.ask("Lookup a"), "value of a #1")
+        self.assertEqual(self.ask("Lookup b"), "value of b #2")
+
+        self.assertEqual(calls, [("Lookup", "a"), ("Lookup", "b")])
+        stats = get_tool_cache().stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertEqual(stats["tools"], {"Lookup": {"hits": 1, "misses": 2}})
+
+    def test_side_effects_invalidate(self):
+        self.ask("Lookup a")
+        self.assertEqual(self.ask("Store a"), "stored a")
+        self.assertEqual(self.ask("Lookup a"), "value of a #3")
+        self.assertEqual(get_tool_cache().stats()["invalidations"], 1)
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.ask("Fragile"), "Error: not yet")
+        self.assertEqual(self.ask("Fragile"), "fine")
+        self.assertEqual(self.ask("Fragile"), "fine")
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import ClassVar
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from pydantic import Field
+
+from agency_swarm import Agency, Agent, BaseTool
+from agency_swarm.tools.coding import ChangeDir, ChangeLines, CreateFolder, WriteFiles
+from agency_swarm.tools.coding.WriteFiles import File
+from agency_swarm.util import CancellationToken, Deadline, RequestCancelled, ToolExecutor, set_tool_executor
+
+
+class Crunch(BaseTool):
+    """Sums the squares of the numbers below n."""
+    execution = "process"
+
+    n: int = Field(..., description="Upper bound.")
+
+    def run(self, caller_thread=None):
+        return f"{sum(i * i for i in range(self.n))} in {os.getpid()}"
+
+
+class Crash(BaseTool):
+    """Kills its process."""
+    execution = "process"
+
+    def run(self):
+        os._exit(1)
+
+
+class Hang(BaseTool):
+    """Never returns in time."""
+    execution = "process"
+    execution_timeout = 0.5
+
+    def run(self, caller_thread=None):
+        time.sleep(30)
+
+
+class Threaded(BaseTool):
+    """Runs on the tool thread pool."""
+    execution = "thread"
+
+    seconds: float = Field(0.0, description="Seconds to sleep.")
+
+    def run(self, caller_thread=None):
+        time.sleep(self.seconds)
+        return threading.current_thread().name
+
+
+class NoCaller(BaseTool):
+    """A tool whose run() takes no caller thread."""
+
+    def run(self):
+        return self.execution
+
+
+class ThreadedNoCaller(NoCaller):
+    execution = "thread"
+
+
+class ProcessNoCaller(NoCaller):
+    execution = "process"
+
+
+class AsyncNoCaller(BaseTool):
+    """An async tool whose run() takes no caller thread."""
+
+    async def run(self):
+        return "async"
+
+
+class Occupancy:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+    def __exit__(self, *args):
+        with self.lock:
+            self.running -= 1
+
+
+class Browse(BaseTool):
+    """Uses the shared browser."""
+    concurrency_group = "browser"
+    max_concurrency = 1
+    occupancy: ClassVar[Occupancy] = None
+
+    def run(self, caller_thread=None):
+        with self.occupancy:
+            time.sleep(0.05)
+
+
+class Fetch(BaseTool):
+    """Uses one of three connections."""
+    max_concurrency = 3
+    occupancy: ClassVar[Occupancy] = None
+
+    def run(self, caller_thread=None):
+        with self.occupancy:
+            time.sleep(0.05)
+
+
+class Edit(BaseTool):
+    """Edits a file."""
+    execution = "thread"
+    resource_key_fields = ["path"]
+    occupancy: ClassVar[dict] = {}
+
+    path: str = Field(..., description="File to edit.")
+    seconds: float = Field(0.05, description="Seconds to edit.")
+
+    def run(self, caller_thread=None):
+        with self.occupancy[self.path]:
+            time.sleep(self.seconds)
+
+
+def responder(assistant, messages):
+    if "You are the CEO" not in messages[0]["content"]:
+        return default_responder(assistant, messages)
+    last = messages[-1]
+    if last["role"] == "user":
+        return {"tool_calls": [{"name": "Crunch", "arguments": {"n": int(last["content"])}}]}
+    return {"content": last["content"]}
+
+
+class ToolExecutorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ToolExecutor(max_processes=2)
+        cls.executor.warm_up()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def test_process_tools_run_in_workers(self):
+        output = self.executor.run(Crunch(n=1000))
+        total, _, pid = output.partition(" in ")
+        self.assertEqual(int(total), sum(i * i for i in range(1000)))
+        self.assertNotEqual(int(pid), os.getpid())
+        self.assertGreaterEqual(self.executor.stats()["process"]["completed"], 1)
+
+    def test_crashed_worker_is_replaced(self):
+        restarts = self.executor.restarts
+        with self.assertRaisesRegex(Exception, "crashed"):
+            self.executor.run(Crash())
+        self.assertEqual(self.executor.restarts, restarts + 1)
+        self.assertIn(" in ", self.executor.run(Crunch(n=10)))
+        self.assertGreaterEqual(self.executor.stats()["process"]["crashes"], 1)
+
+    def test_timeout_terminates_the_worker(self):
+        started = time.monotonic()
+        with self.assertRaisesRegex(Exception, "timed out"):
+            self.executor.run(Hang())
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertIn(" in ", self.executor.run(Crunch(n=10)))
+        self.assertGreaterEqual(self.executor.stats()["process"]["timeouts"], 1)
+
+    def test_thread_tools(self):
+        self.assertTrue(self.executor.run(Threaded()).startswith("tool_thread"))
+
+    def test_waiting_call_can_be_cancelled(self):
+        tool = Threaded(seconds=1)
+        tool.cancel_token = CancellationToken()
+        threading.Timer(0.1, tool.cancel_token.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            self.executor.run(tool)
+        self.assertGreaterEqual(self.executor.stats()["thread"]["cancelled"], 1)
+
+
+class ConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = ToolExecutor()
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def run_parallel(self, tools):
+        with ThreadPoolExecutor(len(tools)) as pool:
+            list(pool.map(self.executor.run, tools))
+
+    def test_run_without_a_caller_thread(self):
+        for tool in (NoCaller(), ThreadedNoCaller(), ProcessNoCaller()):
+            self.assertEqual(self.executor.run(tool, caller_thread=object()), tool.execution)
+        self.assertEqual(self.executor.run(AsyncNoCaller(), caller_thread=object()), "async")
+
+    def test_shutdown_cancels_the_calls_that_have_not_started(self):
+        executor = ToolExecutor(max_threads=1)
+        running = executor._hold(lambda: None, executor._thread_pool().submit, time.sleep, 0.1)
+        queued = executor._track(executor._threads, executor._hold(lambda: None, executor._threads.submit, int))
+        executor.shutdown()
+        self.assertTrue(queued.cancelled())
+        running.result()
+        self.assertEqual(executor._submitted, {})
+
+    def test_exclusive_group(self):
+        Browse.occupancy = Occupancy()
+        self.run_parallel([Browse() for _ in range(5)])
+        self.assertEqual(Browse.occupancy.peak, 1)
+        self.assertEqual(self.executor.stats()["concurrency"]["browser"]["calls"], 5)
+        self.assertGreaterEqual(self.executor.stats()["concurrency"]["browser"]["waited"], 1)
+
+    def test_shared_limit(self):
+        Fetch.occupancy = Occupancy()
+        self.run_parallel([Fetch() for _ in range(9)])
+        self.assertEqual(Fetch.occupancy.peak, 3)
+
+    def test_executor_limit_overrides_the_tool(self):
+        self.executor.concurrency_limits["Fetch"] = 1
+        Fetch.occupancy = Occupancy()
+        self.run_parallel([Fetch() for _ in range(3)])
+        self.assertEqual(Fetch.occupancy.peak, 1)
+
+    def test_calls_on_the_same_resource_are_serialized(self):
+        Edit.occupancy = {"a": Occupancy(), "b": Occupancy()}
+        started = time.monotonic()
+        self.run_parallel([Edit(path="a") for _ in range(3)] + [Edit(path="b") for _ in range(3)])
+        self.assertEqual([Edit.occupancy[path].peak for path in "ab"], [1, 1])
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.executor._resources, {})
+
+    def test_coding_tools_lock_the_paths_they_write(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "a.py")
+        with open(path, "w") as f:
+            f.write("a = 1\n")
+        write = WriteFiles(chain_of_thought="", files=[File(file_name=path, body="a = 2\n"),
+                                                        File(file_name=os.path.join(tmp, "b.py"), body="")])
+        change = ChangeLines(file_path=path, changes=[{"line_number": 1, "new_line": "a = 3\n"}])
+        create = CreateFolder(folder_path=os.path.join(tmp, "c"))
+
+        self.assertEqual(write.resource_keys(), [path, os.path.join(tmp, "b.py")])
+        self.assertEqual(change.resource_keys(), [path])
+        self.assertEqual(create.resource_keys(), [os.path.join(tmp, "c")])
+        for tool in (write, change, create):
+            self.assertIsNone(tool.max_concurrency)  # writes of different paths run in parallel
+        self.assertEqual((ChangeDir.concurrency_group, ChangeDir.max_concurrency), ("workspace", 1))
+
+    def test_waiting_for_a_slot_can_be_cancelled(self):
+        Edit.occupancy = {"a": Occupancy()}
+        holder = ThreadPoolExecutor(1).submit(self.executor.run, Edit(path="a", seconds=0.5))
+        time.sleep(0.1)
+        tool = Edit(path="a")
+        tool.cancel_token = CancellationToken()
+        threading.Timer(0.1, tool.cancel_token.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            self.executor.run(tool)
+        tool = Edit(path="a")
+        tool.deadline = Deadline(0.1)
+        with self.assertRaisesRegex(Exception, "timed out waiting for a"):
+            self.executor.run(tool)
+        holder.result()
+
+    def test_slot_is_held_until_an_abandoned_call_finishes(self):
+        Edit.occupancy = {"a": Occupancy()}
+        tool = Edit(path="a", seconds=0.5)
+        tool.cancel_token = CancellationToken()
+        threading.Timer(0.1, tool.cancel_token.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            self.executor.run(tool)
+        self.executor.run(Edit(path="a"))
+        self.assertEqual(Edit.occupancy["a"].peak, 1)
+
+
+class SessionToolExecutorTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+        self.executor = ToolExecutor(max_processes=1)
+        set_tool_executor(self.executor)
+        self.agency = Agency([Agent(name="CEO", description="ceo", instructions="You are the CEO.",
+                                    tools=[Crunch])])
+
+    def tearDown(self):
+        set_tool_executor(None)
+        self.executor.shutdown()
+
+    def test_process_tool_output_is_submitted(self):
+        response = self.agency.get_completion("100", yield_messages=False)
+        self.assertTrue(response.startswith(f"{sum(i * i for i in range(100))} in "))
+        self.assertEqual(self.executor.stats()["process"]["completed"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent, BaseTool
+from agency_swarm.tools import ReadToolOutput
+from agency_swarm.util import ToolOutputPolicy, ToolOutputStore, get_tool_output_store, set_tool_output_store
+
+BIG = "".join(f"line {i:05d}\n" for i in range(3000))  # 33000 characters
+
+
+class Big(BaseTool):
+    """Returns a big output."""
+
+    def run(self, caller_thread=None):
+        return BIG
+
+
+class Small(BaseTool):
+    """Returns a small output."""
+
+    def run(self, caller_thread=None):
+        return "small"
+
+
+class Truncated(BaseTool):
+    """Returns a big output that is only truncated."""
+    output_policy = ToolOutputPolicy(max_chars=100, spill=False)
+
+    def run(self, caller_thread=None):
+        return BIG
+
+
+def responder(assistant, messages):
+    if "You are the CEO" not in messages[0]["content"]:
+        return default_responder(assistant, messages)
+    last = messages[-1]
+    if last["role"] == "user":
+        return {"tool_calls": [{"name": last["content"]}]}
+    handle = re.search(r'handle="(out_\w+)", offset=(\d+)', last["content"])
+    if handle and len([m for m in messages if m["role"] == "tool"]) == 1:
+        return {"tool_calls": [{"name": "ReadToolOutput",
+                                "arguments": {"handle": handle.group(1), "offset": int(handle.group(2)),
+                                              "limit": 24}}]}
+    return {"content": last["content"]}
+
+
+class ToolOutputPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.store = ToolOutputStore(max_outputs=2)
+
+    def tearDown(self):
+        self.store.clear()
+
+    def test_short_outputs_are_kept(self):
+        self.assertEqual(ToolOutputPolicy(max_chars=100).apply("Small", "small", self.store), "small")
+        self.assertEqual(len(self.store), 0)
+
+    def test_head_and_tail_are_kept(self):
+        output = ToolOutputPolicy(max_chars=100, head_ratio=0.5, spill=False).apply("Big", BIG, self.store)
+        self.assertTrue(output.startswith(BIG[:50] + "\n[... 32900 characters omitted ...]\n"))
+        self.assertTrue(output.endswith(BIG[-50:]))
+        self.assertEqual(len(self.store), 0)
+
+    def test_spilled_output_can_be_paged(self):
+        output = ToolOutputPolicy(max_chars=100).apply("Big", BIG, self.store)
+        handle = re.search(r'handle="(out_\w+)"', output).group(1)
+
+        self.assertEqual(self.store.read(handle, 70, 11), BIG[70:81])
+        self.assertEqual(self.store.size(handle), len(BIG))
+        self.assertEqual(self.store.stats()["Big"]["spilled"], 1)
+
+    def test_oldest_outputs_are_dropped(self):
+        handles = [self.store.put("Big", str(i)) for i in range(3)]
+        with self.assertRaises(Exception):
+            self.store.read(handles[0])
+        self.assertEqual(self.store.read(handles[2]), "2")
+        self.assertEqual(len(os.listdir(self.store.directory)), 2)
+
+
+class SessionToolOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+        set_tool_output_store(ToolOutputStore(directory=os.path.join(self.tmp, "outputs")))
+        self.ceo = Agent(name="CEO", description="ceo", instructions="You are the CEO.",
+                         tools=[Big, Small, Truncated], tool_output_policy=ToolOutputPolicy(max_chars=1000))
+        self.agency = Agency([self.ceo])
+
+    def test_read_tool_output_is_added(self):
+        self.assertIn(ReadToolOutput, self.ceo.tools)
+        self.assertNotIn(ReadToolOutput, Agent(name="Plain", tools=[Big]).tools)
+
+    def test_big_output_is_spilled_and_paged(self):
+        response = self.agency.get_completion("Big", yield_messages=False)
+
+        self.assertEqual(response, BIG[700:724] + "\n[characters 700-724 of 33000, continue with offset=724]")
+        run, = self.backend.runs.values()
+        submitted = [output["content"] for output in run["_tool_outputs"]]
+        self.assertLess(len(submitted[0]), 1200)
+        stats = get_tool_output_store().stats()
+        self.assertEqual(stats["Big"], {"calls": 1, "chars": 33000, "max_chars": 33000,
+                                        "submitted_chars": len(submitted[0]), "truncated": 1, "spilled": 1})
+        self.assertEqual(stats["ReadToolOutput"]["truncated"], 0)
+
+    def test_tool_policy_overrides_the_agent_policy(self):
+        response = self.agency.get_completion("Truncated", yield_messages=False)
+        self.assertIn("characters omitted ...]", response)
+        self.assertLess(len(response), 200)
+
+    def test_small_outputs_are_recorded(self):
+        self.assertEqual(self.agency.get_completion("Small", yield_messages=False), "small")
+        self.assertEqual(get_tool_output_store().stats()["Small"]["truncated"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import gc
+import itertools
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import ClassVar
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_in_backend import default_responder, use_stand_in_backend, use_temp_dir
+
+from agency_swarm import Agency, Agent, BaseTool
+from agency_swarm.util import CancellationToken, RequestCancelled, ToolExecutor, ToolResource, ToolResources, \
+    get_tool_resources, set_tool_resources
+
+events = []
+
+
+class Connection:
+    ids = itertools.count()
+
+    def __init__(self):
+        self.id = next(self.ids)
+        self.open = True
+        self.busy = False
+
+    def close(self):
+        self.open = False
+        events.append(f"close {self.id}")
+
+
+connections = ToolResource(Connection, close=Connection.close, pool_size=2, check=lambda c: c.open)
+
+
+class Query(BaseTool):
+    """Runs a query on a pooled connection."""
+    execution = "thread"
+    db: ClassVar[ToolResource[Connection]] = connections
+
+    def run(self, caller_thread=None):
+        if self.db.busy:
+            raise Exception("The connection is used by two calls.")
+        self.db.busy = True
+        time.sleep(0.05)
+        self.db.busy = False
+        return self.db.id
+
+    @classmethod
+    def startup(cls):
+        events.append("startup")
+
+    @classmethod
+    def shutdown(cls):
+        events.append("shutdown")
+
+
+class Report(BaseTool):
+    """Shares the connections of Query and one HTTP session."""
+    db: ClassVar[ToolResource[Connection]] = connections
+    session: ClassVar[ToolResource[Connection]] = ToolResource(Connection, close=Connection.close)
+
+    def run(self, caller_thread=None):
+        return f"db {self.db.id} session {self.session.id}"
+
+
+def responder(assistant, messages):
+    if "You are the CEO" not in messages[0]["content"]:
+        return default_responder(assistant, messages)
+    last = messages[-1]
+    if last["role"] == "user":
+        return {"tool_calls": [{"name": "Report"}]}
+    return {"content": last["content"]}
+
+
+class ToolResourcesTest(unittest.TestCase):
+    def setUp(self):
+        events.clear()
+        self.resources = ToolResources()
+        set_tool_resources(self.resources)
+        self.executor = ToolExecutor()
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.resources.close()
+        set_tool_resources(None)
+
+    def test_resources_are_reused(self):
+        ids = {self.executor.run(Query()) for _ in range(5)}
+        self.assertEqual(len(ids), 1)
+        self.assertEqual(self.resources.stats()["db"], {"created": 1, "in_use": 0, "idle": 1, "borrowed": 5,
+                                                        "waited": 0})
+        self.assertEqual(events, ["startup"])
+
+    def test_pool_lends_each_instance_to_one_call(self):
+        with ThreadPoolExecutor(6) as pool:
+            ids = set(pool.map(lambda _: self.executor.run(Query()), range(6)))
+        self.assertLessEqual(len(ids), 2)
+        stats = self.resources.stats()["db"]
+        self.assertLessEqual(stats["created"], 2)
+        self.assertGreaterEqual(stats["waited"], 1)
+        self.assertEqual(events, ["startup"])
+
+    def test_shared_resource(self):
+        with ThreadPoolExecutor(4) as pool:
+            outputs = list(pool.map(lambda _: self.executor.run(Report()), range(4)))
+        self.assertEqual(len({output.split(" session ")[1] for output in outputs}), 1)
+        self.assertEqual(self.resources.stats()["session"]["created"], 1)
+
+    def test_stale_instances_are_replaced(self):
+        first = self.executor.run(Query())
+        tool = Query()
+        release = self.resources.acquire(tool)
+        tool.db.open = False
+        release()
+        self.assertNotEqual(self.executor.run(Query()), first)
+
+    def test_waiting_for_a_resource_can_be_cancelled(self):
+        held = [Query(), Query()]
+        releases = [self.resources.acquire(tool) for tool in held]
+        tool = Query()
+        tool.cancel_token = CancellationToken()
+        threading.Timer(0.1, tool.cancel_token.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            self.executor.run(tool)
+        for release in releases:
+            release()
+
+    def test_close_runs_the_shutdown_hooks(self):
+        connection = self.executor.run(Query())
+        self.resources.close()
+        self.assertEqual(events, ["startup", "shutdown", f"close {connection}"])
+
+    def test_direct_run_gives_the_instance_back(self):
+        tool = Report()
+        self.assertTrue(tool.run().startswith("db "))
+        self.assertEqual(get_tool_resources().stats()["db"]["in_use"], 1)
+        del tool
+        gc.collect()
+        self.assertEqual(get_tool_resources().stats()["db"]["in_use"], 0)
+
+
+class SessionToolResourcesTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_dir(self)
+        self.backend = use_stand_in_backend(self, responder=responder)
+        self.resources = ToolResources()
+        set_tool_resources(self.resources)
+        self.agency = Agency([Agent(name="CEO", description="ceo", instructions="You are the CEO.",
+                                    tools=[Report])])
+
+    def tearDown(self):
+        self.resources.close()
+        set_tool_resources(None)
+
+    def test_resources_outlive_the_calls(self):
+        first = self.agency.get_completion("report", yield_messages=False)
+        second = self.agency.get_completion("report", yield_messages=False)
+        self.assertEqual(first, second)
+        self.assertEqual(self.resources.stats()["session"], {"created": 1, "in_use": 0, "idle": 0, "borrowed": 2,
+                                                             "waited": 0})
+
+
+if __name__ == '__main__':
+    unittest.main()